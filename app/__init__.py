@@ -1,6 +1,5 @@
 from flask import Flask
 from flask_login import LoginManager
-import boto3
 from config import Config
 import os
 
@@ -12,13 +11,20 @@ _moto_started = False
 
 @login_manager.user_loader
 def load_user(user_id):
-    from .models import User
-    return User.get(user_id)
+    from flask import current_app
+    return current_app.session_principals.load_user(user_id)
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Behind a load balancer request.remote_addr is the balancer's address;
+    # take the client's from the X-Forwarded-* headers the trusted hops add
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
     # Determine if we should use moto for local development
     use_moto = (os.getenv('FLASK_ENV') == 'development' and
                 not os.getenv('USE_REAL_AWS', 'false').lower() == 'true')
@@ -31,6 +37,8 @@ def create_app():
             from moto import mock_dynamodb
             mock = mock_dynamodb()
             mock.start()
+            from .moto_compat import enable_scan_segments
+            enable_scan_segments()
             _moto_started = True
         aws_access_key_id = 'testing'
         aws_secret_access_key = 'testing'
@@ -44,53 +52,80 @@ def create_app():
         'aws_access_key_id': aws_access_key_id,
         'aws_secret_access_key': aws_secret_access_key
     }
-    app.dynamodb = boto3.resource('dynamodb', **dynamodb_kwargs)
-
-    # Create tables if they don't exist
-    try:
-        app.dynamodb.create_table(
-            TableName=app.config['DYNAMODB_TABLE_USERS'],
-            KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}],
-            BillingMode='PAY_PER_REQUEST'
-        )
-    except:
-        pass
-
-    try:
-        app.dynamodb.create_table(
-            TableName=app.config['DYNAMODB_TABLE_ACCOUNTS'],
-            KeySchema=[{'AttributeName': 'account_id', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'account_id', 'AttributeType': 'S'}],
-            BillingMode='PAY_PER_REQUEST'
-        )
-    except:
-        pass
-
-    try:
-        app.dynamodb.create_table(
-            TableName=app.config['DYNAMODB_TABLE_TRANSACTIONS'],
-            KeySchema=[{'AttributeName': 'transaction_id', 'KeyType': 'HASH'}],
-            AttributeDefinitions=[{'AttributeName': 'transaction_id', 'AttributeType': 'S'}],
-            BillingMode='PAY_PER_REQUEST'
-        )
-    except:
-        pass
+    from .dynamo import DynamoDB, client_config
+    app.dynamo = DynamoDB(dynamodb_kwargs, client_config(app.config),
+                          endpoint_url=None if use_moto else app.config['DYNAMODB_ENDPOINT_URL'])
+    app.dynamodb = app.dynamo.resource
+
+    # Tables are provisioned by 'flask bootstrap', not by every booting worker;
+    # moto's in-process tables only exist if this process creates them
+    if use_moto or app.config['DYNAMODB_BOOTSTRAP_ON_START']:
+        from .tables import bootstrap_tables
+        try:
+            bootstrap_tables(app.dynamo, app.config)
+        except Exception as e:
+            app.logger.error(f"Table bootstrap failed: {e}")
+
+    from .cache import ModelCache
+    app.model_cache = ModelCache(app.config)
+
+    # Per-request timing and DynamoDB accounting, served at /metrics
+    app.metrics = None
+    if app.config['METRICS_ENABLED']:
+        from .metrics import RequestMetrics
+        app.metrics = RequestMetrics(app.config)
+        app.metrics.init_app(app)
+
+    from .parallel import ParallelLookups
+    app.parallel_lookups = ParallelLookups(app.config)
+
+    from .fraud import FraudEngine
+    app.fraud_engine = FraudEngine(app.config)
+
+    from .stream import ChangeStreamConsumer
+    app.change_stream = ChangeStreamConsumer(app)
+
+    from .passwords import PasswordHasher
+    app.password_hasher = PasswordHasher(app.config)
+
+    from .local_store import LocalStore
+    app.local_store = LocalStore(app.config['LOCAL_STORE_PATH'])
+    app.login_limiter = None
+    if app.config['LOGIN_RATE_LIMIT_ENABLED']:
+        from .ratelimit import LoginLimiter
+        app.login_limiter = LoginLimiter(app.local_store, app.dynamo, app.config)
+
+    from .sessions import SessionPrincipals
+    app.session_principals = SessionPrincipals(app.local_store, app.config,
+                                               app.permanent_session_lifetime.total_seconds())
 
     login_manager.init_app(app)
 
+    # Amounts reach templates as integer cents: {{ cents|money }} -> 1234.56
+    from .money import format_cents
+    app.add_template_filter(format_cents, 'money')
+
+    # Register maintenance commands (flask --app run migrate ...)
+    from .cli import register_commands
+    register_commands(app)
+
     # Initialize notification service
-    from .notifications import NotificationService
-    app.notification_service = NotificationService(app.config)
+    from .notifications import NotificationService, NotificationQueue
+    app.notification_service = NotificationService(app.config, metrics=app.metrics)
+    app.notification_queue = None
+    if app.config['NOTIFICATION_ASYNC']:
+        app.notification_queue = NotificationQueue(app.notification_service, app.config)
 
     # Register blueprints
     from .routes.auth import auth_bp
     from .routes.transactions import transactions_bp
     from .routes.analytics import analytics_bp
+    from .routes.ingest import ingest_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(transactions_bp)
     app.register_blueprint(analytics_bp)
+    app.register_blueprint(ingest_bp)
 
     # Root route
     @app.route('/')
@@ -0,0 +1,223 @@
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from boto3.dynamodb.conditions import Key
+
+logger = logging.getLogger(__name__)
+
+TOTAL_KEY = 'TOTAL'
+# Marks a transaction whose counters were applied from the change stream
+APPLIED_PREFIX = 'APPLIED#'
+# Day windows AccountSummary.get is called with; cached per window
+SUMMARY_WINDOWS = (0, 30)
+# Every counter is an integer: a count, or a sum of amounts in cents
+COUNTER_FIELDS = ('tx_count', 'volume_cents', 'large_tx_count',
+                  'deposit_count', 'deposit_cents', 'withdraw_count', 'withdraw_cents',
+                  'transfer_in_count', 'transfer_in_cents', 'transfer_out_count', 'transfer_out_cents')
+
+
+def day_key(day):
+    return f"DAY#{day}"
+
+
+def month_key(month):
+    return f"MONTH#{month}"
+
+
+def transaction_legs(transaction):
+    """(account_id, leg) for each account a transaction moves money for"""
+    legs = []
+    if transaction.transaction_type == 'deposit':
+        legs.append((transaction.to_account_id, 'deposit'))
+    elif transaction.transaction_type == 'withdraw':
+        legs.append((transaction.from_account_id, 'withdraw'))
+    elif transaction.transaction_type == 'transfer':
+        legs.append((transaction.from_account_id, 'transfer_out'))
+        legs.append((transaction.to_account_id, 'transfer_in'))
+    return [(account_id, leg) for account_id, leg in legs if account_id]
+
+
+def stat_deltas(transaction, large_threshold_cents):
+    """Counter increments a transaction contributes, keyed by (account_id, stat_key)"""
+    amount_cents = transaction.amount_cents
+    deltas = {}
+    for account_id, leg in transaction_legs(transaction):
+        counters = {'tx_count': 1, f'{leg}_count': 1, f'{leg}_cents': amount_cents}
+        # Volume follows the dashboards: money deposited or transferred
+        if leg != 'withdraw':
+            counters['volume_cents'] = amount_cents
+        if amount_cents > large_threshold_cents:
+            counters['large_tx_count'] = 1
+        for stat_key in (TOTAL_KEY, day_key(transaction.created_at[:10]), month_key(transaction.created_at[:7])):
+            deltas[(account_id, stat_key)] = dict(counters)
+    return deltas
+
+
+def merge_deltas(into, deltas):
+    for key, counters in deltas.items():
+        target = into.setdefault(key, {})
+        for field, value in counters.items():
+            target[field] = target.get(field, 0) + value
+    return into
+
+
+def update_request(table_name, account_id, stat_key, counters):
+    """Keyword arguments of an atomic ADD of counters onto one summary item"""
+    names = {f'#f{i}': field for i, field in enumerate(counters)}
+    values = {f':v{i}': value for i, value in enumerate(counters.values())}
+    return {
+        'TableName': table_name,
+        'Key': {'account_id': account_id, 'stat_key': stat_key},
+        'UpdateExpression': 'ADD ' + ', '.join(f'{name} {value}' for name, value in zip(names, values)),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+def transact_updates(transaction):
+    """TransactWriteItems entries that keep the summaries in step with a new transaction"""
+    table_name = current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS']
+    deltas = stat_deltas(transaction, current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS'])
+    return [{'Update': update_request(table_name, account_id, stat_key, counters)}
+            for (account_id, stat_key), counters in deltas.items()]
+
+
+def apply_once(transaction, expires_at):
+    """Apply a transaction's counter updates unless they were applied before.
+
+    An APPLIED# marker per account is put in the same TransactWriteItems call
+    as the counters, so a redelivered change record is recognised rather than
+    counted twice. Returns False for a duplicate. Markers carry expires_at for
+    DynamoDB TTL and only need to outlive the change log.
+    """
+    table_name = current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS']
+    transact_items = transact_updates(transaction)
+    for account_id, _ in transaction_legs(transaction):
+        transact_items.append({'Put': {
+            'TableName': table_name,
+            'Item': {'account_id': account_id, 'stat_key': f'{APPLIED_PREFIX}{transaction.transaction_id}',
+                     'expires_at': expires_at},
+            'ConditionExpression': 'attribute_not_exists(stat_key)'
+        }})
+
+    client = current_app.dynamo.client
+    try:
+        client.transact_write_items(TransactItems=transact_items)
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        if 'ConditionalCheckFailed' in reasons:
+            return False
+        raise
+    return True
+
+
+def apply_deltas(client, deltas):
+    """Apply aggregated counter deltas with one UpdateItem per summary item"""
+    table_name = current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS']
+    for (account_id, stat_key), counters in deltas.items():
+        client.update_item(**update_request(table_name, account_id, stat_key, counters))
+
+
+class AccountSummary:
+    """Running totals plus recent daily buckets for one account"""
+
+    def __init__(self, account_id, total, days):
+        self.account_id = account_id
+        self.total = total
+        self.days = days
+
+    def __getattr__(self, field):
+        if field in COUNTER_FIELDS:
+            return int(self.total.get(field, 0))
+        raise AttributeError(field)
+
+    def _recent(self, field, days, today=None):
+        today = today or datetime.utcnow().date()
+        keys = {day_key((today - timedelta(days=offset)).isoformat()) for offset in range(days)}
+        return sum(int(item.get(field, 0)) for stat_key, item in self.days.items() if stat_key in keys)
+
+    def volume_since(self, days, today=None):
+        """Volume in cents over the last `days` days"""
+        return self._recent('volume_cents', days, today)
+
+    def count_since(self, days, today=None):
+        return self._recent('tx_count', days, today)
+
+    @property
+    def type_counts(self):
+        return {
+            'deposit': self.deposit_count,
+            'withdraw': self.withdraw_count,
+            'transfer': self.transfer_in_count + self.transfer_out_count
+        }
+
+    @staticmethod
+    def get(account_id, days=30):
+        """Load the TOTAL item and the last `days` daily buckets in one BatchGetItem"""
+        def load_item():
+            table_name = current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS']
+            today = datetime.utcnow().date()
+            keys = [{'account_id': account_id, 'stat_key': TOTAL_KEY}]
+            keys += [{'account_id': account_id, 'stat_key': day_key((today - timedelta(days=offset)).isoformat())}
+                     for offset in range(days)]
+
+            items = []
+            request = {table_name: {'Keys': keys}}
+            while request:
+                response = current_app.dynamo.resource.batch_get_item(RequestItems=request)
+                items.extend(response['Responses'].get(table_name, []))
+                request = response.get('UnprocessedKeys')
+
+            return {
+                'total': next((item for item in items if item['stat_key'] == TOTAL_KEY), {}),
+                'days': {item['stat_key']: item for item in items if item['stat_key'] != TOTAL_KEY}
+            }
+
+        return current_app.model_cache.get('summary', f'{account_id}#{days}', load_item,
+                                           lambda item: AccountSummary(account_id, item['total'], item['days']))
+
+    @staticmethod
+    def invalidate(*account_ids):
+        """Drop cached summaries of accounts whose counters changed"""
+        current_app.model_cache.invalidate('summary', *(f'{account_id}#{days}' for account_id in account_ids
+                                                        if account_id for days in SUMMARY_WINDOWS))
+
+
+def rebuild_account(account_id):
+    """Recompute one account's summary items from its ledger entries"""
+    from .models import Transaction
+    from .migrations import query_all
+    table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS'])
+    threshold = current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS']
+
+    deltas = {}
+    for transaction in Transaction.iter_range(account_id):
+        transaction_deltas = stat_deltas(transaction, threshold)
+        # Ledger entries of a transfer exist under both accounts; only keep
+        # this account's side
+        merge_deltas(deltas, {key: value for key, value in transaction_deltas.items() if key[0] == account_id})
+
+    existing = list(query_all(table, KeyConditionExpression=Key('account_id').eq(account_id),
+                              ProjectionExpression='account_id, stat_key'))
+    with table.batch_writer() as batch:
+        for item in existing:
+            # Other state shares the table (e.g. COMPLIANCE); only prune summary items
+            if not item['stat_key'].startswith((TOTAL_KEY, 'DAY#', 'MONTH#')):
+                continue
+            if (account_id, item['stat_key']) not in deltas:
+                batch.delete_item(Key={'account_id': account_id, 'stat_key': item['stat_key']})
+        for (_, stat_key), counters in deltas.items():
+            batch.put_item(Item=dict(counters, account_id=account_id, stat_key=stat_key))
+    AccountSummary.invalidate(account_id)
+    return len(deltas)
+
+
+def rebuild_all():
+    """Recompute the summaries of every account from the ledger"""
+    from .migrations import scan_all
+    accounts = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+    stats = {'accounts': 0, 'summary_items': 0}
+    for item in scan_all(accounts, ProjectionExpression='account_id'):
+        stats['accounts'] += 1
+        stats['summary_items'] += rebuild_account(item['account_id'])
+    return stats
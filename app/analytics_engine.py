@@ -0,0 +1,147 @@
+"""Columnar, NumPy-vectorized aggregation over transaction history.
+
+A TransactionBatch holds one array per column instead of one Python object
+per row, and is built in a single pass over DynamoDB result pages. The
+aggregation functions below work on whole columns with masks, bincount and
+searchsorted, so their cost is a few C loops regardless of row count.
+"""
+import numpy as np
+
+TYPE_NAMES = ('deposit', 'withdraw', 'transfer')
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+DEPOSIT, WITHDRAW, TRANSFER = range(len(TYPE_NAMES))
+DAY_SECONDS = 86400
+
+
+def parse_epochs(timestamps):
+    """Vectorized ISO-8601 -> epoch seconds; offsets and fractions are dropped"""
+    if not timestamps:
+        return np.empty(0, dtype=np.int64)
+    trimmed = np.array([value[:19] for value in timestamps], dtype='datetime64[s]')
+    return trimmed.astype(np.int64)
+
+
+class TransactionBatch:
+    """Transactions of one account as parallel NumPy columns.
+
+    Amounts are whole cents in int64, so sums are exact. direction is +1
+    when money came into the account and -1 when it left, so transfers can
+    be split into incoming and outgoing legs. Only the numeric columns the
+    aggregations need are kept; pages that render rows read them from the
+    ledger a page at a time.
+    """
+    __slots__ = ('amount_cents', 'type_code', 'direction', 'epoch', 'account_id')
+
+    def __init__(self, amount_cents, type_code, direction, epoch, account_id=None):
+        self.amount_cents = amount_cents
+        self.type_code = type_code
+        self.direction = direction
+        self.epoch = epoch
+        self.account_id = account_id
+
+    def __len__(self):
+        return len(self.amount_cents)
+
+    @classmethod
+    def empty(cls, account_id=None):
+        return cls(np.empty(0, np.int64), np.empty(0, np.int8), np.empty(0, np.int8), np.empty(0, np.int64),
+                   account_id)
+
+    @classmethod
+    def from_pages(cls, pages, account_id=None):
+        """Build the columns page by page from raw DynamoDB items (or Transactions)"""
+        chunks = [cls._from_page(page, account_id) for page in pages if page]
+        if not chunks:
+            return cls.empty(account_id)
+        columns = [np.concatenate(column) for column in zip(*(
+            (chunk.amount_cents, chunk.type_code, chunk.direction, chunk.epoch) for chunk in chunks))]
+        return cls(*columns, account_id=account_id)
+
+    @classmethod
+    def from_items(cls, items, account_id=None, page_size=1000):
+        """Build the columns from an iterable of items, consumed in fixed-size pages"""
+        def pages():
+            page = []
+            for item in items:
+                page.append(item)
+                if len(page) == page_size:
+                    yield page
+                    page = []
+            yield page
+        return cls.from_pages(pages(), account_id)
+
+    @classmethod
+    def _from_page(cls, page, account_id):
+        # One comprehension per column; int() beats NumPy's own Decimal coercion
+        get = dict.get if isinstance(page[0], dict) else getattr
+        type_code = np.array([TYPE_CODES.get(get(item, 'transaction_type'), -1) for item in page], dtype=np.int8)
+        amount_cents = np.array([int(get(item, 'amount_cents')) for item in page], dtype=np.int64)
+        from_ids = [get(item, 'from_account_id') for item in page]
+        outgoing = np.array([from_id == account_id for from_id in from_ids], dtype=bool)
+        created_ats = [get(item, 'created_at') for item in page]
+        epoch = parse_epochs(created_ats)
+
+        direction = np.where(type_code == WITHDRAW, -1, 1).astype(np.int8)
+        if account_id is not None:
+            direction[(type_code == TRANSFER) & outgoing] = -1
+        known = type_code >= 0
+        return cls(amount_cents[known], type_code[known], direction[known], epoch[known], account_id)
+
+    def filter(self, mask):
+        return TransactionBatch(self.amount_cents[mask], self.type_code[mask], self.direction[mask],
+                                self.epoch[mask], self.account_id)
+
+
+def totals_by_type(batch):
+    """{type: (count, total cents)} using one bincount per measure"""
+    counts = np.bincount(batch.type_code, minlength=len(TYPE_NAMES))
+    # Float weights stay exact for cent totals below 2**53
+    totals = np.bincount(batch.type_code, weights=batch.amount_cents, minlength=len(TYPE_NAMES))
+    return {name: (int(counts[code]), int(totals[code])) for code, name in enumerate(TYPE_NAMES)}
+
+
+def volume(batch):
+    """Deposited plus transferred cents, the dashboards' notion of volume"""
+    return int(batch.amount_cents[batch.type_code != WITHDRAW].sum())
+
+
+def count_over(batch, threshold_cents):
+    return int(np.count_nonzero(batch.amount_cents > threshold_cents))
+
+
+def since(batch, epoch_seconds):
+    return batch.filter(batch.epoch >= epoch_seconds)
+
+
+def bucket_totals(batch, bucket_seconds=DAY_SECONDS):
+    """(bucket start epochs, transaction counts, cents) per time bucket"""
+    buckets, inverse = np.unique(batch.epoch // bucket_seconds, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(buckets))
+    amounts = np.bincount(inverse, weights=batch.amount_cents, minlength=len(buckets))
+    return buckets * bucket_seconds, counts, amounts.astype(np.int64)
+
+
+def max_window_count(batch, window_seconds):
+    """Largest number of transactions inside any sliding window of the given length"""
+    if not len(batch):
+        return 0
+    epochs = np.sort(batch.epoch)
+    ends = np.searchsorted(epochs, epochs + window_seconds, side='left')
+    return int((ends - np.arange(len(epochs))).max())
+
+
+def summarize(batch, large_threshold_cents):
+    """The totals /reports and /compliance render, computed column-wise; amounts in cents"""
+    by_type = totals_by_type(batch)
+    transfers = batch.type_code == TRANSFER
+    return {
+        'total_transactions': len(batch),
+        'total_deposits': by_type['deposit'][1],
+        'total_withdrawals': by_type['withdraw'][1],
+        'total_transfers': by_type['transfer'][1],
+        'transfers_in': int(batch.amount_cents[transfers & (batch.direction > 0)].sum()),
+        'transfers_out': int(batch.amount_cents[transfers & (batch.direction < 0)].sum()),
+        'type_counts': {name: count for name, (count, _) in by_type.items()},
+        'volume': volume(batch),
+        'large_transactions': count_over(batch, large_threshold_cents),
+    }
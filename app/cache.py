@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_request_context
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed TTL"""
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ModelCache:
+    """Two-level cache for model lookups.
+
+    Level one is an identity map on flask.g, so a request loads each user or
+    account at most once. Level two is an optional per-process TTL/LRU cache
+    of raw DynamoDB items shared across requests; it keeps items rather than
+    model objects so concurrent requests never share mutable instances.
+    A namespace with a TTL of 0 only uses the identity map.
+    """
+
+    def __init__(self, app_config):
+        self.max_entries = app_config.get('MODEL_CACHE_MAX_ENTRIES', 10000)
+        self.ttls = {
+            'user': app_config.get('USER_CACHE_TTL', 0),
+            'account': app_config.get('ACCOUNT_CACHE_TTL', 0),
+            'summary': app_config.get('SUMMARY_CACHE_TTL', 0),
+        }
+        self.caches = {namespace: TTLCache(self.max_entries, ttl)
+                       for namespace, ttl in self.ttls.items() if ttl > 0}
+        self.counters = {'request_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0}
+        self.lock = threading.Lock()
+
+    def _count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    @staticmethod
+    def _identity_map():
+        if not has_request_context():
+            return None
+        # setdefault, so lookups gathered in parallel share one map
+        return g.setdefault('identity_map', {})
+
+    def get(self, namespace, key, load_item, build):
+        """Return the model for (namespace, key), loading its item only on a miss.
+
+        load_item fetches the raw item (or None); build turns an item into a model.
+        """
+        identity_map = self._identity_map()
+        if identity_map is not None and (namespace, key) in identity_map:
+            self._count('request_hits')
+            return identity_map[(namespace, key)]
+
+        cache = self.caches.get(namespace)
+        found, item = cache.get(key) if cache is not None else (False, None)
+        if found:
+            self._count('shared_hits')
+        else:
+            self._count('misses')
+            item = load_item()
+            if cache is not None and item is not None:
+                cache.set(key, item)
+
+        model = build(item) if item is not None else None
+        if identity_map is not None and model is not None:
+            identity_map[(namespace, key)] = model
+        return model
+
+    def remember(self, namespace, key, model):
+        """Put a model the caller already holds into the request identity map"""
+        identity_map = self._identity_map()
+        if identity_map is not None and model is not None:
+            identity_map[(namespace, key)] = model
+
+    def invalidate(self, namespace, *keys):
+        identity_map = self._identity_map()
+        cache = self.caches.get(namespace)
+        for key in keys:
+            if key is None:
+                continue
+            if identity_map is not None:
+                identity_map.pop((namespace, key), None)
+            if cache is not None:
+                cache.invalidate(key)
+            self._count('invalidations')
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats['request_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['request_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        stats['entries'] = {namespace: len(cache) for namespace, cache in self.caches.items()}
+        return stats
@@ -0,0 +1,250 @@
+import click
+from flask.cli import AppGroup
+from .money import InvalidAmountError, format_cents, parse_cents
+
+migrate_cli = AppGroup('migrate', help='One-shot data migrations for existing DynamoDB tables.')
+
+
+@migrate_cli.command('users-email-index')
+def users_email_index():
+    """Add the email GSI to the users table and backfill email guards."""
+    from .migrations import migrate_user_email_index
+    stats = migrate_user_email_index()
+    click.echo(f"Users: {stats['users']}, guards written: {stats['guards_written']}, "
+               f"conflicts: {stats['conflicts']}")
+
+
+@migrate_cli.command('accounts-user-index')
+def accounts_user_index():
+    """Add the user_id GSI to the accounts table."""
+    from .migrations import migrate_account_user_index
+    stats = migrate_account_user_index()
+    state = 'created' if stats['index_created'] else 'already present'
+    click.echo(f"Index {state}, accounts indexed: {stats['accounts']}")
+
+
+@migrate_cli.command('ledger')
+def ledger():
+    """Backfill the per-account ledger from the transactions table."""
+    from .migrations import migrate_ledger
+    stats = migrate_ledger()
+    click.echo(f"Transactions: {stats['transactions']}, ledger entries written: {stats['entries']}")
+
+
+@migrate_cli.command('money-to-cents')
+def money_to_cents():
+    """Convert stored amounts and balances to integer cents, then rebuild summaries."""
+    from .migrations import migrate_money_to_cents
+    stats = migrate_money_to_cents()
+    click.echo(f"Accounts: {stats['accounts']}, transactions: {stats['transactions']}, "
+               f"ledger entries: {stats['ledger_entries']}, alerts: {stats['alerts']}, "
+               f"summary items rebuilt: {stats['summary_items']}, "
+               f"compliance states rebuilt: {stats['compliance_accounts']}")
+
+
+aggregates_cli = AppGroup('aggregates', help='Maintain the precomputed per-account summaries.')
+
+
+@aggregates_cli.command('rebuild')
+@click.option('--account-id', help='Only rebuild this account.')
+def rebuild_aggregates(account_id):
+    """Recompute account summaries from the ledger."""
+    from .aggregates import rebuild_account, rebuild_all
+    if account_id:
+        click.echo(f"Summary items written: {rebuild_account(account_id)}")
+        return
+    stats = rebuild_all()
+    click.echo(f"Accounts: {stats['accounts']}, summary items written: {stats['summary_items']}")
+
+
+export_cli = AppGroup('export', help='Export transaction history.')
+
+
+@export_cli.command('transactions')
+@click.option('--account-id', required=True)
+@click.option('--start', help='First day (YYYY-MM-DD).')
+@click.option('--end', help='Last day (YYYY-MM-DD).')
+@click.option('--type', 'transaction_types', multiple=True,
+              type=click.Choice(['deposit', 'withdraw', 'transfer']), help='Repeat to export several types.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']), default='csv')
+@click.option('--row-group-size', default=50000, show_default=True, help='Parquet rows per row group.')
+@click.option('--output', required=True, type=click.Path(dir_okay=False, writable=True))
+def export_transactions(account_id, start, end, transaction_types, fmt, row_group_size, output):
+    """Stream an account's transactions to a CSV or Parquet file."""
+    from .export import export_rows, write_csv, write_parquet
+    rows = export_rows(account_id, start, end, list(transaction_types) or None)
+    if fmt == 'parquet':
+        try:
+            count = write_parquet(rows, output, row_group_size)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+    else:
+        count = write_csv(rows, output)
+    click.echo(f"Exported {count} transactions to {output}")
+
+
+scan_cli = AppGroup('scan', help='Bank-wide reports from parallel table scans.')
+
+
+def scan_options(command):
+    command = click.option('--segments', type=int, help='Parallel scan segments (default SCAN_SEGMENTS).')(command)
+    command = click.option('--workers', type=int, help='Worker threads (default SCAN_WORKERS).')(command)
+    return click.option('--progress/--no-progress', default=False,
+                        help='Report every finished segment on stderr.')(command)
+
+
+def progress_reporter(enabled):
+    if not enabled:
+        return None
+    reported = set()
+
+    def report(stats):
+        if stats['segments_done'] and stats['segments_done'] not in reported:
+            reported.add(stats['segments_done'])
+            click.echo(f"{stats['segments_done']}/{stats['segments']} segments, {stats['scanned']} items "
+                       f"scanned ({stats['items_per_second']} items/s)", err=True)
+    return report
+
+
+def echo_scan_stats(stats):
+    click.echo(f"Scanned {stats['scanned']} items in {stats['pages']} pages over {stats['segments']} segments "
+               f"in {stats['seconds']}s ({stats['items_per_second']} items/s)", err=True)
+
+
+@scan_cli.command('large-transactions')
+@click.option('--threshold', help='Amount to exceed, e.g. 2500.00 (default LARGE_TRANSACTION_THRESHOLD).')
+@scan_options
+def scan_large_transactions(threshold, segments, workers, progress):
+    """List every transaction above the threshold."""
+    from .scan import large_transactions
+    try:
+        threshold_cents = parse_cents(threshold) if threshold is not None else None
+    except InvalidAmountError as e:
+        raise click.BadParameter(str(e), param_hint='--threshold')
+    items, stats = large_transactions(threshold_cents, segments=segments, workers=workers,
+                                      on_progress=progress_reporter(progress))
+    for item in items:
+        click.echo(f"{item['created_at']}  {item['transaction_id']}  {item['transaction_type']:<8}  "
+                   f"{format_cents(item['amount_cents']):>14}  {item.get('from_account_id') or '-'} -> "
+                   f"{item.get('to_account_id') or '-'}")
+    echo_scan_stats(stats)
+
+
+@scan_cli.command('negative-balances')
+@scan_options
+def scan_negative_balances(segments, workers, progress):
+    """List every overdrawn account."""
+    from .scan import negative_balances
+    items, stats = negative_balances(segments=segments, workers=workers, on_progress=progress_reporter(progress))
+    for item in items:
+        click.echo(f"{item['account_id']}  {item['user_id']}  {format_cents(item['balance_cents']):>14}")
+    echo_scan_stats(stats)
+
+
+@scan_cli.command('daily-volume')
+@scan_options
+def scan_daily_volume(segments, workers, progress):
+    """Print the transaction count and amount for every day."""
+    from .scan import daily_volume
+    days, stats = daily_volume(segments=segments, workers=workers, on_progress=progress_reporter(progress))
+    for day in days:
+        click.echo(f"{day['day']}  {day['count']:>8}  {format_cents(day['amount_cents']):>16}")
+    echo_scan_stats(stats)
+
+
+compliance_cli = AppGroup('compliance', help='Maintain the per-account compliance state.')
+
+
+@compliance_cli.command('rebuild')
+@click.option('--account-id', help='Only rebuild this account.')
+@scan_options
+def rebuild_compliance(account_id, segments, workers, progress):
+    """Recompute compliance state from the ledger, scanning accounts in parallel."""
+    from .compliance import rebuild_account, rebuild_all
+    if account_id:
+        state = rebuild_account(account_id)
+        click.echo(f"Large transactions: {state.large_tx_count}, "
+                   f"lowest balance: {format_cents(state.min_balance_cents)}")
+        return
+    stats = rebuild_all(segments=segments, workers=workers, on_progress=progress_reporter(progress))
+    click.echo(f"Accounts: {stats['accounts']} in {stats['seconds']}s")
+
+
+stream_cli = AppGroup('stream', help='Run and inspect the change stream consumer.')
+
+
+@stream_cli.command('consume')
+@click.option('--once', is_flag=True, help='Exit once the change log is drained instead of polling forever.')
+def consume(once):
+    """Apply change log records to summaries, fraud rules and compliance state."""
+    from flask import current_app
+    consumer = current_app.change_stream
+    try:
+        consumer.run(once=once)
+    except KeyboardInterrupt:
+        pass
+    stats = consumer.stats()
+    click.echo(f"Records: {stats['records']} in {stats['batches']} batches, duplicates: {stats['duplicates']}, "
+               f"late: {stats['late']}, failures: {stats['failures']}, dead-lettered: {stats['dead_lettered']}, "
+               f"lag: {stats['lag_seconds']}s")
+
+
+@stream_cli.command('status')
+def stream_status():
+    """Show each shard's checkpoint and how far the consumer is behind."""
+    from flask import current_app
+    for shard, status in current_app.change_stream.lag().items():
+        pending = f"{status['pending']}+" if status['pending'] == current_app.change_stream.batch_size \
+            else status['pending']
+        click.echo(f"{shard:<10} checkpoint {status['checkpoint']:<64} pending {pending:<6} "
+                   f"oldest {status['oldest_pending_seconds']}s")
+
+
+@stream_cli.command('dead-letters')
+@click.option('--requeue', is_flag=True, help='Put every dead-lettered record back on the change log.')
+def dead_letters(requeue):
+    """List records that failed CHANGE_STREAM_MAX_ATTEMPTS times, or requeue them once fixed."""
+    from flask import current_app
+    consumer = current_app.change_stream
+    if requeue:
+        click.echo(f"Requeued {consumer.requeue_dead_letters()} records")
+        return
+    for item in consumer.dead_letters():
+        click.echo(f"{item['dead_lettered_at']}  {item['source_shard']:<10} {item['transaction_id']}  "
+                   f"attempts {item['attempts']}  {item['last_error']}")
+
+
+@click.command('bootstrap')
+@click.option('--no-wait', is_flag=True, help="Don't wait for new tables to become active.")
+def bootstrap(no_wait):
+    """Create any missing DynamoDB tables; run once per deployment, not per worker."""
+    from flask import current_app
+    from .tables import bootstrap_tables
+    for table_name, status in bootstrap_tables(current_app.dynamo, current_app.config, wait=not no_wait).items():
+        click.echo(f"{table_name:<24} {status}")
+
+
+sessions_cli = AppGroup('sessions', help='Manage signed-in sessions.')
+
+
+@sessions_cli.command('revoke')
+@click.argument('email')
+def revoke_sessions(email):
+    """Sign a user out of every session held on this host."""
+    from flask import current_app
+    from .models import User
+    user = User.get_by_email(email)
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    click.echo(f"Revoked {current_app.session_principals.revoke_user(user.user_id)} sessions")
+
+
+def register_commands(app):
+    app.cli.add_command(bootstrap)
+    app.cli.add_command(migrate_cli)
+    app.cli.add_command(aggregates_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(scan_cli)
+    app.cli.add_command(compliance_cli)
+    app.cli.add_command(stream_cli)
+    app.cli.add_command(sessions_cli)
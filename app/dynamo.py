@@ -0,0 +1,88 @@
+import os
+import threading
+import boto3
+from botocore.config import Config as BotoConfig
+
+
+def client_config(app_config):
+    """botocore settings for every DynamoDB client the app creates"""
+    return BotoConfig(
+        max_pool_connections=app_config['DYNAMODB_MAX_POOL_CONNECTIONS'],
+        connect_timeout=app_config['DYNAMODB_CONNECT_TIMEOUT'],
+        read_timeout=app_config['DYNAMODB_READ_TIMEOUT'],
+        retries={'max_attempts': app_config['DYNAMODB_MAX_ATTEMPTS'],
+                 'mode': app_config['DYNAMODB_RETRY_MODE']},
+        tcp_keepalive=app_config['DYNAMODB_TCP_KEEPALIVE']
+    )
+
+
+class DynamoDB:
+    """DynamoDB handles shared by every request of one process.
+
+    boto3 clients are thread-safe and keep a connection pool, so one client of
+    each kind serves all threads. Resource objects such as Table are not
+    thread-safe, so Table handles are cached per thread instead of being
+    rebuilt on every call. Connections must not be shared across a fork, so a
+    child process (e.g. gunicorn --preload) builds its own on first use.
+    """
+
+    def __init__(self, session_kwargs, config, endpoint_url=None):
+        self.session_kwargs = session_kwargs
+        self.config = config
+        self.endpoint_url = endpoint_url
+        self.lock = threading.Lock()
+        self.event_handlers = []
+        self.pid = None
+        self._connect()
+
+    def _connect(self):
+        # Sessions are not thread-safe; each process builds one under the lock
+        session = boto3.session.Session(**self.session_kwargs)
+        self._resource = session.resource('dynamodb', config=self.config, endpoint_url=self.endpoint_url)
+        self._raw_client = session.client('dynamodb', config=self.config, endpoint_url=self.endpoint_url)
+        for event_name, handler in self.event_handlers:
+            self._register(event_name, handler)
+        self._local = threading.local()
+        self.pid = os.getpid()
+
+    def _register(self, event_name, handler):
+        for client in (self._resource.meta.client, self._raw_client):
+            client.meta.events.register(event_name, handler)
+
+    def register_event_handler(self, event_name, handler):
+        """Hook a botocore event on every client, including those rebuilt after a fork"""
+        with self.lock:
+            self.event_handlers.append((event_name, handler))
+            self._register(event_name, handler)
+
+    def _check_process(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self._connect()
+
+    @property
+    def resource(self):
+        self._check_process()
+        return self._resource
+
+    @property
+    def client(self):
+        """Client that (de)serializes Python values, as Table methods do"""
+        return self.resource.meta.client
+
+    @property
+    def raw_client(self):
+        """Plain low-level client working in DynamoDB's typed JSON"""
+        self._check_process()
+        return self._raw_client
+
+    def table(self, name):
+        resource = self.resource
+        tables = getattr(self._local, 'tables', None)
+        if tables is None:
+            tables = self._local.tables = {}
+        table = tables.get(name)
+        if table is None:
+            table = tables[name] = resource.Table(name)
+        return table
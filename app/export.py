@@ -0,0 +1,91 @@
+import csv
+import io
+from decimal import Decimal
+from .models import Transaction
+from .money import format_cents
+
+CENT = Decimal('0.01')
+
+EXPORT_COLUMNS = ('created_at', 'transaction_id', 'transaction_type', 'direction',
+                  'amount', 'counterparty_account_id', 'description')
+
+
+def export_rows(account_id, start=None, end=None, transaction_types=None):
+    """Yield one flat row per ledger entry, oldest first, straight from the query pages"""
+    for transaction in Transaction.iter_range(account_id, start, end, transaction_types=transaction_types):
+        outgoing = transaction.from_account_id == account_id
+        yield {
+            'created_at': transaction.created_at,
+            'transaction_id': transaction.transaction_id,
+            'transaction_type': transaction.transaction_type,
+            'direction': 'debit' if outgoing else 'credit',
+            'amount': format_cents(transaction.amount_cents),
+            'counterparty_account_id': (transaction.to_account_id if outgoing else transaction.from_account_id) or '',
+            'description': transaction.description,
+        }
+
+
+def csv_chunks(rows, rows_per_chunk=500):
+    """Encode rows as CSV text in chunks suitable for a streamed HTTP response"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+    writer.writeheader()
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending == rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue()
+
+
+def write_csv(rows, path):
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def write_parquet(rows, path, row_group_size=50000):
+    """Write rows to Parquet one row group at a time, so memory is bounded by the group size"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export requires pyarrow (pip install -r requirements.txt)')
+
+    schema = pa.schema([
+        ('created_at', pa.string()),
+        ('transaction_id', pa.string()),
+        ('transaction_type', pa.string()),
+        ('direction', pa.string()),
+        ('amount', pa.decimal128(18, 2)),
+        ('counterparty_account_id', pa.string()),
+        ('description', pa.string()),
+    ])
+    count = 0
+    columns = {name: [] for name in EXPORT_COLUMNS}
+
+    with pq.ParquetWriter(path, schema) as writer:
+        def flush():
+            data = dict(columns, amount=[Decimal(value).quantize(CENT) for value in columns['amount']])
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+            for values in columns.values():
+                values.clear()
+
+        for row in rows:
+            for name in EXPORT_COLUMNS:
+                columns[name].append(row[name])
+            count += 1
+            if len(columns['created_at']) == row_group_size:
+                flush()
+        if columns['created_at'] or count == 0:
+            flush()
+    return count
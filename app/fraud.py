@@ -0,0 +1,394 @@
+import logging
+import math
+import threading
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from boto3.dynamodb.conditions import Attr, Key
+from flask import current_app
+from .aggregates import transaction_legs
+from .cache import TTLCache
+from .money import format_money
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+RULE_LABELS = {
+    'large_amount': 'Large transaction',
+    'velocity': 'Transaction velocity',
+    'structuring': 'Possible structuring',
+    'new_recipients': 'New recipient burst',
+    'amount_zscore': 'Unusual amount',
+}
+# Recipients remembered per account when spotting transfers to new payees
+KNOWN_RECIPIENTS = 256
+# Transaction ids remembered per account so a redelivered change record is
+# not counted twice
+RECENT_TRANSACTIONS = 32
+# AccountStats item holding an account's windows, shared by every process
+FRAUD_STATE_KEY = 'FRAUD'
+MAX_STATE_WRITES = 5
+# Accounts are spread over this many locks, so one account's postings are
+# evaluated one at a time without serialising every account
+LOCK_STRIPES = 64
+
+
+def epoch_seconds(created_at):
+    return (datetime.fromisoformat(created_at) - EPOCH).total_seconds()
+
+
+class RingWindow:
+    """Timestamps of the most recent events within `span` seconds.
+
+    A fixed-size ring buffer: adding an event and dropping expired ones are
+    amortised O(1), and once full the oldest event is overwritten, so counts
+    saturate at the capacity.
+    """
+    __slots__ = ('span', 'times', 'head', 'size')
+
+    def __init__(self, span, capacity):
+        self.span = span
+        self.times = array('d', [0.0]) * capacity
+        self.head = 0
+        self.size = 0
+
+    def expire(self, now):
+        capacity = len(self.times)
+        while self.size and self.times[(self.head - self.size) % capacity] <= now - self.span:
+            self.size -= 1
+
+    def add(self, now):
+        """Record an event and return how many events the window now holds"""
+        self.expire(now)
+        capacity = len(self.times)
+        self.times[self.head] = now
+        self.head = (self.head + 1) % capacity
+        self.size = min(self.size + 1, capacity)
+        return self.size
+
+    def snapshot(self):
+        """Timestamps held, oldest first"""
+        capacity = len(self.times)
+        return array('d', (self.times[(self.head - self.size + i) % capacity] for i in range(self.size)))
+
+    def restore(self, times):
+        capacity = len(self.times)
+        for now in times[-capacity:]:
+            self.times[self.head] = now
+            self.head = (self.head + 1) % capacity
+            self.size = min(self.size + 1, capacity)
+
+
+class AccountWindows:
+    """Sliding-window rule state for one account"""
+    __slots__ = ('velocity', 'structuring', 'new_recipients', 'recipients', 'recent', 'count', 'mean', 'm2')
+
+    def __init__(self, rules):
+        capacity = rules['capacity']
+        self.velocity = RingWindow(rules['velocity_seconds'], capacity)
+        self.structuring = RingWindow(rules['structuring_seconds'], capacity)
+        self.new_recipients = RingWindow(rules['new_recipient_seconds'], capacity)
+        self.recipients = OrderedDict()
+        self.recent = deque(maxlen=RECENT_TRANSACTIONS)
+        # Welford's running mean and variance of amounts, in cents
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def observe(self, rules, now, amount_cents, leg, counterparty):
+        """Fold one ledger leg into the windows and return the rules it trips.
+
+        Count rules fire when a window first reaches its limit, not on every
+        event after it, and can fire again once the window has drained.
+        """
+        tripped = []
+        threshold = rules['large_threshold_cents']
+
+        if amount_cents > threshold:
+            tripped.append(('large_amount', f"{format_money(amount_cents)} exceeds {format_money(threshold)}"))
+
+        if self.velocity.add(now) == rules['velocity_count']:
+            tripped.append(('velocity', f"{rules['velocity_count']} transactions within "
+                                        f"{rules['velocity_seconds'] // 60} minutes"))
+
+        if leg != 'transfer_in' and threshold * (1 - rules['structuring_margin']) <= amount_cents <= threshold:
+            if self.structuring.add(now) == rules['structuring_count']:
+                tripped.append(('structuring', f"{rules['structuring_count']} amounts just under "
+                                               f"{format_money(threshold)} within "
+                                               f"{rules['structuring_seconds'] // 3600} hours"))
+
+        if leg == 'transfer_out' and counterparty:
+            if counterparty in self.recipients:
+                self.recipients.move_to_end(counterparty)
+            else:
+                self.recipients[counterparty] = True
+                if len(self.recipients) > KNOWN_RECIPIENTS:
+                    self.recipients.popitem(last=False)
+                if self.new_recipients.add(now) == rules['new_recipient_count']:
+                    tripped.append(('new_recipients', f"{rules['new_recipient_count']} new recipients within "
+                                                      f"{rules['new_recipient_seconds'] // 60} minutes"))
+
+        if self.count >= rules['zscore_min_samples'] and self.m2 > 0:
+            zscore = (amount_cents - self.mean) / math.sqrt(self.m2 / (self.count - 1))
+            if zscore >= rules['zscore']:
+                tripped.append(('amount_zscore', f"{format_money(amount_cents)} is {zscore:.1f} standard deviations "
+                                                 f"above the account average of {format_money(round(self.mean))}"))
+        self.count += 1
+        delta = amount_cents - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount_cents - self.mean)
+
+        return tripped
+
+    def first_sighting(self, transaction_id):
+        """Remember transaction_id; False if it was already observed"""
+        if transaction_id in self.recent:
+            return False
+        self.recent.append(transaction_id)
+        return True
+
+    def to_item(self, account_id, version):
+        return {
+            'account_id': account_id,
+            'stat_key': FRAUD_STATE_KEY,
+            'velocity': self.velocity.snapshot().tobytes(),
+            'structuring': self.structuring.snapshot().tobytes(),
+            'new_recipients': self.new_recipients.snapshot().tobytes(),
+            'recipients': list(self.recipients),
+            'recent': list(self.recent),
+            'moments': array('d', (self.count, self.mean, self.m2)).tobytes(),
+            'version': version,
+        }
+
+    @staticmethod
+    def from_item(item, rules):
+        windows = AccountWindows(rules)
+        for name in ('velocity', 'structuring', 'new_recipients'):
+            getattr(windows, name).restore(array('d', bytes(item[name])))
+        windows.recipients.update((recipient, True) for recipient in item.get('recipients', []))
+        windows.recent.extend(item.get('recent', []))
+        count, windows.mean, windows.m2 = array('d', bytes(item['moments']))
+        windows.count = int(count)
+        return windows
+
+
+class FraudEngine:
+    """Evaluates fraud rules incrementally as transactions are posted.
+
+    Each account's windows are stored in its FRAUD item in the AccountStats
+    table, so every process and the change stream consumer evaluate against
+    the same history; the first time they are built from the newest ledger
+    entries in one query. Updates are a write guarded by a version number,
+    and a process keeps the windows it last wrote in a TTL/LRU cache, so an
+    event normally costs that one write plus one for each alert raised. A
+    conflicting write from another process makes it re-read and retry.
+    """
+
+    def __init__(self, app_config):
+        self.rules = {
+            'large_threshold_cents': app_config['LARGE_TRANSACTION_THRESHOLD_CENTS'],
+            'capacity': app_config['FRAUD_WINDOW_CAPACITY'],
+            'velocity_seconds': app_config['FRAUD_VELOCITY_SECONDS'],
+            'velocity_count': app_config['FRAUD_VELOCITY_COUNT'],
+            'structuring_seconds': app_config['FRAUD_STRUCTURING_SECONDS'],
+            'structuring_margin': app_config['FRAUD_STRUCTURING_MARGIN'],
+            'structuring_count': app_config['FRAUD_STRUCTURING_COUNT'],
+            'new_recipient_seconds': app_config['FRAUD_NEW_RECIPIENT_SECONDS'],
+            'new_recipient_count': app_config['FRAUD_NEW_RECIPIENT_COUNT'],
+            'zscore': app_config['FRAUD_ZSCORE'],
+            'zscore_min_samples': app_config['FRAUD_ZSCORE_MIN_SAMPLES'],
+        }
+        self.history_limit = app_config['FRAUD_HISTORY_LIMIT']
+        # account_id -> (version, windows) as this process last wrote them
+        self.states = TTLCache(app_config['FRAUD_STATE_MAX_ACCOUNTS'], app_config['FRAUD_STATE_TTL'])
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+    def _lock_for(self, account_id):
+        return self.locks[zlib.crc32(account_id.encode('utf-8')) % LOCK_STRIPES]
+
+    @staticmethod
+    def _leg_of(item, account_id):
+        """The leg and counterparty a ledger entry represents for account_id"""
+        if item['transaction_type'] == 'transfer':
+            if item.get('from_account_id') == account_id:
+                return 'transfer_out', item.get('to_account_id')
+            return 'transfer_in', item.get('from_account_id')
+        return item['transaction_type'], None
+
+    def _load(self, account_id, before_key):
+        """Replay the account's latest ledger entries older than before_key"""
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_LEDGER'])
+        response = table.query(
+            KeyConditionExpression=Key('account_id').eq(account_id) & Key('entry_key').lt(before_key),
+            ScanIndexForward=False,
+            Limit=self.history_limit
+        )
+        windows = AccountWindows(self.rules)
+        for item in reversed(response.get('Items', [])):
+            leg, counterparty = self._leg_of(item, account_id)
+            windows.first_sighting(item['transaction_id'])
+            windows.observe(self.rules, epoch_seconds(item['created_at']), int(item['amount_cents']), leg, counterparty)
+        return windows
+
+    def _read(self, account_id, before_key):
+        """(version, windows) as stored, or built from the ledger when the account has none yet"""
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS'])
+        item = table.get_item(Key={'account_id': account_id, 'stat_key': FRAUD_STATE_KEY},
+                              ConsistentRead=True).get('Item')
+        if item is None:
+            return 0, self._load(account_id, before_key)
+        return int(item['version']), AccountWindows.from_item(item, self.rules)
+
+    def _observe_account(self, account_id, legs):
+        """Fold (transaction, leg) pairs, oldest first, into the account's stored windows with one write.
+
+        Returns (transaction, rule, detail) for every rule tripped.
+        """
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS'])
+        found, state = self.states.get(account_id)
+        for _ in range(MAX_STATE_WRITES):
+            version, windows = state if found else self._read(account_id, legs[0][0].entry_key)
+            tripped = []
+            observed = False
+            for transaction, leg in legs:
+                if not windows.first_sighting(transaction.transaction_id):
+                    continue
+                observed = True
+                counterparty = transaction.to_account_id if leg == 'transfer_out' else None
+                tripped.extend((transaction, rule, detail) for rule, detail in
+                               windows.observe(self.rules, epoch_seconds(transaction.created_at),
+                                               transaction.amount_cents, leg, counterparty))
+            if not observed:
+                self.states.set(account_id, (version, windows))
+                return []
+            try:
+                table.put_item(Item=windows.to_item(account_id, version + 1),
+                               ConditionExpression=Attr('version').not_exists() | Attr('version').eq(version))
+            except table.meta.client.exceptions.ConditionalCheckFailedException:
+                # Another process moved the windows on; start again from theirs
+                found = False
+                continue
+            self.states.set(account_id, (version + 1, windows))
+            return tripped
+        raise RuntimeError(f"Fraud state for {account_id} not updated after {MAX_STATE_WRITES} conflicting writes")
+
+    def _alerts(self, account_id, legs):
+        # Read, update and write back under the account's lock, so two
+        # postings in this process can't both start from the same windows
+        with self._lock_for(account_id):
+            tripped = self._observe_account(account_id, legs)
+        return [Alert(account_id, rule, transaction.transaction_id, transaction.amount_cents, detail,
+                      transaction.created_at)
+                for transaction, rule, detail in tripped]
+
+    def evaluate(self, transaction):
+        """Return the alerts a newly posted transaction raises, without saving them"""
+        alerts = []
+        for account_id, leg in transaction_legs(transaction):
+            alerts.extend(self._alerts(account_id, [(transaction, leg)]))
+        return alerts
+
+    def observe(self, transaction):
+        """Evaluate and persist alerts for a posted transaction.
+
+        Runs after the transaction is committed, so failures are logged
+        rather than surfaced to the customer.
+        """
+        try:
+            alerts = self.evaluate(transaction)
+            for alert in alerts:
+                alert.save()
+            return alerts
+        except Exception as e:
+            logger.error(f"Fraud evaluation failed for transaction {transaction.transaction_id}: {e}")
+            return []
+
+    def observe_batch(self, transactions):
+        """Evaluate and persist alerts for many posted transactions, with one state write per account.
+
+        Used by bulk ingestion. Each account's legs are folded in oldest
+        first; an account that fails is logged and the others go ahead.
+        """
+        legs = {}
+        for transaction in transactions:
+            for account_id, leg in transaction_legs(transaction):
+                legs.setdefault(account_id, []).append((transaction, leg))
+        alerts = []
+        for account_id, account_legs in legs.items():
+            account_legs.sort(key=lambda pair: pair[0].entry_key)
+            try:
+                alerts.extend(self._alerts(account_id, account_legs))
+            except Exception as e:
+                logger.error(f"Fraud evaluation failed for account {account_id}: {e}")
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ALERTS'])
+        with table.batch_writer(overwrite_by_pkeys=['account_id', 'alert_key']) as batch:
+            for alert in alerts:
+                batch.put_item(Item=alert.to_item())
+        return alerts
+
+
+class Alert:
+    def __init__(self, account_id, rule, transaction_id, amount_cents, detail, created_at):
+        self.account_id = account_id
+        self.rule = rule
+        self.transaction_id = transaction_id
+        self.amount_cents = amount_cents
+        self.detail = detail
+        self.created_at = created_at
+
+    @property
+    def alert_key(self):
+        return f"{self.created_at}#{self.rule}#{self.transaction_id}"
+
+    @property
+    def label(self):
+        return RULE_LABELS.get(self.rule, self.rule)
+
+    def to_item(self):
+        return {
+            'account_id': self.account_id,
+            'alert_key': self.alert_key,
+            'rule': self.rule,
+            'transaction_id': self.transaction_id,
+            'amount_cents': self.amount_cents,
+            'detail': self.detail,
+            'created_at': self.created_at
+        }
+
+    def save(self):
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ALERTS'])
+        table.put_item(Item=self.to_item())
+
+    @staticmethod
+    def from_item(item):
+        return Alert(item['account_id'], item['rule'], item['transaction_id'], int(item['amount_cents']),
+                     item['detail'], item['created_at'])
+
+    @staticmethod
+    def recent(account_id, limit=10):
+        """The account's newest alerts"""
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ALERTS'])
+        response = table.query(
+            KeyConditionExpression=Key('account_id').eq(account_id),
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return [Alert.from_item(item) for item in response.get('Items', [])]
+
+    @staticmethod
+    def count_since(account_id, days):
+        """Number of alerts raised for the account in the last `days` days"""
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ALERTS'])
+        since = (datetime.utcnow() - timedelta(days=days)).isoformat()
+        kwargs = {
+            'KeyConditionExpression': Key('account_id').eq(account_id) & Key('alert_key').gte(since),
+            'Select': 'COUNT'
+        }
+        count = 0
+        while True:
+            response = table.query(**kwargs)
+            count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                return count
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
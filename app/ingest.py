@@ -0,0 +1,349 @@
+import csv
+import io
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from decimal import DecimalException
+from flask import current_app
+from . import aggregates, compliance, stream
+from .models import Account, Transaction
+from .money import MAX_SAFE_CENTS, parse_cents
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB accepts at most 25 put requests per BatchWriteItem call
+BATCH_SIZE = 25
+TRANSACTION_TYPES = ('deposit', 'withdraw', 'transfer')
+# Rejections echoed back in the run statistics; the rest are only logged
+MAX_REPORTED_ERRORS = 100
+# Written rows held for the fraud rules before they are evaluated together,
+# one state write per account
+FRAUD_BATCH_ROWS = 20000
+
+
+class IngestError(Exception):
+    """Raised when a batch cannot be written after all retries"""
+
+
+def read_csv_rows(stream):
+    """Yield rows from a CSV byte or text stream with a header line"""
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    yield from csv.DictReader(stream)
+
+
+def read_json_rows(stream, chunk_size=64 * 1024):
+    """Yield objects from JSON Lines or a top-level JSON array without loading it whole"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_array = None
+    exhausted = False
+
+    while True:
+        if not exhausted and len(buffer) < chunk_size:
+            chunk = stream.read(chunk_size)
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('utf-8')
+            exhausted = not chunk
+            buffer += chunk or ''
+
+        buffer = buffer.lstrip(' \t\r\n,')
+        if in_array is None and buffer:
+            in_array = buffer.startswith('[')
+            if in_array:
+                buffer = buffer[1:]
+                continue
+        if in_array and buffer.startswith(']'):
+            return
+        if not buffer:
+            if exhausted:
+                return
+            continue
+
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if exhausted:
+                raise
+            # Object split across chunks; read more before retrying
+            chunk = stream.read(chunk_size)
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode('utf-8')
+            exhausted = not chunk
+            buffer += chunk or ''
+            continue
+        buffer = buffer[end:]
+        yield row
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        return read_csv_rows(stream)
+    if fmt in ('json', 'jsonl', 'ndjson'):
+        return read_json_rows(stream)
+    raise ValueError(f"Unsupported ingest format: {fmt}")
+
+
+def parse_created_at(value):
+    """An ISO-8601 timestamp as naive UTC in the format Transaction.create writes"""
+    if value is None or value == '':
+        return datetime.utcnow().isoformat()
+    try:
+        parsed = datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ValueError(f"invalid created_at {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+def _text(row, field):
+    """A string field of an input row, or None when it is missing or empty"""
+    value = row.get(field)
+    if value is None or value == '':
+        return None
+    # Stored as DynamoDB strings; the low-level read path expects nothing else
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string, not {type(value).__name__}")
+    return value
+
+
+def row_to_transaction(row, max_cents=MAX_SAFE_CENTS):
+    """Validate an input row and build the Transaction it describes"""
+    if not isinstance(row, dict):
+        raise ValueError('row is not an object')
+    transaction_type = (_text(row, 'transaction_type') or '').strip().lower()
+    if transaction_type not in TRANSACTION_TYPES:
+        raise ValueError(f"invalid transaction_type {transaction_type!r}")
+    amount_cents = parse_cents(row.get('amount'), max_cents)
+    if amount_cents <= 0:
+        raise ValueError(f"invalid amount {row.get('amount')!r}")
+
+    from_account_id = _text(row, 'from_account_id')
+    to_account_id = _text(row, 'to_account_id')
+    if transaction_type in ('withdraw', 'transfer') and not from_account_id:
+        raise ValueError('from_account_id is required')
+    if transaction_type in ('deposit', 'transfer') and not to_account_id:
+        raise ValueError('to_account_id is required')
+
+    return Transaction(
+        _text(row, 'transaction_id') or str(uuid.uuid4()),
+        from_account_id if transaction_type != 'deposit' else None,
+        to_account_id if transaction_type != 'withdraw' else None,
+        amount_cents,
+        transaction_type,
+        _text(row, 'description') or transaction_type.title(),
+        parse_created_at(row.get('created_at'))
+    )
+
+
+def batch_write(client, request_items, max_retries=8, base_delay=0.05):
+    """Write one BatchWriteItem request, retrying unprocessed items with exponential backoff"""
+    for attempt in range(max_retries + 1):
+        response = client.batch_write_item(RequestItems=request_items)
+        request_items = response.get('UnprocessedItems') or {}
+        if not request_items:
+            return attempt
+        # Full jitter keeps parallel writers from retrying in lockstep
+        time.sleep(random.uniform(0, base_delay * (2 ** attempt)))
+    raise IngestError(f"{sum(len(v) for v in request_items.values())} items still unprocessed")
+
+
+class BulkIngestor:
+    """Stream rows into the transactions and ledger tables with parallel batch writers.
+
+    Extracts come from the system of record, which has already authorised
+    every posting, so withdrawals and transfers are not checked against the
+    balance here. Accounts an extract leaves below zero are logged and
+    counted in the 'overdrawn_accounts' statistic ('flask scan
+    negative-balances' lists them).
+
+    Like balances, summaries and compliance state are updated once per
+    account from deltas combined over the run, and the fraud rules fold in
+    each account's rows together every FRAUD_BATCH_ROWS rows, rather than
+    once per row.
+    """
+
+    def __init__(self, workers=4, max_in_flight=None):
+        self.app = current_app._get_current_object()
+        self.client = current_app.dynamo.client
+        self.transactions_table = current_app.config['DYNAMODB_TABLE_TRANSACTIONS']
+        self.ledger_table = current_app.config['DYNAMODB_TABLE_LEDGER']
+        self.accounts_table = current_app.config['DYNAMODB_TABLE_ACCOUNTS']
+        self.change_log_table = current_app.config['DYNAMODB_TABLE_CHANGE_LOG']
+        # In stream mode the change log carries the postings to the consumer,
+        # which maintains summaries, fraud windows and compliance state
+        self.stream = stream.stream_enabled()
+        self.workers = workers
+        # Bounds memory: the reader blocks once this many batches are queued
+        self.in_flight = threading.BoundedSemaphore(max_in_flight or workers * 2)
+        self.lock = threading.Lock()
+        self.stats = {'rows': 0, 'written': 0, 'rejected': 0, 'retries': 0, 'accounts_updated': 0,
+                      'overdrawn_accounts': 0, 'seconds': 0.0, 'rows_per_second': 0.0, 'errors': []}
+        # Ids of this run; a repeated id would be counted twice in the deltas,
+        # and BatchWriteItem rejects a batch that puts the same key twice
+        self.seen_ids = set()
+        self.balance_deltas = {}
+        self.balances = {}
+        self.stat_deltas = {}
+        self.compliance_deltas = {}
+        self.fraud_pending = []
+        self.compliance_rules = compliance.compliance_rules(current_app.config)
+        # Day buckets older than the compliance window would only be dropped
+        self.oldest_day = (datetime.utcnow().date().toordinal()
+                           - self.compliance_rules['window_days'] + 1)
+        self.large_threshold_cents = current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS']
+        self.max_amount_cents = current_app.config['MAX_AMOUNT_CENTS']
+
+    def _write_batch(self, puts):
+        try:
+            request_items = {}
+            for table_name, item in puts:
+                request_items.setdefault(table_name, []).append({'PutRequest': {'Item': item}})
+            retries = batch_write(self.client, request_items)
+            with self.lock:
+                self.stats['retries'] += retries
+        finally:
+            self.in_flight.release()
+
+    def _record_deltas(self, transaction):
+        amount_cents = transaction.amount_cents
+        with self.lock:
+            if transaction.from_account_id:
+                self.balance_deltas[transaction.from_account_id] = \
+                    self.balance_deltas.get(transaction.from_account_id, 0) - amount_cents
+            if transaction.to_account_id:
+                self.balance_deltas[transaction.to_account_id] = \
+                    self.balance_deltas.get(transaction.to_account_id, 0) + amount_cents
+            if not self.stream:
+                aggregates.merge_deltas(self.stat_deltas,
+                                        aggregates.stat_deltas(transaction, self.large_threshold_cents))
+                for account_id, leg in aggregates.transaction_legs(transaction):
+                    compliance.add_to_deltas(self.compliance_deltas.setdefault(account_id, compliance.new_deltas()),
+                                             transaction, leg, self.compliance_rules, self.oldest_day)
+                self.fraud_pending.append(transaction)
+
+    def _observe_fraud(self, futures):
+        """Evaluate the fraud rules over the rows held so far, once their batches are written"""
+        for future in futures:
+            future.result()
+        futures.clear()
+        if self.fraud_pending:
+            self.app.fraud_engine.observe_batch(self.fraud_pending)
+            self.fraud_pending = []
+
+    def _apply_balance_deltas(self):
+        """One atomic ADD per account instead of one per ingested row"""
+        for account_id, delta in self.balance_deltas.items():
+            try:
+                response = self.client.update_item(
+                    TableName=self.accounts_table,
+                    Key={'account_id': account_id},
+                    UpdateExpression='ADD #balance :delta',
+                    ConditionExpression='attribute_exists(account_id)',
+                    ExpressionAttributeNames={'#balance': 'balance_cents'},
+                    ExpressionAttributeValues={':delta': delta},
+                    ReturnValues='ALL_NEW'
+                )
+                Account.invalidate(account_id, response['Attributes']['user_id'])
+                self.stats['accounts_updated'] += 1
+                balance_cents = int(response['Attributes']['balance_cents'])
+                self.balances[account_id] = balance_cents
+                if balance_cents < 0 <= balance_cents - delta:
+                    logger.warning(f"Ingest left account {account_id} overdrawn at {balance_cents} cents")
+                if balance_cents < 0:
+                    self.stats['overdrawn_accounts'] += 1
+            except self.client.exceptions.ConditionalCheckFailedException:
+                logger.warning(f"Ingested transactions reference unknown account {account_id}")
+
+    def _update_read_models(self):
+        """Summaries and compliance state of every account the run touched"""
+        if self.stream:
+            # Summaries, fraud and compliance follow from the change records
+            stream.notify_consumer()
+            return
+        aggregates.apply_deltas(self.client, self.stat_deltas)
+        aggregates.AccountSummary.invalidate(*self.balance_deltas)
+        # One read-modify-write per account for the whole run
+        for account_id, balance_cents in self.balances.items():
+            try:
+                compliance.apply_deltas(account_id, self.compliance_deltas[account_id], balance_cents)
+            except Exception as e:
+                logger.error(f"Compliance update failed for account {account_id}: {e}")
+
+    def ingest(self, rows):
+        """Write all rows, then apply the aggregated balance and summary deltas.
+
+        Balances only move once every batch has been written. Rows that carry a
+        transaction_id overwrite the same items when a failed run is repeated,
+        but re-running a completed extract applies its balance deltas again.
+        A transaction_id repeated within one extract is rejected.
+        """
+        start = time.perf_counter()
+        pending = []
+        futures = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def flush():
+                self.in_flight.acquire()
+                futures.append(pool.submit(self._write_batch, list(pending)))
+                pending.clear()
+
+            for line_number, row in enumerate(rows, start=1):
+                self.stats['rows'] += 1
+                try:
+                    transaction = row_to_transaction(row, self.max_amount_cents)
+                    if transaction.transaction_id in self.seen_ids:
+                        raise ValueError(f"duplicate transaction_id {transaction.transaction_id!r}")
+                    self.seen_ids.add(transaction.transaction_id)
+                except (ValueError, TypeError, AttributeError, DecimalException) as e:
+                    # A malformed row is rejected on its own; the run goes on
+                    logger.warning(f"Rejected row {line_number}: {e}")
+                    self.stats['rejected'] += 1
+                    if len(self.stats['errors']) < MAX_REPORTED_ERRORS:
+                        self.stats['errors'].append(f"row {line_number}: {e}")
+                    continue
+
+                items = [(self.transactions_table, transaction.to_item())]
+                items.extend((self.ledger_table, item) for item in transaction.ledger_items())
+                if self.stream:
+                    items.append((self.change_log_table, stream.change_record(transaction, self.app.config)))
+                # Keep a transaction's items in one batch so a batch never
+                # holds half of a transfer
+                if len(pending) + len(items) > BATCH_SIZE:
+                    flush()
+                pending.extend(items)
+                self._record_deltas(transaction)
+                self.stats['written'] += 1
+
+                # Drop references to finished batches to keep memory flat
+                if len(futures) > self.workers * 4:
+                    for future in [f for f in futures if f.done()]:
+                        future.result()
+                        futures.remove(future)
+                if len(self.fraud_pending) >= FRAUD_BATCH_ROWS:
+                    # Alerts are only raised for rows already written
+                    if pending:
+                        flush()
+                    self._observe_fraud(futures)
+
+            if pending:
+                flush()
+            self._observe_fraud(futures)
+
+        self._apply_balance_deltas()
+        self._update_read_models()
+        self.stats['seconds'] = time.perf_counter() - start
+        if self.stats['seconds'] > 0:
+            self.stats['rows_per_second'] = self.stats['rows'] / self.stats['seconds']
+        return self.stats
+
+
+def ingest_stream(stream, fmt, workers=4):
+    """Ingest a CSV or JSON stream and return the run statistics"""
+    return BulkIngestor(workers=workers).ingest(read_rows(stream, fmt))
@@ -0,0 +1,59 @@
+"""Small SQLite store shared by every worker process on one host.
+
+Used for state that must be consistent across gunicorn workers but does not
+belong in DynamoDB, such as login rate-limit buckets. Each thread of each
+process opens its own connection; WAL mode lets readers and the single
+writer proceed concurrently.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class LocalStore:
+    def __init__(self, path, schema=()):
+        self.path = path
+        self.schema = list(schema)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.initialized_pid = None
+
+    def add_schema(self, *statements):
+        """Register CREATE TABLE IF NOT EXISTS statements; applied on the next connection"""
+        with self.lock:
+            self.schema.extend(statements)
+            self.initialized_pid = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def connection(self):
+        # Connections must not cross a fork, so they are kept per thread and pid
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = self._connect()
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        if self.initialized_pid != os.getpid():
+            with self.lock:
+                if self.initialized_pid != os.getpid():
+                    for statement in self.schema:
+                        connection.execute(statement)
+                    self.initialized_pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction that holds the database lock from its first statement"""
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
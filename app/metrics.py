@@ -0,0 +1,235 @@
+"""Request-level performance metrics.
+
+RequestMetrics times every request, and botocore event hooks attribute each
+DynamoDB call to the request that made it: call count and latency per
+operation, consumed capacity per table, and items scanned versus returned
+by Query and Scan. Calls to external services (SNS, Twilio) are timed with
+external_call(). The current request's trace is a context variable, so
+lookups run by parallel.gather() in a copy of the request's context count
+towards it; calls made outside a request (scan workers, notification
+workers, the change stream consumer) are recorded under '<background>'.
+
+Totals are kept per process and served in Prometheus text format at
+/metrics; with SERVER_TIMING the per-request breakdown is also sent as a
+Server-Timing header.
+"""
+import hmac
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import Response, abort, current_app, request
+
+BACKGROUND = '<background>'
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Operations that accept ReturnConsumedCapacity
+CAPACITY_OPERATIONS = frozenset(('GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+                                 'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'))
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram"""
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(DURATION_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class RequestTrace:
+    """What one request spent, collected on its thread and the lookups it fans out"""
+    __slots__ = ('endpoint', 'started', 'dynamodb_calls', 'dynamodb_seconds', 'external_calls', 'external_seconds')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.dynamodb_calls = 0
+        self.dynamodb_seconds = 0.0
+        self.external_calls = 0
+        self.external_seconds = 0.0
+
+
+def _labels(**labels):
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in labels.items())
+    return '{' + ','.join(escaped) + '}'
+
+
+class RequestMetrics:
+    def __init__(self, app_config):
+        self.return_capacity = app_config.get('DYNAMODB_RETURN_CONSUMED_CAPACITY', 'NONE')
+        self.server_timing = app_config.get('SERVER_TIMING', False)
+        self.token = app_config.get('METRICS_TOKEN')
+        self.trace = ContextVar('request_trace', default=None)
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.request_durations = defaultdict(Histogram)
+        self.dynamodb_calls = defaultdict(int)
+        self.dynamodb_durations = defaultdict(Histogram)
+        self.consumed_capacity = defaultdict(float)
+        self.items_scanned = defaultdict(int)
+        self.items_returned = defaultdict(int)
+        self.external_durations = defaultdict(Histogram)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.dynamo.register_event_handler('provide-client-params.dynamodb', self._provide_params)
+        app.dynamo.register_event_handler('before-call.dynamodb', self._before_call)
+        app.dynamo.register_event_handler('after-call.dynamodb', self._after_call)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    def _trace(self):
+        return self.trace.get()
+
+    # Flask hooks
+
+    def _before_request(self):
+        self.trace.set(RequestTrace(request.endpoint or 'unmatched'))
+
+    def _after_request(self, response):
+        trace = self._trace()
+        if trace is None:
+            return response
+        elapsed = time.perf_counter() - trace.started
+        with self.lock:
+            self.requests[(trace.endpoint, request.method, response.status_code)] += 1
+            self.request_durations[trace.endpoint].observe(elapsed)
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.1f}, '
+                f'dynamodb;dur={trace.dynamodb_seconds * 1000:.1f};desc="{trace.dynamodb_calls} calls", '
+                f'external;dur={trace.external_seconds * 1000:.1f};desc="{trace.external_calls} calls"'
+            )
+        return response
+
+    def _teardown_request(self, exc):
+        self.trace.set(None)
+
+    # botocore hooks
+
+    def _provide_params(self, params, model, **kwargs):
+        if self.return_capacity != 'NONE' and model.name in CAPACITY_OPERATIONS:
+            params.setdefault('ReturnConsumedCapacity', self.return_capacity)
+
+    def _before_call(self, context, **kwargs):
+        context['metrics_started'] = time.perf_counter()
+
+    def _after_call(self, parsed, model, context, **kwargs):
+        started = context.get('metrics_started')
+        elapsed = time.perf_counter() - started if started is not None else 0.0
+        trace = self._trace()
+        endpoint = trace.endpoint if trace is not None else BACKGROUND
+
+        operation = model.name
+        capacity = parsed.get('ConsumedCapacity') or []
+        if isinstance(capacity, dict):
+            capacity = [capacity]
+        with self.lock:
+            # A request's parallel lookups update its trace from several threads
+            if trace is not None:
+                trace.dynamodb_calls += 1
+                trace.dynamodb_seconds += elapsed
+            self.dynamodb_calls[(endpoint, operation)] += 1
+            self.dynamodb_durations[operation].observe(elapsed)
+            for entry in capacity:
+                self.consumed_capacity[(endpoint, entry.get('TableName', 'unknown'))] += entry.get('CapacityUnits', 0.0)
+            if operation in ('Query', 'Scan'):
+                self.items_scanned[(endpoint, operation)] += parsed.get('ScannedCount', 0)
+                self.items_returned[(endpoint, operation)] += parsed.get('Count', 0)
+
+    # External services
+
+    @contextmanager
+    def external_call(self, service):
+        """Time a call to an external service such as SNS or Twilio"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            trace = self._trace()
+            with self.lock:
+                if trace is not None:
+                    trace.external_calls += 1
+                    trace.external_seconds += elapsed
+                self.external_durations[service].observe(elapsed)
+
+    # Exposition
+
+    def _histogram_lines(self, name, histograms, label):
+        lines = [f'# TYPE {name} histogram']
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in zip(DURATION_BUCKETS, histogram.counts):
+                lines.append(f'{name}_bucket{_labels(**{label: key, "le": bound})} {count}')
+            lines.append(f'{name}_bucket{_labels(**{label: key, "le": "+Inf"})} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(**{label: key})} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{_labels(**{label: key})} {histogram.count}')
+        return lines
+
+    def render(self, app):
+        with self.lock:
+            lines = ['# HELP http_requests_total Requests by endpoint, method and status.',
+                     '# TYPE http_requests_total counter']
+            lines += [f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}'
+                      for (endpoint, method, status), count in sorted(self.requests.items())]
+            lines += ['# HELP http_request_duration_seconds Request wall time by endpoint.']
+            lines += self._histogram_lines('http_request_duration_seconds', self.request_durations, 'endpoint')
+            lines += ['# HELP dynamodb_calls_total DynamoDB API calls by endpoint and operation.',
+                      '# TYPE dynamodb_calls_total counter']
+            lines += [f'dynamodb_calls_total{_labels(endpoint=endpoint, operation=operation)} {count}'
+                      for (endpoint, operation), count in sorted(self.dynamodb_calls.items())]
+            lines += ['# HELP dynamodb_call_duration_seconds DynamoDB call latency by operation.']
+            lines += self._histogram_lines('dynamodb_call_duration_seconds', self.dynamodb_durations, 'operation')
+            lines += ['# HELP dynamodb_consumed_capacity_units_total Capacity units consumed by endpoint and table.',
+                      '# TYPE dynamodb_consumed_capacity_units_total counter']
+            lines += [f'dynamodb_consumed_capacity_units_total{_labels(endpoint=endpoint, table=table)} {units}'
+                      for (endpoint, table), units in sorted(self.consumed_capacity.items())]
+            lines += ['# HELP dynamodb_items_scanned_total Items read by Query and Scan before filtering.',
+                      '# TYPE dynamodb_items_scanned_total counter']
+            lines += [f'dynamodb_items_scanned_total{_labels(endpoint=endpoint, operation=operation)} {count}'
+                      for (endpoint, operation), count in sorted(self.items_scanned.items())]
+            lines += ['# HELP dynamodb_items_returned_total Items returned by Query and Scan.',
+                      '# TYPE dynamodb_items_returned_total counter']
+            lines += [f'dynamodb_items_returned_total{_labels(endpoint=endpoint, operation=operation)} {count}'
+                      for (endpoint, operation), count in sorted(self.items_returned.items())]
+            lines += ['# HELP external_call_duration_seconds Latency of calls to external services.']
+            lines += self._histogram_lines('external_call_duration_seconds', self.external_durations, 'service')
+
+        cache = app.model_cache.stats()
+        lines += ['# TYPE model_cache_lookups_total counter']
+        lines += [f'model_cache_lookups_total{_labels(result=result)} {cache[result]}'
+                  for result in ('request_hits', 'shared_hits', 'misses')]
+        if app.notification_queue is not None:
+            queue = app.notification_queue.stats()
+            lines += ['# TYPE notification_queue_depth gauge', f"notification_queue_depth {queue['depth']}",
+                      '# TYPE notifications_total counter']
+            lines += [f'notifications_total{_labels(outcome=outcome)} {queue[outcome]}'
+                      for outcome in ('enqueued', 'sent', 'retried', 'dead_lettered')]
+        stream = app.change_stream.stats()
+        lines += ['# HELP change_stream_lag_seconds Age of the newest change record applied by this process.',
+                  '# TYPE change_stream_lag_seconds gauge', f"change_stream_lag_seconds {stream['lag_seconds']}",
+                  '# TYPE change_stream_records_total counter',
+                  f"change_stream_records_total {stream['records']}",
+                  '# TYPE change_stream_dead_lettered_total counter',
+                  f"change_stream_dead_lettered_total {stream['dead_lettered']}"]
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        if self.token:
+            provided = request.headers.get('Authorization', '')
+            if not provided.startswith('Bearer ') or \
+                    not hmac.compare_digest(provided[len('Bearer '):].encode(), self.token.encode()):
+                abort(403)
+        return Response(self.render(current_app._get_current_object()),
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,184 @@
+import logging
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from boto3.dynamodb.conditions import Attr
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def scan_all(table, **kwargs):
+    """Yield every item of a table, following LastEvaluatedKey across pages"""
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def query_all(table, **kwargs):
+    """Yield every item matched by a query, following LastEvaluatedKey across pages"""
+    while True:
+        response = table.query(**kwargs)
+        for item in response.get('Items', []):
+            yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def ensure_global_index(table_name, index_name, attribute_name, wait=True, poll_seconds=5):
+    """Add a string-keyed GSI to an existing table unless it is already there"""
+    table = current_app.dynamo.table(table_name)
+    indexes = table.global_secondary_indexes or []
+    created = False
+
+    if not any(index['IndexName'] == index_name for index in indexes):
+        logger.info(f"Creating index {index_name} on {table_name}")
+        table.update(
+            AttributeDefinitions=[{'AttributeName': attribute_name, 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{
+                'Create': {
+                    'IndexName': index_name,
+                    'KeySchema': [{'AttributeName': attribute_name, 'KeyType': 'HASH'}],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            }]
+        )
+        created = True
+
+    # DynamoDB backfills a new index in the background; queries against it
+    # are only complete once it reports ACTIVE
+    while wait:
+        table.reload()
+        statuses = [index.get('IndexStatus', 'ACTIVE') for index in table.global_secondary_indexes or []
+                    if index['IndexName'] == index_name]
+        if statuses and statuses[0] == 'ACTIVE':
+            break
+        time.sleep(poll_seconds)
+
+    return created
+
+
+def migrate_user_email_index():
+    """Add the email GSI to the users table and backfill email guard items"""
+    from .models import User, EMAIL_GUARD_PREFIX
+    table_name = current_app.config['DYNAMODB_TABLE_USERS']
+    ensure_global_index(table_name, current_app.config['DYNAMODB_INDEX_USERS_EMAIL'], 'email')
+
+    table = current_app.dynamo.table(table_name)
+    client = current_app.dynamo.client
+    stats = {'users': 0, 'guards_written': 0, 'conflicts': 0}
+
+    for item in scan_all(table, ProjectionExpression='user_id, email'):
+        if item['user_id'].startswith(EMAIL_GUARD_PREFIX) or 'email' not in item:
+            continue
+        stats['users'] += 1
+        guard = User.email_guard_item(item['email'], item['user_id'])
+        try:
+            table.put_item(
+                Item=guard,
+                ConditionExpression='attribute_not_exists(user_id) OR owner_user_id = :owner',
+                ExpressionAttributeValues={':owner': item['user_id']}
+            )
+            stats['guards_written'] += 1
+        except client.exceptions.ConditionalCheckFailedException:
+            # Legacy data can hold several users with one email; keep the
+            # first owner and report the rest for manual cleanup
+            logger.warning(f"Email {item['email']} already claimed, skipping user {item['user_id']}")
+            stats['conflicts'] += 1
+
+    return stats
+
+
+def migrate_account_user_index():
+    """Add the user_id GSI to the accounts table"""
+    table_name = current_app.config['DYNAMODB_TABLE_ACCOUNTS']
+    created = ensure_global_index(table_name, current_app.config['DYNAMODB_INDEX_ACCOUNTS_USER'], 'user_id')
+    # Existing accounts are indexed by DynamoDB itself; only count them so
+    # the operator can compare against the index item count
+    accounts = sum(1 for _ in scan_all(current_app.dynamo.table(table_name), ProjectionExpression='account_id'))
+    return {'index_created': created, 'accounts': accounts}
+
+
+def migrate_ledger():
+    """Backfill the per-account ledger from the transactions table, in cents even for legacy items"""
+    from .models import Transaction
+    source = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_TRANSACTIONS'])
+    ledger = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_LEDGER'])
+    stats = {'transactions': 0, 'entries': 0}
+
+    # Ledger entries are keyed by created_at#transaction_id, so re-running the
+    # backfill overwrites the same items instead of duplicating them
+    with ledger.batch_writer(overwrite_by_pkeys=['account_id', 'entry_key']) as batch:
+        for item in scan_all(source):
+            stats['transactions'] += 1
+            if 'amount_cents' not in item and 'amount' in item:
+                # Not yet through money-to-cents: write the entries in cents
+                # already, the way that migration would have left them
+                item['amount_cents'] = legacy_cents(item.pop('amount'))
+            for entry in Transaction.from_item(item).ledger_items():
+                batch.put_item(Item=entry)
+                stats['entries'] += 1
+
+    return stats
+
+
+def legacy_cents(value):
+    """Cents of an amount stored in currency units, rounded to the nearest cent"""
+    return int((Decimal(value) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def migrate_money_to_cents():
+    """Move stored amounts and balances from currency-unit Decimals to integer cents.
+
+    Balances are moved with ADD guarded on the old value, so credits posted by
+    the new code in the meantime are kept and a concurrent legacy write makes
+    the account retry. Transactions, ledger entries and alerts are immutable
+    and rewritten in place; summaries and compliance state are rebuilt from
+    the migrated ledger. Items already in cents are skipped, so the
+    migration can be re-run.
+    """
+    from . import aggregates, compliance
+    client = current_app.dynamo.client
+    accounts = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+    stats = {'accounts': 0, 'transactions': 0, 'ledger_entries': 0, 'alerts': 0}
+
+    for item in scan_all(accounts, FilterExpression=Attr('balance').exists()):
+        balance = item['balance']
+        while True:
+            try:
+                accounts.update_item(
+                    Key={'account_id': item['account_id']},
+                    UpdateExpression='ADD balance_cents :cents REMOVE #balance',
+                    ConditionExpression='#balance = :balance',
+                    ExpressionAttributeNames={'#balance': 'balance'},
+                    ExpressionAttributeValues={':cents': legacy_cents(balance), ':balance': balance}
+                )
+                stats['accounts'] += 1
+                break
+            except client.exceptions.ConditionalCheckFailedException:
+                current = accounts.get_item(Key={'account_id': item['account_id']},
+                                            ConsistentRead=True).get('Item') or {}
+                if 'balance' not in current:
+                    break
+                balance = current['balance']
+
+    for table_name, keys, stat in ((current_app.config['DYNAMODB_TABLE_TRANSACTIONS'], ['transaction_id'],
+                                    'transactions'),
+                                   (current_app.config['DYNAMODB_TABLE_LEDGER'], ['account_id', 'entry_key'],
+                                    'ledger_entries'),
+                                   (current_app.config['DYNAMODB_TABLE_ALERTS'], ['account_id', 'alert_key'],
+                                    'alerts')):
+        table = current_app.dynamo.table(table_name)
+        with table.batch_writer(overwrite_by_pkeys=keys) as batch:
+            for item in scan_all(table, FilterExpression=Attr('amount').exists()):
+                item['amount_cents'] = legacy_cents(item.pop('amount'))
+                batch.put_item(Item=item)
+                stats[stat] += 1
+
+    stats['summary_items'] = aggregates.rebuild_all()['summary_items']
+    stats['compliance_accounts'] = compliance.rebuild_all()['accounts']
+    return stats
@@ -1,85 +1,161 @@
 from flask_login import UserMixin
 import boto3
 import uuid
+import json
+import base64
 from datetime import datetime
-from bcrypt import hashpw, checkpw, gensalt
-from decimal import Decimal
+from . import stream
+
+# Partition key prefix of the items that reserve an email in the users table
+EMAIL_GUARD_PREFIX = 'EMAIL#'
+
+
+class EmailAlreadyRegisteredError(Exception):
+    """Raised when registering an email that another user already owns"""
+
+
+class InsufficientFundsError(Exception):
+    """Raised when a debit would take an account balance below zero"""
+
+
+class AccountNotFoundError(Exception):
+    """Raised when updating the balance of an account that does not exist"""
 
 
 class User(UserMixin):
-    def __init__(self, user_id, email, password_hash, name, created_at, phone=None):
+    # UserMixin declares no __slots__, so users keep an (empty) __dict__
+    __slots__ = ('id', 'user_id', 'email', 'password_hash', 'name', 'created_at', 'phone', 'account_id')
+
+    def __init__(self, user_id, email, password_hash, name, created_at, phone=None, account_id=None):
         self.id = user_id
         self.user_id = user_id
         self.email = email
+        # None for users rebuilt from a session principal, which never holds the hash
         self.password_hash = password_hash
         self.name = name
         self.created_at = created_at
         self.phone = phone
+        # Known once a session principal carries it
+        self.account_id = account_id
 
     def check_password(self, password):
-        """Check if the provided password matches the stored hash"""
-        return checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """Check the password on the hashing pool, upgrading a hash made with fewer rounds"""
+        from flask import current_app
+        hasher = current_app.password_hasher
+        if not hasher.verify(password, self.password_hash):
+            return False
+        if hasher.needs_rehash(self.password_hash):
+            try:
+                self.set_password_hash(hasher.hash(password))
+            except Exception as e:
+                current_app.logger.error(f"Failed to rehash password for user {self.user_id}: {e}")
+        return True
+
+    def set_password_hash(self, password_hash):
+        """Replace the stored hash, unless it changed since this user was loaded"""
+        from flask import current_app
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_USERS'])
+        try:
+            table.update_item(
+                Key={'user_id': self.user_id},
+                UpdateExpression='SET password_hash = :new',
+                ConditionExpression='password_hash = :old',
+                ExpressionAttributeValues={':new': password_hash, ':old': self.password_hash}
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        self.password_hash = password_hash
+        current_app.model_cache.invalidate('user', self.user_id)
+        return True
 
     @staticmethod
     def create(email, password, name):
-        """Create a new user"""
+        """Create a new user, claiming the email through a uniqueness guard item"""
         from flask import current_app
         user_id = str(uuid.uuid4())
-        password_hash = hashpw(password.encode('utf-8'), gensalt()).decode('utf-8')
+        password_hash = current_app.password_hasher.hash(password)
         created_at = datetime.utcnow().isoformat()
-        
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_USERS'])
-        table.put_item(Item={
-            'user_id': user_id,
-            'email': email,
-            'password_hash': password_hash,
-            'name': name,
-            'created_at': created_at
-        })
-        
+
+        table_name = current_app.config['DYNAMODB_TABLE_USERS']
+        client = current_app.dynamo.client
+        try:
+            # The user item and the email guard are written together so two
+            # concurrent registrations can never both claim the same email
+            client.transact_write_items(TransactItems=[
+                {'Put': {
+                    'TableName': table_name,
+                    'Item': {
+                        'user_id': user_id,
+                        'email': email,
+                        'password_hash': password_hash,
+                        'name': name,
+                        'created_at': created_at
+                    },
+                    'ConditionExpression': 'attribute_not_exists(user_id)'
+                }},
+                {'Put': {
+                    'TableName': table_name,
+                    'Item': User.email_guard_item(email, user_id),
+                    'ConditionExpression': 'attribute_not_exists(user_id)'
+                }}
+            ])
+        except client.exceptions.TransactionCanceledException:
+            raise EmailAlreadyRegisteredError(email)
+
         return User(user_id, email, password_hash, name, created_at)
 
+    @staticmethod
+    def email_guard_item(email, user_id):
+        """Item that reserves an email address for a single user"""
+        return {'user_id': EMAIL_GUARD_PREFIX + email, 'owner_user_id': user_id}
+
+    @staticmethod
+    def from_item(item):
+        return User(
+            item['user_id'],
+            item['email'],
+            item['password_hash'],
+            item['name'],
+            item['created_at'],
+            item.get('phone')
+        )
+
     @staticmethod
     def get(user_id):
         from flask import current_app
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_USERS'])
-        response = table.get_item(Key={'user_id': user_id})
-        if 'Item' in response:
-            item = response['Item']
-            return User(
-                item['user_id'],
-                item['email'],
-                item['password_hash'],
-                item['name'],
-                item['created_at'],
-                item.get('phone')
-            )
-        return None
+
+        def load_item():
+            table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_USERS'])
+            item = table.get_item(Key={'user_id': user_id}).get('Item')
+            # Email guard items share the table but are not users
+            return item if item and 'email' in item else None
+
+        return current_app.model_cache.get('user', user_id, load_item, User.from_item)
 
     @staticmethod
     def get_by_email(email):
+        """Look up a user through the email GSI instead of scanning the table"""
         from flask import current_app
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_USERS'])
-        response = table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('email').eq(email)
+        if not email:
+            return None
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_USERS'])
+        response = table.query(
+            IndexName=current_app.config['DYNAMODB_INDEX_USERS_EMAIL'],
+            KeyConditionExpression=boto3.dynamodb.conditions.Key('email').eq(email),
+            Limit=1
         )
         if response['Items']:
-            item = response['Items'][0]
-            return User(
-                item['user_id'],
-                item['email'],
-                item['password_hash'],
-                item['name'],
-                item['created_at']
-            )
+            return User.from_item(response['Items'][0])
         return None
 
 
 class Account:
-    def __init__(self, account_id, user_id, balance, created_at):
+    __slots__ = ('account_id', 'user_id', 'balance_cents', 'created_at')
+
+    def __init__(self, account_id, user_id, balance_cents, created_at):
         self.account_id = account_id
         self.user_id = user_id
-        self.balance = balance
+        self.balance_cents = balance_cents
         self.created_at = created_at
 
     @staticmethod
@@ -87,121 +163,312 @@ class Account:
         """Create a new account for a user"""
         from flask import current_app
         account_id = str(uuid.uuid4())
-        balance = Decimal('0.0')
         created_at = datetime.utcnow().isoformat()
 
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
         table.put_item(Item={
             'account_id': account_id,
             'user_id': user_id,
-            'balance': balance,
+            'balance_cents': 0,
             'created_at': created_at
         })
 
-        return Account(account_id, user_id, float(balance), created_at)
+        account = Account(account_id, user_id, 0, created_at)
+        Account.invalidate(account_id, user_id)
+        current_app.model_cache.remember('account', account_id, account)
+        current_app.model_cache.remember('account', f'user:{user_id}', account)
+        return account
+
+    @staticmethod
+    def from_item(item):
+        return Account(
+            item['account_id'],
+            item['user_id'],
+            int(item['balance_cents']),
+            item['created_at']
+        )
 
     @staticmethod
     def get(user_id):
-        """Get account for a user"""
+        """Get account for a user through the user_id GSI"""
         from flask import current_app
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
-        response = table.scan(
-            FilterExpression=boto3.dynamodb.conditions.Attr('user_id').eq(user_id)
-        )
-        if response['Items']:
-            item = response['Items'][0]
-            return Account(
-                item['account_id'],
-                item['user_id'],
-                float(item['balance']),
-                item['created_at']
+
+        def load_item():
+            table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+            response = table.query(
+                IndexName=current_app.config['DYNAMODB_INDEX_ACCOUNTS_USER'],
+                KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id),
+                Limit=1
             )
-        return None
+            return response['Items'][0] if response['Items'] else None
+
+        account = current_app.model_cache.get('account', f'user:{user_id}', load_item, Account.from_item)
+        if account:
+            current_app.model_cache.remember('account', account.account_id, account)
+        return account
+
+    @staticmethod
+    def for_user(user):
+        """The signed-in user's account: by key when the session knows its id, else through the GSI"""
+        if getattr(user, 'account_id', None):
+            return Account.get_by_account_id(user.account_id)
+        return Account.get(user.id)
 
     @staticmethod
     def get_by_account_id(account_id):
         """Get account by account_id"""
         from flask import current_app
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
-        response = table.get_item(Key={'account_id': account_id})
-        if 'Item' in response:
-            item = response['Item']
-            return Account(
-                item['account_id'],
-                item['user_id'],
-                float(item['balance']),
-                item['created_at']
-            )
-        return None
+        if not account_id:
+            return None
+
+        def load_item():
+            table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+            return table.get_item(Key={'account_id': account_id}).get('Item')
 
-    def update_balance(self, amount):
-        """Update account balance"""
+        return current_app.model_cache.get('account', account_id, load_item, Account.from_item)
+
+    @staticmethod
+    def invalidate(account_id, user_id=None):
+        """Drop cached copies of an account after its balance changed"""
         from flask import current_app
-        self.balance += amount
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
-        table.update_item(
-            Key={'account_id': self.account_id},
-            UpdateExpression='SET #balance = :balance',
-            ExpressionAttributeNames={'#balance': 'balance'},
-            ExpressionAttributeValues={':balance': Decimal(str(self.balance))}
-        )
+        keys = [account_id] + ([f'user:{user_id}'] if user_id else [])
+        current_app.model_cache.invalidate('account', *keys)
+
+    def update_balance(self, amount_cents):
+        """Atomically add amount_cents to the balance; debits fail unless funds are sufficient"""
+        from flask import current_app
+        table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNTS'])
+        client = current_app.dynamo.client
+
+        # ADD is applied server-side, so concurrent workers never overwrite
+        # each other's changes with a stale balance
+        update_kwargs = {
+            'Key': {'account_id': self.account_id},
+            'UpdateExpression': 'ADD #balance :delta',
+            'ConditionExpression': 'attribute_exists(account_id)',
+            'ExpressionAttributeNames': {'#balance': 'balance_cents'},
+            'ExpressionAttributeValues': {':delta': amount_cents},
+            'ReturnValues': 'ALL_NEW'
+        }
+        if amount_cents < 0:
+            update_kwargs['ConditionExpression'] += ' AND #balance >= :required'
+            update_kwargs['ExpressionAttributeValues'][':required'] = -amount_cents
+
+        try:
+            response = table.update_item(**update_kwargs)
+        except client.exceptions.ConditionalCheckFailedException:
+            if amount_cents < 0:
+                raise InsufficientFundsError(self.account_id)
+            raise AccountNotFoundError(self.account_id)
+
+        self.balance_cents = int(response['Attributes']['balance_cents'])
+        Account.invalidate(self.account_id, self.user_id)
+        current_app.model_cache.remember('account', self.account_id, self)
+        current_app.model_cache.remember('account', f'user:{self.user_id}', self)
+        return self.balance_cents
+
+
+# Ledger attributes a Transaction is built from; fast-path reads project to these
+TRANSACTION_ATTRIBUTES = ('transaction_id', 'from_account_id', 'to_account_id', 'amount_cents',
+                          'transaction_type', 'description', 'created_at')
 
 
 class Transaction:
-    def __init__(self, transaction_id, from_account_id, to_account_id, amount, transaction_type, description, created_at):
+    __slots__ = TRANSACTION_ATTRIBUTES
+
+    def __init__(self, transaction_id, from_account_id, to_account_id, amount_cents, transaction_type, description,
+                 created_at):
         self.transaction_id = transaction_id
         self.from_account_id = from_account_id
         self.to_account_id = to_account_id
-        self.amount = amount
+        self.amount_cents = amount_cents
         self.transaction_type = transaction_type
         self.description = description
         self.created_at = created_at
 
+    @property
+    def entry_key(self):
+        """Ledger sort key; ISO timestamps sort chronologically as strings"""
+        return f"{self.created_at}#{self.transaction_id}"
+
+    def to_item(self):
+        return {
+            'transaction_id': self.transaction_id,
+            'from_account_id': self.from_account_id,
+            'to_account_id': self.to_account_id,
+            'amount_cents': self.amount_cents,
+            'transaction_type': self.transaction_type,
+            'description': self.description,
+            'created_at': self.created_at
+        }
+
+    def ledger_items(self):
+        """One ledger entry per account touched by the transaction"""
+        account_ids = [self.from_account_id, self.to_account_id]
+        return [
+            dict(self.to_item(), account_id=account_id, entry_key=self.entry_key)
+            for account_id in dict.fromkeys(a for a in account_ids if a)
+        ]
+
+    @staticmethod
+    def from_item(item):
+        return Transaction(
+            item['transaction_id'],
+            item.get('from_account_id'),
+            item.get('to_account_id'),
+            int(item['amount_cents']),
+            item['transaction_type'],
+            item['description'],
+            item['created_at']
+        )
+
     @staticmethod
-    def create(from_account_id, to_account_id, amount, transaction_type, description):
-        """Create a new transaction"""
+    def from_raw_item(item):
+        """Build a Transaction from a low-level client item.
+
+        Skips boto3's TypeDeserializer: strings are taken straight from their
+        'S' slot and the amount is parsed once from its 'N' string as an int
+        rather than going through Decimal. Missing or NULL account ids become None.
+        """
+        from_account_id = item.get('from_account_id')
+        to_account_id = item.get('to_account_id')
+        return Transaction(
+            item['transaction_id']['S'],
+            from_account_id.get('S') if from_account_id else None,
+            to_account_id.get('S') if to_account_id else None,
+            int(item['amount_cents']['N']),
+            item['transaction_type']['S'],
+            item['description']['S'],
+            item['created_at']['S']
+        )
+
+    @staticmethod
+    def create(from_account_id, to_account_id, amount_cents, transaction_type, description):
+        """Create a new transaction, its ledger entries and summary updates (or change record)"""
         from flask import current_app
-        transaction_id = str(uuid.uuid4())
-        created_at = datetime.utcnow().isoformat()
+        transaction = Transaction(str(uuid.uuid4()), from_account_id, to_account_id, int(amount_cents),
+                                  transaction_type, description, datetime.utcnow().isoformat())
 
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_TRANSACTIONS'])
-        table.put_item(Item={
-            'transaction_id': transaction_id,
-            'from_account_id': from_account_id,
-            'to_account_id': to_account_id,
-            'amount': Decimal(str(amount)),
-            'transaction_type': transaction_type,
-            'description': description,
-            'created_at': created_at
-        })
+        transact_items = [{'Put': {
+            'TableName': current_app.config['DYNAMODB_TABLE_TRANSACTIONS'],
+            'Item': transaction.to_item()
+        }}]
+        for item in transaction.ledger_items():
+            transact_items.append({'Put': {
+                'TableName': current_app.config['DYNAMODB_TABLE_LEDGER'],
+                'Item': item
+            }})
+        transact_items.extend(stream.transact_items(transaction))
+        current_app.dynamo.client.transact_write_items(TransactItems=transact_items)
+        stream.after_commit(transaction)
 
-        return Transaction(transaction_id, from_account_id, to_account_id, float(amount), transaction_type, description, created_at)
+        return transaction
 
     @staticmethod
-    def get_transactions_for_account(account_id, limit=100):
-        """Get transactions for an account"""
+    def encode_cursor(last_evaluated_key):
+        """Opaque cursor for a low-level LastEvaluatedKey of the ledger"""
+        if not last_evaluated_key:
+            return None
+        key = {name: value['S'] for name, value in last_evaluated_key.items()}
+        raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """Turn a pagination cursor back into a plain {account_id, entry_key} dict, or None if invalid"""
+        if not cursor:
+            return None
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, UnicodeError):
+            return None
+        if not isinstance(key, dict) or set(key) != {'account_id', 'entry_key'}:
+            return None
+        if not all(isinstance(value, str) for value in key.values()):
+            return None
+        return key
+
+    @staticmethod
+    def ledger_query(account_id, start=None, end=None, newest_first=False, transaction_types=None):
+        """Low-level Query arguments for an account's ledger entries, projected to Transaction fields.
+
+        start and end are ISO dates or timestamps applied by the key
+        condition, so DynamoDB only reads matching entries; a type filter is
+        evaluated server-side.
+        """
         from flask import current_app
-        table = current_app.dynamodb.Table(current_app.config['DYNAMODB_TABLE_TRANSACTIONS'])
-        
-        # Query transactions where from_account_id or to_account_id matches
-        response = table.scan(
-            FilterExpression=(
-                boto3.dynamodb.conditions.Attr('from_account_id').eq(account_id) |
-                boto3.dynamodb.conditions.Attr('to_account_id').eq(account_id)
-            ),
-            Limit=limit
-        )
-        
+        names = {'#account': 'account_id', '#entry': 'entry_key'}
+        values = {':account': {'S': account_id}}
+        condition = '#account = :account'
+        # '~' sorts after every character of created_at#transaction_id
+        if start and end:
+            condition += ' AND #entry BETWEEN :start AND :end'
+            values.update({':start': {'S': start}, ':end': {'S': end + '~'}})
+        elif start:
+            condition += ' AND #entry >= :start'
+            values[':start'] = {'S': start}
+        elif end:
+            condition += ' AND #entry <= :end'
+            values[':end'] = {'S': end + '~'}
+
+        projection = {f'#p{i}': name for i, name in enumerate(TRANSACTION_ATTRIBUTES)}
+        names.update(projection)
+        kwargs = {
+            'TableName': current_app.config['DYNAMODB_TABLE_LEDGER'],
+            'KeyConditionExpression': condition,
+            'ProjectionExpression': ', '.join(projection),
+            'ScanIndexForward': not newest_first
+        }
+        if transaction_types:
+            type_values = {f':type{i}': {'S': name} for i, name in enumerate(transaction_types)}
+            kwargs['FilterExpression'] = f"#type IN ({', '.join(type_values)})"
+            names['#type'] = 'transaction_type'
+            values.update(type_values)
+        kwargs['ExpressionAttributeNames'] = names
+        kwargs['ExpressionAttributeValues'] = values
+        return kwargs
+
+    @staticmethod
+    def get_page(account_id, limit=50, cursor=None):
+        """Get one newest-first page of an account's transactions and the cursor of the next page"""
+        from flask import current_app
+        query_kwargs = Transaction.ledger_query(account_id, newest_first=True)
+        query_kwargs['Limit'] = limit
+        start_key = Transaction.decode_cursor(cursor)
+        if start_key and start_key['account_id'] == account_id:
+            query_kwargs['ExclusiveStartKey'] = {name: {'S': value} for name, value in start_key.items()}
+
+        response = current_app.dynamo.raw_client.query(**query_kwargs)
+        transactions = [Transaction.from_raw_item(item) for item in response.get('Items', [])]
+        return transactions, Transaction.encode_cursor(response.get('LastEvaluatedKey'))
+
+    @staticmethod
+    def iter_range(account_id, start=None, end=None, newest_first=False, transaction_types=None):
+        """Yield an account's transactions, optionally limited to a date range and types.
+
+        Reads the ledger with the low-level client, following
+        LastEvaluatedKey, and builds each Transaction straight from the wire
+        format.
+        """
+        from flask import current_app
+        client = current_app.dynamo.raw_client
+        query_kwargs = Transaction.ledger_query(account_id, start, end, newest_first, transaction_types)
+        while True:
+            response = client.query(**query_kwargs)
+            for item in response.get('Items', []):
+                yield Transaction.from_raw_item(item)
+            if 'LastEvaluatedKey' not in response:
+                return
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def get_transactions_for_account(account_id, limit=100):
+        """Get the newest transactions for an account"""
         transactions = []
-        for item in response.get('Items', []):
-            transactions.append(Transaction(
-                item['transaction_id'],
-                item.get('from_account_id'),
-                item.get('to_account_id'),
-                float(item['amount']),
-                item['transaction_type'],
-                item['description'],
-                item['created_at']
-            ))
-        
+        cursor = None
+        while len(transactions) < limit:
+            page, cursor = Transaction.get_page(account_id, limit - len(transactions), cursor)
+            transactions.extend(page)
+            if not cursor:
+                break
         return transactions
@@ -0,0 +1,52 @@
+"""Money as integer cents.
+
+Amounts and balances are stored, computed and passed around as int cents;
+only parsing user input and formatting for display deal in currency units.
+"""
+from decimal import Decimal, DecimalException
+
+CENTS_PER_UNIT = 100
+# Above this, amounts lose precision in the float64 and int64 analytics arrays
+MAX_SAFE_CENTS = 2 ** 53
+
+
+class InvalidAmountError(ValueError):
+    """Raised for amounts that are not finite numbers with at most two decimals, or are too large"""
+
+
+def parse_cents(value, max_cents=MAX_SAFE_CENTS):
+    """Parse a decimal amount such as '12.5' or 12.5 into 1250 cents, exactly"""
+    try:
+        amount = Decimal(str(value).strip())
+    except (DecimalException, ValueError):
+        raise InvalidAmountError(f"invalid amount {value!r}")
+    if not amount.is_finite():
+        raise InvalidAmountError(f"invalid amount {value!r}")
+    try:
+        cents = amount * CENTS_PER_UNIT
+        whole = cents == cents.to_integral_value()
+    except DecimalException:
+        # Overflow and the like for exponents such as 1e999999
+        raise InvalidAmountError(f"invalid amount {value!r}")
+    if not whole:
+        raise InvalidAmountError(f"amount {value!r} has fractions of a cent")
+    limit = min(max_cents, MAX_SAFE_CENTS)
+    if abs(cents) > limit:
+        raise InvalidAmountError(f"amount {value!r} exceeds the maximum of {format_cents(limit)}")
+    return int(cents)
+
+
+def format_cents(cents, places=2):
+    """'1234.56' for 123456; places=0 rounds to whole units"""
+    if places == 0:
+        return f"{cents / CENTS_PER_UNIT:.0f}"
+    sign = '-' if cents < 0 else ''
+    units, remainder = divmod(abs(int(cents)), CENTS_PER_UNIT)
+    return f"{sign}{units}.{remainder:02d}"
+
+
+def format_money(cents):
+    """'$1,234.56' for messages and alert details"""
+    sign = '-' if cents < 0 else ''
+    units, remainder = divmod(abs(int(cents)), CENTS_PER_UNIT)
+    return f"{sign}${units:,}.{remainder:02d}"
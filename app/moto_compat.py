@@ -0,0 +1,46 @@
+"""Gaps between moto's in-process DynamoDB and the real service.
+
+Only used when create_app runs against moto for local development.
+"""
+import threading
+import zlib
+
+_local = threading.local()
+
+
+def enable_scan_segments():
+    """Honour Segment/TotalSegments in Scan.
+
+    moto ignores both parameters and returns the whole table to every
+    segment, which would make parallel scans count each item once per
+    segment. Items are assigned to segments by a hash of their partition key,
+    as DynamoDB does.
+    """
+    from moto.dynamodb.models import Table
+    from moto.dynamodb.responses import DynamoHandler
+    if getattr(DynamoHandler.scan, 'segmented', False):
+        return
+
+    handler_scan = DynamoHandler.scan
+    all_items = Table.all_items
+
+    def segmented_scan(self):
+        total = self.body.get('TotalSegments')
+        _local.segment = (self.body.get('Segment', 0), total) if total else None
+        try:
+            return handler_scan(self)
+        finally:
+            _local.segment = None
+
+    def segment_items(self):
+        items = all_items(self)
+        segment = getattr(_local, 'segment', None)
+        if not segment:
+            return items
+        index, total = segment
+        return (item for item in items
+                if zlib.crc32(str(item.hash_key.value).encode('utf-8')) % total == index)
+
+    segmented_scan.segmented = True
+    DynamoHandler.scan = segmented_scan
+    Table.all_items = segment_items
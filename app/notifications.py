@@ -1,60 +1,102 @@
-import boto3
 import os
-from flask import current_app
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioException
+import atexit
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from datetime import datetime
 import logging
+from .money import format_money
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
-    def __init__(self, app_config):
-        self.sns_client = None
-        self.twilio_client = None
+    def __init__(self, app_config, metrics=None):
+        self.config = app_config
+        self.metrics = metrics
+        # Clients (and the twilio package) are loaded on first send, not at worker boot
+        self.clients = {}
+        self.lock = threading.Lock()
 
-        # Initialize SNS client for email
-        if app_config.get('ENABLE_EMAIL_NOTIFICATIONS'):
-            try:
-                self.sns_client = boto3.client(
-                    'sns',
-                    region_name=app_config['AWS_REGION'],
-                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-                )
-                logger.info("SNS client initialized for email notifications")
-            except Exception as e:
-                logger.error(f"Failed to initialize SNS client: {e}")
+    def _client(self, name, build):
+        if name not in self.clients:
+            with self.lock:
+                if name not in self.clients:
+                    try:
+                        self.clients[name] = build()
+                    except Exception as e:
+                        logger.error(f"Failed to initialize {name} client: {e}")
+                        self.clients[name] = None
+        return self.clients[name]
 
-        # Initialize Twilio client for SMS
-        if app_config.get('ENABLE_SMS_NOTIFICATIONS'):
-            try:
-                account_sid = app_config.get('TWILIO_ACCOUNT_SID')
-                auth_token = app_config.get('TWILIO_AUTH_TOKEN')
-                if account_sid and auth_token:
-                    self.twilio_client = Client(account_sid, auth_token)
-                    logger.info("Twilio client initialized for SMS notifications")
-                else:
-                    logger.warning("Twilio credentials not configured")
-            except Exception as e:
-                logger.error(f"Failed to initialize Twilio client: {e}")
+    def _build_sns_client(self):
+        import boto3
+        client = boto3.client(
+            'sns',
+            region_name=self.config['AWS_REGION'],
+            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+        )
+        logger.info("SNS client initialized for email notifications")
+        return client
+
+    def _build_twilio_client(self):
+        account_sid = self.config.get('TWILIO_ACCOUNT_SID')
+        auth_token = self.config.get('TWILIO_AUTH_TOKEN')
+        if not (account_sid and auth_token):
+            logger.warning("Twilio credentials not configured")
+            return None
+        from twilio.rest import Client
+        client = Client(account_sid, auth_token)
+        logger.info("Twilio client initialized for SMS notifications")
+        return client
+
+    @property
+    def sns_client(self):
+        if not self.config.get('ENABLE_EMAIL_NOTIFICATIONS'):
+            return None
+        return self._client('SNS', self._build_sns_client)
+
+    @sns_client.setter
+    def sns_client(self, client):
+        self.clients['SNS'] = client
+
+    @property
+    def twilio_client(self):
+        if not self.config.get('ENABLE_SMS_NOTIFICATIONS'):
+            return None
+        return self._client('Twilio', self._build_twilio_client)
+
+    @twilio_client.setter
+    def twilio_client(self, client):
+        self.clients['Twilio'] = client
+
+    def _timed(self, service):
+        return self.metrics.external_call(service) if self.metrics is not None else nullcontext()
 
     def send_sms(self, to_phone, message):
         """Send SMS notification using Twilio"""
-        if not self.twilio_client or not current_app.config.get('ENABLE_SMS_NOTIFICATIONS'):
+        if not self.twilio_client or not self.config.get('ENABLE_SMS_NOTIFICATIONS'):
             logger.info("SMS notifications disabled or not configured")
             return False
 
+        from twilio.base.exceptions import TwilioException
         try:
-            from_number = current_app.config.get('TWILIO_PHONE_NUMBER')
+            from_number = self.config.get('TWILIO_PHONE_NUMBER')
             if not from_number:
                 logger.error("Twilio phone number not configured")
                 return False
 
-            message = self.twilio_client.messages.create(
-                body=message,
-                from_=from_number,
-                to=to_phone
-            )
+            with self._timed('twilio'):
+                message = self.twilio_client.messages.create(
+                    body=message,
+                    from_=from_number,
+                    to=to_phone
+                )
             logger.info(f"SMS sent successfully to {to_phone}")
             return True
         except TwilioException as e:
@@ -66,70 +108,335 @@ class NotificationService:
 
     def send_email(self, to_email, subject, body):
         """Send email notification using AWS SNS"""
-        if not self.sns_client or not current_app.config.get('ENABLE_EMAIL_NOTIFICATIONS'):
+        if not self.sns_client or not self.config.get('ENABLE_EMAIL_NOTIFICATIONS'):
             logger.info("Email notifications disabled or not configured")
             return False
 
         try:
-            topic_arn = current_app.config.get('SNS_TOPIC_ARN')
+            topic_arn = self.config.get('SNS_TOPIC_ARN')
             if not topic_arn:
                 logger.error("SNS topic ARN not configured")
                 return False
 
             # Publish message to SNS topic with email as message attribute
-            response = self.sns_client.publish(
-                TopicArn=topic_arn,
-                Subject=subject,
-                Message=body,
-                MessageAttributes={
-                    'email': {
-                        'DataType': 'String',
-                        'StringValue': to_email
+            with self._timed('sns'):
+                response = self.sns_client.publish(
+                    TopicArn=topic_arn,
+                    Subject=subject,
+                    Message=body,
+                    MessageAttributes={
+                        'email': {
+                            'DataType': 'String',
+                            'StringValue': to_email
+                        }
                     }
-                }
-            )
+                )
             logger.info(f"Email notification published to SNS for {to_email}")
             return True
         except Exception as e:
             logger.error(f"Failed to publish email notification: {e}")
             return False
 
-# Global notification service instance - will be initialized in app factory
-notification_service = None
+    @property
+    def sms_enabled(self):
+        return bool(self.twilio_client and self.config.get('ENABLE_SMS_NOTIFICATIONS'))
 
-def send_transaction_notification(user_email, user_phone, transaction_type, amount, balance=None):
-    """Send notifications for banking transactions"""
+    @property
+    def email_enabled(self):
+        return bool(self.sns_client and self.config.get('ENABLE_EMAIL_NOTIFICATIONS'))
+
+    def send_email_batch(self, messages):
+        """Publish up to 10 email notifications in one SNS PublishBatch call.
+
+        Returns the messages that were not accepted so the caller can retry them.
+        """
+        if not self.email_enabled or not self.config.get('SNS_TOPIC_ARN'):
+            logger.info("Email notifications disabled or not configured")
+            return list(messages)
+
+        entries = [{
+            'Id': str(index),
+            'Subject': message['subject'],
+            'Message': message['body'],
+            'MessageAttributes': {
+                'email': {'DataType': 'String', 'StringValue': message['to']}
+            }
+        } for index, message in enumerate(messages)]
+        try:
+            with self._timed('sns'):
+                response = self.sns_client.publish_batch(
+                    TopicArn=self.config['SNS_TOPIC_ARN'],
+                    PublishBatchRequestEntries=entries
+                )
+        except Exception as e:
+            logger.error(f"Failed to publish email notification batch: {e}")
+            return list(messages)
+
+        failed = [messages[int(entry['Id'])] for entry in response.get('Failed', [])]
+        logger.info(f"Email notification batch published: {len(messages) - len(failed)} sent, {len(failed)} failed")
+        return failed
+
+
+class NotificationQueue:
+    """Bounded in-process queue drained by a pool of sender threads.
+
+    Requests only pay for an enqueue; SMS and email delivery, retries with
+    backoff and SNS batching happen on the workers. A failed message is
+    scheduled for its retry time rather than slept on, so the worker moves
+    on to the next one. Messages that exhaust their retries, or arrive
+    while the queue is full, go to a bounded dead-letter store for
+    inspection.
+    """
+
+    # SNS PublishBatch accepts at most 10 entries
+    EMAIL_BATCH_SIZE = 10
+
+    def __init__(self, service, app_config):
+        self.service = service
+        self.workers = app_config.get('NOTIFICATION_WORKERS', 2)
+        self.max_retries = app_config.get('NOTIFICATION_MAX_RETRIES', 3)
+        self.backoff = app_config.get('NOTIFICATION_RETRY_BACKOFF', 0.5)
+        self.queue = queue.Queue(maxsize=app_config.get('NOTIFICATION_QUEUE_SIZE', 1000))
+        self.dead_letters = deque(maxlen=app_config.get('NOTIFICATION_DEAD_LETTER_SIZE', 1000))
+        self.latencies = {'sms': deque(maxlen=1000), 'email': deque(maxlen=1000)}
+        self.counters = {'enqueued': 0, 'sent': 0, 'retried': 0, 'dead_lettered': 0}
+        # (due, id, message) of messages waiting out their backoff
+        self.retries = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.threads = []
+        self.pid = None
+        self.stopping = False
+
+    def _ensure_started(self):
+        # Threads are started lazily and per process, so a gunicorn master that
+        # preloads the app and forks workers does not hand them dead threads
+        if self.pid == os.getpid() and self.threads:
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.threads:
+                return
+            self.pid = os.getpid()
+            self.stopping = False
+            self.threads = [
+                threading.Thread(target=self._run, name=f'notification-worker-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self.threads:
+                thread.start()
+            atexit.register(self.shutdown)
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def enqueue(self, channel, to, body, subject=None):
+        """Queue an 'sms' or 'email' message without blocking the request"""
+        message = {'id': next(self.ids), 'channel': channel, 'to': to, 'body': body, 'subject': subject,
+                   'attempts': 0}
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            logger.error(f"Notification queue full, dead-lettering {channel} to {to}")
+            self._dead_letter(message, 'queue full')
+            return False
+        self._count('enqueued')
+        return True
+
+    def _dead_letter(self, message, error):
+        self.dead_letters.append(dict(message, error=str(error), failed_at=datetime.utcnow().isoformat()))
+        self._count('dead_lettered')
+
+    def _retry_or_dead_letter(self, message, error):
+        message['attempts'] += 1
+        if message['attempts'] > self.max_retries or self.stopping:
+            logger.error(f"Giving up on {message['channel']} notification to {message['to']}: {error}")
+            self._dead_letter(message, error)
+            return
+        # Full-jitter exponential backoff; a worker requeues it once due
+        due = time.monotonic() + random.uniform(0, self.backoff * (2 ** (message['attempts'] - 1)))
+        with self.lock:
+            heapq.heappush(self.retries, (due, message['id'], message))
+        self._count('retried')
+
+    def _requeue_due(self):
+        """Move retries whose backoff has elapsed back onto the queue; returns seconds until the next one"""
+        now = time.monotonic()
+        due = []
+        with self.lock:
+            while self.retries and self.retries[0][0] <= now:
+                due.append(heapq.heappop(self.retries)[2])
+            wait = self.retries[0][0] - now if self.retries else None
+        for message in due:
+            try:
+                self.queue.put_nowait(message)
+            except queue.Full:
+                self._dead_letter(message, 'queue full')
+        return wait
+
+    def _next_message(self):
+        while True:
+            try:
+                return self.queue.get(timeout=self._requeue_due())
+            except queue.Empty:
+                continue
+
+    def _take_email_batch(self, first):
+        """first plus queued emails up to a batch, and the other messages taken off the queue on the way"""
+        batch = [first]
+        held = []
+        while len(batch) < self.EMAIL_BATCH_SIZE:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            (batch if message and message['channel'] == 'email' else held).append(message)
+        return batch, held
+
+    def _send_sms(self, message):
+        start = time.monotonic()
+        try:
+            sent = self.service.send_sms(message['to'], message['body'])
+        except Exception as e:
+            logger.error(f"Notification worker error: {e}")
+            sent = False
+        if sent:
+            self._record_sent('sms', [message], start)
+        else:
+            self._retry_or_dead_letter(message, 'SMS delivery failed')
+
+    def _send_emails(self, batch):
+        start = time.monotonic()
+        try:
+            if len(batch) == 1:
+                message = batch[0]
+                failed = [] if self.service.send_email(message['to'], message['subject'], message['body']) else batch
+            else:
+                failed = self.service.send_email_batch(batch)
+        except Exception as e:
+            logger.error(f"Notification worker error: {e}")
+            failed = batch
+        failed_ids = {message['id'] for message in failed}
+        self._record_sent('email', [message for message in batch if message['id'] not in failed_ids], start)
+        for message in failed:
+            self._retry_or_dead_letter(message, 'email publish failed')
+
+    def _record_sent(self, channel, messages, start):
+        with self.lock:
+            self.counters['sent'] += len(messages)
+            self.latencies[channel].append(time.monotonic() - start)
+
+    def _run(self):
+        while True:
+            message = self._next_message()
+            if message is None:
+                self.queue.task_done()
+                return
+            taken = [message]
+            stop = False
+            try:
+                if message['channel'] == 'sms':
+                    self._send_sms(message)
+                    continue
+                batch, held = self._take_email_batch(message)
+                taken = batch + held
+                for other in held:
+                    # Hand SMS messages and shutdown sentinels back to the
+                    # pool; if producers filled the queue meanwhile, deal
+                    # with them here rather than block
+                    try:
+                        self.queue.put_nowait(other)
+                    except queue.Full:
+                        if other is None:
+                            stop = True
+                        else:
+                            self._send_sms(other)
+                self._send_emails(batch)
+            except Exception as e:
+                logger.error(f"Notification worker error: {e}")
+            finally:
+                # One task_done per message taken off the queue, whatever happened
+                for _ in taken:
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def shutdown(self, timeout=10):
+        """Drain queued notifications, then stop the workers"""
+        if not self.threads or self.pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while (self.queue.unfinished_tasks or self.retries) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.stopping = True
+        for _ in self.threads:
+            try:
+                self.queue.put(None, timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.threads = []
+        with self.lock:
+            abandoned = [entry[2] for entry in self.retries]
+            self.retries = []
+        for message in abandoned:
+            self._dead_letter(message, 'shutdown before retry')
+
+    def stats(self):
+        """Queue depth, delivery counters and send latency (seconds) per channel"""
+        with self.lock:
+            stats = dict(self.counters, depth=self.queue.qsize(), retry_pending=len(self.retries),
+                         dead_letter_size=len(self.dead_letters))
+            for channel, samples in self.latencies.items():
+                ordered = sorted(samples)
+                stats[f'{channel}_latency_avg'] = sum(ordered) / len(ordered) if ordered else 0.0
+                stats[f'{channel}_latency_p95'] = ordered[int(len(ordered) * 0.95)] if ordered else 0.0
+        return stats
+
+
+def _dispatch(channel, to, body, subject=None):
+    """Send through the app's notification queue, or inline when async delivery is off"""
     from flask import current_app
+    service = current_app.notification_service
+    if channel == 'sms' and not service.sms_enabled:
+        logger.info("SMS notifications disabled or not configured")
+        return False
+    if channel == 'email' and not service.email_enabled:
+        logger.info("Email notifications disabled or not configured")
+        return False
 
+    notification_queue = getattr(current_app, 'notification_queue', None)
+    if notification_queue is not None:
+        return notification_queue.enqueue(channel, to, body, subject)
+    if channel == 'sms':
+        return service.send_sms(to, body)
+    return service.send_email(to, subject, body)
+
+def send_transaction_notification(user_email, user_phone, transaction_type, amount_cents, balance_cents=None):
+    """Send notifications for banking transactions"""
     # Format the message
-    amount_str = f"${amount:.2f}"
+    amount_str = format_money(amount_cents)
     message = f"Your account {transaction_type} of {amount_str} has been processed."
 
-    if balance is not None:
-        message += f" Current balance: ${balance:.2f}"
+    if balance_cents is not None:
+        message += f" Current balance: {format_money(balance_cents)}"
 
     subject = f"Bank Transaction Notification - {transaction_type.title()}"
 
     # Send SMS if enabled and phone provided
     if user_phone:
-        sms_sent = current_app.notification_service.send_sms(user_phone, message)
-        if sms_sent:
-            logger.info(f"SMS notification sent for {transaction_type}")
-        else:
-            logger.warning(f"Failed to send SMS notification for {transaction_type}")
+        if _dispatch('sms', user_phone, message):
+            logger.info(f"SMS notification queued for {transaction_type}")
 
     # Send email if enabled
     if user_email:
-        email_sent = current_app.notification_service.send_email(user_email, subject, message)
-        if email_sent:
-            logger.info(f"Email notification sent for {transaction_type}")
-        else:
-            logger.warning(f"Failed to send email notification for {transaction_type}")
+        if _dispatch('email', user_email, message, subject):
+            logger.info(f"Email notification queued for {transaction_type}")
 
 def send_security_notification(user_email, user_phone, event_type, details=""):
     """Send security-related notifications"""
-    from flask import current_app
-
     message = f"Security Alert: {event_type}"
     if details:
         message += f" - {details}"
@@ -138,16 +445,10 @@ def send_security_notification(user_email, user_phone, event_type, details=""):
 
     # Send SMS for security alerts (high priority)
     if user_phone:
-        sms_sent = current_app.notification_service.send_sms(user_phone, f"SECURITY: {message}")
-        if sms_sent:
-            logger.info(f"Security SMS sent for {event_type}")
-        else:
-            logger.warning(f"Failed to send security SMS for {event_type}")
+        if _dispatch('sms', user_phone, f"SECURITY: {message}"):
+            logger.info(f"Security SMS queued for {event_type}")
 
     # Send email
     if user_email:
-        email_sent = current_app.notification_service.send_email(user_email, subject, message)
-        if email_sent:
-            logger.info(f"Security email sent for {event_type}")
-        else:
-            logger.warning(f"Failed to send security email for {event_type}")
+        if _dispatch('email', user_email, message, subject):
+            logger.info(f"Security email queued for {event_type}")
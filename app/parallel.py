@@ -0,0 +1,52 @@
+"""Run a request's independent DynamoDB lookups concurrently.
+
+A view that needs several items which don't depend on each other (the
+sender's account and both candidate recipients of a transfer, the page
+and summary of a dashboard) waits for one round trip instead of several.
+Calls run on a shared per-process thread pool, each in a copy of the
+caller's context: they see the same request, current_user and flask.g, so
+the request's identity map is shared and their DynamoDB calls count
+towards its metrics.
+"""
+import atexit
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+
+
+class ParallelLookups:
+    def __init__(self, app_config):
+        self.workers = app_config['PARALLEL_LOOKUP_WORKERS']
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pid = None
+
+    def _executor(self):
+        if self.executor is not None and self.pid == os.getpid():
+            return self.executor
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='lookup')
+                self.pid = os.getpid()
+                atexit.register(self.shutdown)
+        return self.executor
+
+    def gather(self, *calls):
+        """Results of calling each function, in order; the first exception raised is re-raised"""
+        if not self.workers or len(calls) < 2:
+            return [call() for call in calls]
+        executor = self._executor()
+        # A context can only be entered by one thread at a time, so each call
+        # gets its own copy
+        futures = [executor.submit(contextvars.copy_context().run, call) for call in calls]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        if self.executor is not None and self.pid == os.getpid():
+            self.executor.shutdown(wait=False)
+
+
+def gather(*calls):
+    return current_app.parallel_lookups.gather(*calls)
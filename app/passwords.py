@@ -0,0 +1,94 @@
+"""bcrypt hashing on a bounded process pool.
+
+A bcrypt check costs tens to hundreds of milliseconds of CPU. Running it on
+the request thread lets a burst of logins occupy every worker, so hashes
+are computed in PASSWORD_HASH_WORKERS helper processes. At most
+PASSWORD_HASH_MAX_PENDING operations may be queued; beyond that callers get
+PasswordHasherBusyError instead of waiting behind the burst.
+
+Hashes made with fewer than BCRYPT_ROUNDS rounds are reported by
+needs_rehash() so they can be upgraded on the next successful login.
+
+The helpers are started with forkserver (spawn where unavailable), which
+imports the entry script in each helper: like any multiprocessing user, a
+script that hashes passwords must keep that work under
+`if __name__ == '__main__'`.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from bcrypt import checkpw, gensalt, hashpw
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when too many password operations are already waiting"""
+
+
+def _hash(password, rounds):
+    return hashpw(password, gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, password_hash):
+    return checkpw(password, password_hash)
+
+
+def hash_rounds(password_hash):
+    """Cost factor of a bcrypt hash ('$2b$12$...' -> 12)"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    def __init__(self, app_config):
+        self.rounds = app_config['BCRYPT_ROUNDS']
+        self.workers = app_config['PASSWORD_HASH_WORKERS']
+        self.timeout = app_config['PASSWORD_HASH_QUEUE_TIMEOUT']
+        self.slots = threading.BoundedSemaphore(app_config['PASSWORD_HASH_MAX_PENDING'])
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+
+    def _executor(self):
+        # Created lazily per process; a pool inherited across a fork is unusable
+        if self.pool is not None and self.pid == os.getpid():
+            return self.pool
+        with self.lock:
+            if self.pool is None or self.pid != os.getpid():
+                # forkserver children start from a clean process instead of
+                # forking this one with its threads and open sockets
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                    context.set_forkserver_preload(['app.passwords'])
+                else:
+                    context = multiprocessing.get_context('spawn')
+                self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self.pid = os.getpid()
+                atexit.register(self.shutdown)
+        return self.pool
+
+    def _run(self, function, *args):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusyError()
+        try:
+            if not self.workers:
+                return function(*args)
+            return self._executor().submit(function, *args).result()
+        finally:
+            self.slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, password_hash):
+        return self._run(_verify, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) < self.rounds
+
+    def shutdown(self):
+        if self.pool is not None and self.pid == os.getpid():
+            self.pool.shutdown(wait=False)
@@ -0,0 +1,121 @@
+"""Login rate limiting.
+
+Each client IP owns a token bucket of `burst` tokens that refills at
+`per_minute` tokens a minute. Buckets live in the LocalStore, so every
+gunicorn worker on a host draws from the same bucket, but each host keeps
+its own: the IP limit applies per host.
+
+Attempts per email are counted in DynamoDB instead, in fixed windows of
+burst / per_minute minutes, so guessing one account's password from many
+hosts or addresses still hits a single limit.
+
+If either store fails the limiter lets the request through rather than
+locking everyone out.
+"""
+import hashlib
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SCHEMA = ('CREATE TABLE IF NOT EXISTS rate_buckets ('
+                  'key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)')
+# Share of calls that also delete buckets idle long enough to be full again
+PRUNE_PROBABILITY = 0.01
+
+
+def hashed(value):
+    """Bucket key part for personal data, so the store never holds raw emails"""
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+
+class TokenBucketLimiter:
+    def __init__(self, store, name, burst, per_minute):
+        self.store = store
+        self.name = name
+        self.burst = float(burst)
+        self.rate = per_minute / 60.0
+        store.add_schema(BUCKETS_SCHEMA)
+
+    def take(self, key, cost=1.0):
+        """Spend tokens from the key's bucket; returns (allowed, seconds until enough tokens)"""
+        bucket_key = f'{self.name}:{key}'
+        now = time.time()
+        try:
+            with self.store.transaction() as connection:
+                row = connection.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?',
+                                         (bucket_key,)).fetchone()
+                tokens = self.burst
+                if row:
+                    tokens = min(self.burst, row[0] + max(0.0, now - row[1]) * self.rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                connection.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                                   (bucket_key, tokens, now))
+                if random.random() < PRUNE_PROBABILITY:
+                    self._prune(connection, now)
+        except Exception as e:
+            logger.error(f"Rate limiter {self.name} unavailable, allowing request: {e}")
+            return True, 0.0
+        retry_after = 0.0 if allowed else (cost - tokens) / self.rate if self.rate else float('inf')
+        return allowed, retry_after
+
+    def _prune(self, connection, now):
+        refill_seconds = self.burst / self.rate if self.rate else 86400
+        connection.execute('DELETE FROM rate_buckets WHERE key LIKE ? AND updated_at < ?',
+                           (f'{self.name}:%', now - refill_seconds))
+
+
+class WindowLimiter:
+    """At most `limit` attempts per key in each fixed window, counted in DynamoDB"""
+
+    def __init__(self, dynamo, table_name, name, limit, window_seconds):
+        self.dynamo = dynamo
+        self.table_name = table_name
+        self.name = name
+        self.limit = limit
+        self.window = max(1, int(window_seconds))
+
+    def take(self, key):
+        """Count an attempt; returns (allowed, seconds until the window resets)"""
+        now = time.time()
+        window = int(now // self.window)
+        resets_at = (window + 1) * self.window
+        try:
+            attempts = self.dynamo.table(self.table_name).update_item(
+                Key={'bucket': f'{self.name}:{key}:{window}'},
+                UpdateExpression='ADD attempts :one SET expires_at = :expires',
+                ExpressionAttributeValues={':one': 1, ':expires': resets_at + self.window},
+                ReturnValues='ALL_NEW'
+            )['Attributes']['attempts']
+        except Exception as e:
+            logger.error(f"Rate limiter {self.name} unavailable, allowing request: {e}")
+            return True, 0.0
+        if attempts <= self.limit:
+            return True, 0.0
+        return False, resets_at - now
+
+
+class LoginLimiter:
+    """Limits login attempts per client IP (on this host) and per email address (across hosts)"""
+
+    def __init__(self, store, dynamo, app_config):
+        self.by_ip = TokenBucketLimiter(store, 'login-ip', app_config['LOGIN_RATE_LIMIT_IP_BURST'],
+                                        app_config['LOGIN_RATE_LIMIT_IP_PER_MINUTE'])
+        burst = app_config['LOGIN_RATE_LIMIT_EMAIL_BURST']
+        per_minute = app_config['LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE']
+        self.by_email = WindowLimiter(dynamo, app_config['DYNAMODB_TABLE_RATE_LIMITS'], 'login-email', burst,
+                                      burst / per_minute * 60 if per_minute else 86400)
+
+    def check(self, ip, email):
+        """Returns 0 when the attempt may proceed, otherwise the seconds to wait"""
+        allowed, retry_after = self.by_ip.take(ip or 'unknown')
+        if not allowed:
+            return retry_after
+        if email:
+            allowed, retry_after = self.by_email.take(hashed(email.strip().lower()))
+            if not allowed:
+                return retry_after
+        return 0.0
@@ -1,10 +1,32 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from ..models import Transaction, Account
-from datetime import datetime, timedelta
+from ..aggregates import AccountSummary
+from ..fraud import Alert
+from ..compliance import ComplianceState, compliance_rules
+from ..export import export_rows, csv_chunks
+from ..parallel import gather
+from datetime import datetime
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def _date_range():
+    """Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD report period; invalid dates are ignored"""
+    bounds = []
+    for name in ('start', 'end'):
+        value = request.args.get(name)
+        try:
+            bounds.append(datetime.strptime(value, '%Y-%m-%d').date().isoformat() if value else None)
+        except ValueError:
+            bounds.append(None)
+    return tuple(bounds)
+
+def _period_batch(account, start, end):
+    """Load an account's transactions for a period into columnar form in one pass"""
+    # numpy is only imported once a custom period is requested, not at worker boot
+    from ..analytics_engine import TransactionBatch
+    return TransactionBatch.from_items(Transaction.iter_range(account.account_id, start, end), account.account_id)
+
 @analytics_bp.route('/analytics')
 @login_required
 def dashboard():
@@ -12,29 +34,28 @@ def dashboard():
     Scenario 1: Real-time Transaction Monitoring
     Sarah, a bank's fraud detection analyst, views alerts for unusual transaction patterns.
     """
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=30)
-
-    account = Account.get(current_user.id)
+    account = Account.for_user(current_user)
+    # Totals come from the running per-account summary, not from rescanning
+    # history; fraud alerts were raised by the rule engine as transactions
+    # were posted. The three reads are independent and run concurrently.
+    summary, alerts, suspicious_count = None, [], 0
     if account:
-        transactions = Transaction.get_transactions_for_account(account.account_id, limit=100)
-    else:
-        transactions = []
+        summary, alerts, suspicious_count = gather(
+            lambda: AccountSummary.get(account.account_id, days=0),
+            lambda: Alert.recent(account.account_id),
+            lambda: Alert.count_since(account.account_id, 30)
+        )
 
-    # Calculate basic metrics
-    total_transactions = len(transactions)
-    total_volume = sum(t.amount for t in transactions if t.transaction_type in ['deposit', 'transfer'])
+    total_transactions = summary.tx_count if summary else 0
+    total_volume_cents = summary.volume_cents if summary else 0
 
-    # Scenario 1: Fraud detection - flag transactions above $10,000 threshold
-    suspicious_transactions = [t for t in transactions if t.amount > 10000]
-    suspicious_count = len(suspicious_transactions)
-
-    # Pass transactions to template for real-time monitoring
     return render_template('analytics.html',
                          total_transactions=total_transactions,
-                         total_volume=total_volume,
+                         total_volume_cents=total_volume_cents,
                          suspicious_transactions=suspicious_count,
-                         transactions=transactions)
+                         large_transactions=summary.large_tx_count if summary else 0,
+                         alerts=alerts,
+                         type_counts=summary.type_counts if summary else {'deposit': 0, 'withdraw': 0, 'transfer': 0})
 
 @analytics_bp.route('/reports')
 @login_required
@@ -44,26 +65,61 @@ def reports():
     John, a financial manager, prepares comprehensive quarterly reports for board meetings.
     The system processes data from DynamoDB using AWS EC2 analytics.
     """
-    account = Account.get(current_user.id)
+    account = Account.for_user(current_user)
     if account:
-        transactions = Transaction.get_transactions_for_account(account.account_id, limit=1000)
-        total_deposits = sum(t.amount for t in transactions if t.transaction_type == 'deposit')
-        total_withdrawals = sum(t.amount for t in transactions if t.transaction_type == 'withdraw')
-        total_transfers = sum(t.amount for t in transactions if t.transaction_type == 'transfer')
-        
+        start, end = _date_range()
+        if start or end:
+            # Custom period: aggregate the period's ledger entries column-wise
+            from .. import analytics_engine
+            totals = analytics_engine.summarize(_period_batch(account, start, end),
+                                                current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS'])
+        else:
+            summary = AccountSummary.get(account.account_id, days=0)
+            totals = {
+                'total_transactions': summary.tx_count,
+                'total_deposits': summary.deposit_cents,
+                'total_withdrawals': summary.withdraw_cents,
+                'total_transfers': summary.transfer_in_cents + summary.transfer_out_cents,
+            }
+        cursor = request.args.get('cursor')
+        page, next_cursor = Transaction.get_page(account.account_id,
+                                                 current_app.config['TRANSACTIONS_PAGE_SIZE'],
+                                                 cursor)
+
         report_data = {
-            'total_transactions': len(transactions),
-            'total_deposits': total_deposits,
-            'total_withdrawals': total_withdrawals,
-            'total_transfers': total_transfers,
-            'current_balance': account.balance,
-            'transactions': transactions[:50]  # Show last 50 transactions
+            'total_transactions': totals['total_transactions'],
+            'total_deposits': totals['total_deposits'],
+            'total_withdrawals': totals['total_withdrawals'],
+            'total_transfers': totals['total_transfers'],
+            'current_balance': account.balance_cents,
+            'transactions': page,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'start': start,
+            'end': end
         }
     else:
         report_data = None
     
     return render_template('reports.html', report_data=report_data)
 
+@analytics_bp.route('/reports/export')
+@login_required
+def export_report():
+    """Stream the account's transaction history for a period as CSV"""
+    account = Account.for_user(current_user)
+    if not account:
+        return Response('No account data available.', status=404)
+    start, end = _date_range()
+    from .. import analytics_engine
+    types = [t for t in request.args.getlist('type') if t in analytics_engine.TYPE_CODES]
+
+    rows = export_rows(account.account_id, start, end, types or None)
+    filename = f"transactions_{start or 'all'}_{end or 'now'}.csv"
+    return Response(stream_with_context(csv_chunks(rows)),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @analytics_bp.route('/compliance')
 @login_required
 def compliance():
@@ -72,36 +128,27 @@ def compliance():
     Lisa, a compliance officer, monitors key compliance metrics in real-time.
     She can drill down into underlying data to identify root causes and initiate corrective actions.
     """
-    account = Account.get(current_user.id)
-    compliance_status = "All metrics within regulatory thresholds."
-    compliance_percentage = 100
-    alerts = []
+    account = Account.for_user(current_user)
+    rules = compliance_rules(current_app.config)
 
     if account:
-        transactions = Transaction.get_transactions_for_account(account.account_id, limit=1000)
-
-        # Scenario 3: Large transaction detection for regulatory monitoring
-        large_transactions = [t for t in transactions if t.amount > 10000]
-        if large_transactions:
-            alerts.append(f"Large transactions detected: {len(large_transactions)} transactions over $10,000")
-            compliance_percentage = 85
-
-        # Scenario 3: Frequent small transactions (potential money laundering - AML check)
-        recent_transactions = [t for t in transactions if (datetime.utcnow() - datetime.fromisoformat(t.created_at.replace('Z', '+00:00'))).days <= 7]
-        if len(recent_transactions) > 50:
-            alerts.append("High transaction frequency detected")
-            compliance_percentage = max(compliance_percentage - 10, 70)
-
-        # Scenario 3: Balance threshold check
-        if account.balance < 0:
-            alerts.append("Negative balance detected")
-            compliance_percentage = 50
-            compliance_status = "Critical compliance issues detected."
-
-        if not alerts:
-            alerts.append("No compliance issues detected.")
+        start, end = _date_range()
+        if start or end:
+            # Drill-down over a period: busiest window found column-wise
+            from .. import analytics_engine
+            batch = _period_batch(account, start, end)
+            state = ComplianceState(account.account_id, large_tx_count=analytics_engine.count_over(
+                batch, current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS']))
+            busiest = analytics_engine.max_window_count(batch, rules['window_days'] * analytics_engine.DAY_SECONDS)
+            compliance_status, compliance_percentage, alerts = state.assess(rules, account.balance_cents, busiest)
+        else:
+            # Counters kept current as transactions post: one item read
+            state = ComplianceState.get(account.account_id)
+            compliance_status, compliance_percentage, alerts = state.assess(rules, account.balance_cents)
     else:
-        alerts.append("No account data available.")
+        compliance_status = "All metrics within regulatory thresholds."
+        compliance_percentage = 100
+        alerts = ["No account data available."]
 
     return render_template('compliance.html',
                          compliance_status=compliance_status,
@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import math
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_user, logout_user, login_required
 from werkzeug.security import check_password_hash
-from ..models import User, Account
+from ..models import User, Account, EmailAlreadyRegisteredError
+from ..passwords import PasswordHasherBusyError
 from ..notifications import send_security_notification
 
 auth_bp = Blueprint('auth', __name__)
@@ -17,7 +19,14 @@ def register():
             flash('Email already registered')
             return redirect(url_for('auth.register'))
 
-        user = User.create(email, password, name)
+        try:
+            user = User.create(email, password, name)
+        except EmailAlreadyRegisteredError:
+            flash('Email already registered')
+            return redirect(url_for('auth.register'))
+        except PasswordHasherBusyError:
+            flash('Registration is busy, please try again in a moment')
+            return render_template('register.html'), 503
         Account.create(user.id)
         flash('Registration successful')
         return redirect(url_for('auth.login'))
@@ -30,10 +39,22 @@ def login():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        limiter = current_app.login_limiter
+        retry_after = limiter.check(request.remote_addr, email) if limiter else 0
+        if retry_after:
+            flash('Too many sign-in attempts, please wait and try again')
+            return render_template('login.html'), 429, {'Retry-After': str(math.ceil(retry_after))}
+
         user = User.get_by_email(email)
-        if user and user.check_password(password):
-            login_user(user)
-            return redirect(url_for('transactions.dashboard'))
+        try:
+            if user and user.check_password(password or ''):
+                login_user(user)
+                account = Account.get(user.id)
+                current_app.session_principals.issue(user, account.account_id if account else None, new_session=True)
+                return redirect(url_for('transactions.dashboard'))
+        except PasswordHasherBusyError:
+            flash('Sign-in is busy, please try again in a moment')
+            return render_template('login.html'), 503, {'Retry-After': '1'}
         flash('Invalid email or password')
 
     return render_template('login.html')
@@ -41,5 +62,6 @@ def login():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    current_app.session_principals.revoke()
     logout_user()
     return redirect(url_for('auth.login'))
@@ -0,0 +1,39 @@
+import hmac
+from flask import Blueprint, request, jsonify, current_app, abort
+from ..ingest import ingest_stream
+
+ingest_bp = Blueprint('ingest', __name__)
+
+FORMATS = {'text/csv': 'csv', 'application/json': 'json',
+           'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl'}
+
+
+def _authorized():
+    """Bulk ingestion is a back-office API guarded by a shared bearer token"""
+    expected = current_app.config.get('INGEST_API_TOKEN')
+    provided = request.headers.get('Authorization', '')
+    if not expected or not provided.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(provided[len('Bearer '):].encode(), expected.encode())
+
+
+@ingest_bp.route('/transactions/import', methods=['POST'])
+def import_transactions():
+    """Ingest a CSV/JSON extract sent as a file upload or as the raw request body"""
+    if not _authorized():
+        abort(403)
+
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        fmt = request.form.get('format') or upload.filename.rsplit('.', 1)[-1].lower()
+    else:
+        stream = request.stream
+        fmt = request.args.get('format') or FORMATS.get(request.mimetype)
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    if fmt not in ('csv', 'json', 'jsonl'):
+        return jsonify({'error': 'unsupported format, use csv, json or jsonl'}), 400
+
+    stats = ingest_stream(stream, fmt, workers=current_app.config['INGEST_WORKERS'])
+    return jsonify(stats)
@@ -1,62 +1,68 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
-from ..models import Account, Transaction, User
+from ..models import Account, Transaction, User, InsufficientFundsError, AccountNotFoundError
 from ..notifications import send_transaction_notification
-from datetime import datetime, timedelta
+from ..services import transfer_funds, DuplicateTransferError
+from ..aggregates import AccountSummary
+from ..money import InvalidAmountError, parse_cents
+from ..parallel import gather
+import uuid
 
 transactions_bp = Blueprint('transactions', __name__)
 
+def _parse_amount(value):
+    """Parse a form amount into cents; None unless it is positive, whole cents and within MAX_AMOUNT_CENTS"""
+    try:
+        amount_cents = parse_cents(value, current_app.config['MAX_AMOUNT_CENTS'])
+    except InvalidAmountError:
+        return None
+    return amount_cents if amount_cents > 0 else None
+
 @transactions_bp.route('/dashboard')
 @login_required
 def dashboard():
     """Real-time dashboard showing account balance and transaction monitoring"""
-    account = Account.get(current_user.id)  # Assuming account_id is user_id for simplicity
+    account = Account.for_user(current_user)
     if not account:
         account = Account.create(current_user.id)
     
-    transactions = Transaction.get_transactions_for_account(account.account_id)
-    
-    # Calculate monthly volume for the last 30 days
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    monthly_transactions = []
-    monthly_volume = 0
-    
-    for t in transactions:
-        try:
-            tx_date = datetime.fromisoformat(t.created_at.replace('Z', '+00:00'))
-            if tx_date >= thirty_days_ago:
-                monthly_transactions.append(t)
-                if t.transaction_type in ['deposit', 'transfer']:
-                    monthly_volume += t.amount
-        except:
-            # Handle any date parsing issues
-            monthly_transactions.append(t)
-            if t.transaction_type in['deposit', 'transfer']:
-                monthly_volume += t.amount
-    
+    cursor = request.args.get('cursor')
+    page_size = current_app.config['TRANSACTIONS_PAGE_SIZE']
+    # The history page and the rolling 30-day volume (from the precomputed
+    # daily buckets) are fetched concurrently
+    (transactions, next_cursor), summary = gather(
+        lambda: Transaction.get_page(account.account_id, page_size, cursor),
+        lambda: AccountSummary.get(account.account_id, days=30)
+    )
+    monthly_volume = summary.volume_since(30)
+
     return render_template('dashboard.html', 
                          account=account, 
                          transactions=transactions,
-                         monthly_volume=monthly_volume)
+                         monthly_volume=monthly_volume,
+                         cursor=cursor,
+                         next_cursor=next_cursor)
 
 @transactions_bp.route('/deposit', methods=['GET', 'POST'])
 @login_required
 def deposit():
     if request.method == 'POST':
-        amount = float(request.form.get('amount'))
-        account = Account.get(current_user.id)
+        amount_cents = _parse_amount(request.form.get('amount'))
+        if amount_cents is None:
+            flash('Please enter a positive amount', 'warning')
+            return render_template('deposit.html')
+        account = Account.for_user(current_user)
         if account:
-            account.update_balance(amount)
-            Transaction.create(None, account.account_id, amount, 'deposit', 'Deposit')
+            account.update_balance(amount_cents)
+            Transaction.create(None, account.account_id, amount_cents, 'deposit', 'Deposit')
 
             # Send notification
-            user = User.get(current_user.id)
             send_transaction_notification(
-                user_email=user.email,
-                user_phone=user.phone,
+                user_email=current_user.email,
+                user_phone=current_user.phone,
                 transaction_type='deposit',
-                amount=amount,
-                balance=account.balance
+                amount_cents=amount_cents,
+                balance_cents=account.balance_cents
             )
 
             flash('Deposit successful', 'success')
@@ -67,20 +73,26 @@ def deposit():
 @login_required
 def withdraw():
     if request.method == 'POST':
-        amount = float(request.form.get('amount'))
-        account = Account.get(current_user.id)
-        if account and account.balance >= amount:
-            account.update_balance(-amount)
-            Transaction.create(account.account_id, None, amount, 'withdraw', 'Withdrawal')
+        amount_cents = _parse_amount(request.form.get('amount'))
+        if amount_cents is None:
+            flash('Please enter a positive amount', 'warning')
+            return render_template('withdraw.html')
+        account = Account.for_user(current_user)
+        if account:
+            try:
+                account.update_balance(-amount_cents)
+            except InsufficientFundsError:
+                flash('Insufficient funds', 'warning')
+                return render_template('withdraw.html')
+            Transaction.create(account.account_id, None, amount_cents, 'withdraw', 'Withdrawal')
 
             # Send notification
-            user = User.get(current_user.id)
             send_transaction_notification(
-                user_email=user.email,
-                user_phone=user.phone,
+                user_email=current_user.email,
+                user_phone=current_user.phone,
                 transaction_type='withdrawal',
-                amount=amount,
-                balance=account.balance
+                amount_cents=amount_cents,
+                balance_cents=account.balance_cents
             )
 
             flash('Withdrawal successful', 'success')
@@ -92,35 +104,44 @@ def withdraw():
 @login_required
 def transfer():
     if request.method == 'POST':
-        recipient_input = request.form.get('to_account_id').strip()
-        amount = float(request.form.get('amount'))
-        from_account = Account.get(current_user.id)
-
-        # Try to find the recipient account
-        to_account = None
+        recipient_input = (request.form.get('to_account_id') or '').strip()
+        amount_cents = _parse_amount(request.form.get('amount'))
+        if amount_cents is None:
+            flash('Please enter a positive amount', 'warning')
+            return render_template('transfer.html', idempotency_token=str(uuid.uuid4()))
+        user = current_user._get_current_object()
 
-        # First, try to find by account_id
-        to_account = Account.get_by_account_id(recipient_input)
-
-        # If not found by account_id, try to find by email
-        if not to_account:
+        def account_of_email():
             recipient_user = User.get_by_email(recipient_input)
-            if recipient_user:
-                to_account = Account.get(recipient_user.id)
+            return Account.get(recipient_user.id) if recipient_user else None
+
+        # The sender's account and the recipient, looked up both as an
+        # account_id and as an email, are resolved concurrently; an account_id
+        # match takes precedence
+        from_account, account_by_id, account_by_email = gather(
+            lambda: Account.for_user(user),
+            lambda: Account.get_by_account_id(recipient_input),
+            account_of_email
+        )
+        to_account = account_by_id or account_by_email
 
-        if from_account and to_account and from_account.balance >= amount and from_account.account_id != to_account.account_id:
-            from_account.update_balance(-amount)
-            to_account.update_balance(amount)
-            Transaction.create(from_account.account_id, to_account.account_id, amount, 'transfer', 'Transfer')
+        if from_account and to_account and from_account.account_id != to_account.account_id:
+            try:
+                transfer_funds(from_account, to_account, amount_cents, request.form.get('idempotency_token'))
+            except DuplicateTransferError:
+                flash('Transfer already processed', 'info')
+                return redirect(url_for('transactions.dashboard'))
+            except (InsufficientFundsError, AccountNotFoundError):
+                flash('Transfer failed - please check recipient email/account ID and ensure sufficient funds', 'danger')
+                return render_template('transfer.html', idempotency_token=str(uuid.uuid4()))
 
             # Send notification for the transfer
-            user = User.get(current_user.id)
             send_transaction_notification(
-                user_email=user.email,
-                user_phone=user.phone,
+                user_email=current_user.email,
+                user_phone=current_user.phone,
                 transaction_type='transfer',
-                amount=amount,
-                balance=from_account.balance
+                amount_cents=amount_cents,
+                balance_cents=from_account.balance_cents
             )
 
             flash('Transfer successful', 'success')
@@ -129,4 +150,4 @@ def transfer():
             flash('Cannot transfer to your own account', 'warning')
         else:
             flash('Transfer failed - please check recipient email/account ID and ensure sufficient funds', 'danger')
-    return render_template('transfer.html')
+    return render_template('transfer.html', idempotency_token=str(uuid.uuid4()))
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce as fold
+from boto3.dynamodb.conditions import Attr
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+class ScanProgress:
+    """Thread-safe counters for a running parallel scan"""
+
+    def __init__(self, total_segments):
+        self.total_segments = total_segments
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.scanned = 0
+        self.returned = 0
+        self.segments_done = 0
+
+    def record_page(self, response):
+        with self.lock:
+            self.pages += 1
+            self.scanned += response.get('ScannedCount', 0)
+            self.returned += response.get('Count', 0)
+
+    def record_segment(self):
+        with self.lock:
+            self.segments_done += 1
+
+    def snapshot(self):
+        with self.lock:
+            seconds = time.perf_counter() - self.started
+            return {
+                'segments': self.total_segments,
+                'segments_done': self.segments_done,
+                'pages': self.pages,
+                'scanned': self.scanned,
+                'returned': self.returned,
+                'seconds': round(seconds, 3),
+                'items_per_second': round(self.scanned / seconds, 1) if seconds else 0.0
+            }
+
+
+class ParallelScan:
+    """Scan a table as independent segments on a thread pool and reduce the results.
+
+    Each segment follows LastEvaluatedKey on its own, so the table is read
+    exactly once however many segments it is split into. map_page turns one
+    page of items into a partial result and reduce combines two partial
+    results; both must be safe to call from worker threads.
+    """
+
+    def __init__(self, table_name, segments=None, workers=None, projection=None,
+                 filter_expression=None, page_size=None, on_progress=None):
+        config = current_app.config
+        # Worker threads have no app context, so resolve the client up front
+        self.client = current_app.dynamo.client
+        self.table_name = table_name
+        self.segments = segments or config['SCAN_SEGMENTS']
+        self.workers = workers or config['SCAN_WORKERS']
+        self.projection = projection
+        self.filter_expression = filter_expression
+        self.page_size = page_size
+        self.on_progress = on_progress
+        self.progress = ScanProgress(self.segments)
+
+    def _scan_kwargs(self, segment):
+        kwargs = {'TableName': self.table_name}
+        if self.segments > 1:
+            kwargs.update(Segment=segment, TotalSegments=self.segments)
+        if self.projection:
+            # Placeholders keep attribute names such as "type" clear of
+            # DynamoDB's reserved words
+            names = {f'#p{i}': name for i, name in enumerate(self.projection)}
+            kwargs['ProjectionExpression'] = ', '.join(names)
+            kwargs['ExpressionAttributeNames'] = names
+        if self.filter_expression is not None:
+            kwargs['FilterExpression'] = self.filter_expression
+        if self.page_size:
+            kwargs['Limit'] = self.page_size
+        return kwargs
+
+    def _scan_segment(self, segment, map_page, reduce, initial):
+        kwargs = self._scan_kwargs(segment)
+        result = initial()
+        while True:
+            response = self.client.scan(**kwargs)
+            result = reduce(result, map_page(response.get('Items', [])))
+            self.progress.record_page(response)
+            done = 'LastEvaluatedKey' not in response
+            if done:
+                self.progress.record_segment()
+            if self.on_progress:
+                self.on_progress(self.progress.snapshot())
+            if done:
+                return result
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def run(self, map_page, reduce, initial):
+        """Scan every segment and return the reduced result.
+
+        initial is called for a fresh starting value per segment, so mutable
+        accumulators are never shared between threads.
+        """
+        with ThreadPoolExecutor(max_workers=min(self.workers, self.segments)) as pool:
+            futures = [pool.submit(self._scan_segment, segment, map_page, reduce, initial)
+                       for segment in range(self.segments)]
+            results = [future.result() for future in as_completed(futures)]
+        stats = self.progress.snapshot()
+        logger.info(f"Scanned {stats['scanned']} items from {self.table_name} in "
+                    f"{self.segments} segments ({stats['items_per_second']} items/s)")
+        return fold(reduce, results, initial())
+
+
+def _concat(left, right):
+    left.extend(right)
+    return left
+
+
+def _merge_days(left, right):
+    for day, (count, amount_cents) in right.items():
+        totals = left[day]
+        totals[0] += count
+        totals[1] += amount_cents
+    return left
+
+
+def _day_totals():
+    return defaultdict(lambda: [0, 0])
+
+
+def large_transactions(threshold_cents=None, **options):
+    """Every transaction above threshold_cents, newest first"""
+    if threshold_cents is None:
+        threshold_cents = current_app.config['LARGE_TRANSACTION_THRESHOLD_CENTS']
+    scan = ParallelScan(
+        current_app.config['DYNAMODB_TABLE_TRANSACTIONS'],
+        projection=['transaction_id', 'from_account_id', 'to_account_id', 'amount_cents', 'transaction_type',
+                    'created_at'],
+        filter_expression=Attr('amount_cents').gt(threshold_cents),
+        **options
+    )
+    items = scan.run(list, _concat, list)
+    items.sort(key=lambda item: item['created_at'], reverse=True)
+    return items, scan.progress.snapshot()
+
+
+def negative_balances(**options):
+    """Every account whose balance is below zero, most overdrawn first"""
+    scan = ParallelScan(
+        current_app.config['DYNAMODB_TABLE_ACCOUNTS'],
+        projection=['account_id', 'user_id', 'balance_cents'],
+        filter_expression=Attr('balance_cents').lt(0),
+        **options
+    )
+    items = scan.run(list, _concat, list)
+    items.sort(key=lambda item: item['balance_cents'])
+    return items, scan.progress.snapshot()
+
+
+def daily_volume(**options):
+    """Transaction count and cents per day across all accounts, oldest day first"""
+    def map_page(items):
+        totals = _day_totals()
+        for item in items:
+            day = totals[item['created_at'][:10]]
+            day[0] += 1
+            day[1] += int(item['amount_cents'])
+        return totals
+
+    scan = ParallelScan(
+        current_app.config['DYNAMODB_TABLE_TRANSACTIONS'],
+        projection=['created_at', 'amount_cents'],
+        **options
+    )
+    totals = scan.run(map_page, _merge_days, _day_totals)
+    days = [{'day': day, 'count': count, 'amount_cents': amount_cents}
+            for day, (count, amount_cents) in sorted(totals.items())]
+    return days, scan.progress.snapshot()
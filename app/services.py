@@ -0,0 +1,102 @@
+import uuid
+from datetime import datetime
+from flask import current_app
+from . import stream
+from .models import Account, Transaction, InsufficientFundsError, AccountNotFoundError
+
+# Namespace for transaction ids derived from client idempotency tokens
+TRANSFER_NAMESPACE = uuid.UUID('6f1c2a52-4d0e-4b8e-9a55-2f0f3f1f7c11')
+
+
+class DuplicateTransferError(Exception):
+    """Raised when a transfer with the same idempotency token was already posted"""
+
+
+def transfer_funds(from_account, to_account, amount_cents, idempotency_token=None, description='Transfer'):
+    """Debit, credit, record and summarise a transfer in a single TransactWriteItems call.
+
+    The idempotency token doubles as DynamoDB's ClientRequestToken and as the
+    seed of the transaction id, so a retried form post can never move the
+    money twice: within DynamoDB's ten minute token window the retry is
+    rejected as a duplicate request, and after it the conditional put of the
+    transaction record fails.
+    """
+    token = idempotency_token or str(uuid.uuid4())
+    transaction = Transaction(
+        str(uuid.uuid5(TRANSFER_NAMESPACE, f"{from_account.account_id}:{token}")),
+        from_account.account_id,
+        to_account.account_id,
+        int(amount_cents),
+        'transfer',
+        description,
+        datetime.utcnow().isoformat()
+    )
+    accounts_table = current_app.config['DYNAMODB_TABLE_ACCOUNTS']
+
+    transact_items = [
+        {'Update': {
+            'TableName': accounts_table,
+            'Key': {'account_id': from_account.account_id},
+            'UpdateExpression': 'ADD #balance :debit',
+            'ConditionExpression': 'attribute_exists(account_id) AND #balance >= :amount',
+            'ExpressionAttributeNames': {'#balance': 'balance_cents'},
+            'ExpressionAttributeValues': {':debit': -transaction.amount_cents, ':amount': transaction.amount_cents}
+        }},
+        {'Update': {
+            'TableName': accounts_table,
+            'Key': {'account_id': to_account.account_id},
+            'UpdateExpression': 'ADD #balance :credit',
+            'ConditionExpression': 'attribute_exists(account_id)',
+            'ExpressionAttributeNames': {'#balance': 'balance_cents'},
+            'ExpressionAttributeValues': {':credit': transaction.amount_cents}
+        }},
+        {'Put': {
+            'TableName': current_app.config['DYNAMODB_TABLE_TRANSACTIONS'],
+            'Item': transaction.to_item(),
+            'ConditionExpression': 'attribute_not_exists(transaction_id)'
+        }}
+    ]
+    for item in transaction.ledger_items():
+        transact_items.append({'Put': {
+            'TableName': current_app.config['DYNAMODB_TABLE_LEDGER'],
+            'Item': item
+        }})
+    transact_items.extend(stream.transact_items(transaction))
+
+    client = current_app.dynamo.client
+    try:
+        client.transact_write_items(TransactItems=transact_items, ClientRequestToken=token[:36])
+    except client.exceptions.IdempotentParameterMismatchException:
+        # Same token within the token window but a new timestamp: a retry
+        raise DuplicateTransferError(token)
+    except client.exceptions.TransactionCanceledException as e:
+        reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        if len(reasons) > 2 and reasons[2] == 'ConditionalCheckFailed':
+            raise DuplicateTransferError(token)
+        if reasons and reasons[0] == 'ConditionalCheckFailed':
+            raise InsufficientFundsError(from_account.account_id)
+        if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+            raise AccountNotFoundError(to_account.account_id)
+        raise
+
+    # TransactWriteItems returns no attributes, and other postings may have
+    # moved either balance since it was read, so read both back
+    request = {accounts_table: {'Keys': [{'account_id': from_account.account_id},
+                                         {'account_id': to_account.account_id}],
+                                'ProjectionExpression': 'account_id, balance_cents',
+                                'ConsistentRead': True}}
+    balances = {}
+    while request:
+        response = current_app.dynamo.resource.batch_get_item(RequestItems=request)
+        balances.update((item['account_id'], int(item['balance_cents']))
+                        for item in response['Responses'].get(accounts_table, []))
+        request = response.get('UnprocessedKeys')
+    from_account.balance_cents = balances.get(from_account.account_id, from_account.balance_cents)
+    to_account.balance_cents = balances.get(to_account.account_id, to_account.balance_cents)
+    for account in (from_account, to_account):
+        Account.invalidate(account.account_id, account.user_id)
+        # Fresh as of the commit, so the post-commit hooks can reuse them
+        current_app.model_cache.remember('account', account.account_id, account)
+        current_app.model_cache.remember('account', f'user:{account.user_id}', account)
+    stream.after_commit(transaction)
+    return transaction
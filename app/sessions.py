@@ -0,0 +1,95 @@
+"""Server-side session principals, so authenticated requests skip the users table.
+
+At login the user's profile and account_id are stored in the LocalStore
+under a random session id kept in the signed session cookie. Flask-Login's
+user loader rebuilds current_user from that row. A row older than
+SESSION_PRINCIPAL_TTL is refreshed from DynamoDB on the next request.
+
+Logging out, or revoke_user(), marks rows revoked rather than deleting
+them, so a copy of the cookie replayed later finds the revocation instead
+of a miss it would refresh from. Revocations are kept for the session
+cookie's lifetime. Like the store itself, they apply to the host that
+handled them.
+"""
+import json
+import random
+import secrets
+import time
+from flask import session
+
+SESSION_KEY = '_principal'
+PRINCIPALS_SCHEMA = ('CREATE TABLE IF NOT EXISTS session_principals ('
+                     'session_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, principal TEXT NOT NULL, '
+                     'revoked INTEGER NOT NULL DEFAULT 0, expires_at REAL NOT NULL)')
+PRINCIPALS_USER_INDEX = 'CREATE INDEX IF NOT EXISTS session_principals_user ON session_principals (user_id)'
+PRUNE_PROBABILITY = 0.01
+
+
+class SessionPrincipals:
+    def __init__(self, store, app_config, revocation_seconds):
+        self.store = store
+        self.ttl = app_config['SESSION_PRINCIPAL_TTL']
+        self.revocation_seconds = revocation_seconds
+        store.add_schema(PRINCIPALS_SCHEMA, PRINCIPALS_USER_INDEX)
+
+    def issue(self, user, account_id=None, new_session=False):
+        """Store the principal for the current session; logins always start a new session id"""
+        session_id = (not new_session and session.get(SESSION_KEY)) or secrets.token_urlsafe(32)
+        principal = json.dumps({
+            'user_id': user.user_id,
+            'email': user.email,
+            'name': user.name,
+            'created_at': user.created_at,
+            'phone': user.phone,
+            'account_id': account_id,
+        })
+        now = time.time()
+        with self.store.transaction() as connection:
+            connection.execute('INSERT OR REPLACE INTO session_principals '
+                               '(session_id, user_id, principal, revoked, expires_at) VALUES (?, ?, ?, 0, ?)',
+                               (session_id, user.user_id, principal, now + self.ttl))
+            if random.random() < PRUNE_PROBABILITY:
+                # Stale rows stay for the cookie's lifetime so revoke_user() still finds them
+                connection.execute('DELETE FROM session_principals WHERE (revoked = 1 AND expires_at < ?) '
+                                   'OR expires_at < ?', (now, now - self.revocation_seconds))
+        session[SESSION_KEY] = session_id
+        user.account_id = account_id
+        return session_id
+
+    def load_user(self, user_id):
+        """current_user for the session: from the store, refreshed from DynamoDB when missing or stale"""
+        from .models import Account, User
+        session_id = session.get(SESSION_KEY)
+        if session_id:
+            row = self.store.connection().execute(
+                'SELECT user_id, principal, revoked, expires_at FROM session_principals WHERE session_id = ?',
+                (session_id,)).fetchone()
+            if row and row[0] == user_id:
+                if row[2]:
+                    return None
+                if row[3] > time.time():
+                    principal = json.loads(row[1])
+                    return User(principal['user_id'], principal['email'], None, principal['name'],
+                                principal['created_at'], principal['phone'], principal['account_id'])
+
+        user = User.get(user_id)
+        if user is not None:
+            account = Account.get(user_id)
+            self.issue(user, account.account_id if account else None)
+        return user
+
+    def revoke(self):
+        """Revoke the current session's principal (at logout)"""
+        session_id = session.pop(SESSION_KEY, None)
+        if session_id:
+            with self.store.transaction() as connection:
+                connection.execute('UPDATE session_principals SET revoked = 1, expires_at = ? WHERE session_id = ?',
+                                   (time.time() + self.revocation_seconds, session_id))
+
+    def revoke_user(self, user_id):
+        """Revoke every session of a user on this host; returns how many were active"""
+        with self.store.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE session_principals SET revoked = 1, expires_at = ? WHERE user_id = ? AND revoked = 0',
+                (time.time() + self.revocation_seconds, user_id))
+            return cursor.rowcount
@@ -0,0 +1,395 @@
+"""Change stream: a transaction log tailed by a consumer that maintains read models.
+
+Every posting puts a change record into the change log in the same
+TransactWriteItems call as the transaction itself, so the log never misses
+or invents a posting. With READ_MODEL_UPDATES=stream the request stops
+there; ChangeStreamConsumer later applies the account summaries, fraud rules
+and compliance state and invalidates cached summaries.
+
+Records are spread over CHANGE_LOG_SHARDS partitions and sorted by
+recorded_at#transaction_id within each, recorded_at being when the record
+was written. The consumer keeps one checkpoint per shard and advances it
+only after a record's handlers succeeded, so delivery is at-least-once;
+every handler recognises a record it has already applied.
+
+A write that is retried or slow to commit can land behind a checkpoint that
+has already moved on. Every CHANGE_STREAM_SWEEP_SECONDS the consumer
+re-reads the last CHANGE_STREAM_LOOKBACK_SECONDS before each checkpoint and
+applies whatever it has not applied itself. A record whose handlers fail
+CHANGE_STREAM_MAX_ATTEMPTS times is moved to a dead-letter item so it no
+longer holds up its shard.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from boto3.dynamodb.conditions import Key
+from flask import current_app
+from . import aggregates, compliance
+from .fraud import epoch_seconds
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PREFIX = 'CHECKPOINT#'
+DEAD_LETTER_PREFIX = 'DEAD_LETTER#'
+# Sorts before every sequence (ISO timestamps start with a digit)
+START_POSITION = '0'
+
+
+def stream_enabled(app_config=None):
+    return (app_config or current_app.config)['READ_MODEL_UPDATES'] == 'stream'
+
+
+def shard_of(transaction_id, shards):
+    return f"SHARD#{zlib.crc32(transaction_id.encode('utf-8')) % shards}"
+
+
+def change_record(transaction, app_config):
+    """The change log item for a newly posted transaction.
+
+    Records are ordered by when they are written rather than by created_at,
+    so back-dated postings such as bulk-ingested history still land ahead
+    of the consumer's checkpoints.
+    """
+    recorded_at = datetime.utcnow().isoformat()
+    expires_at = int(epoch_seconds(recorded_at)) + app_config['CHANGE_LOG_RETENTION_DAYS'] * 86400
+    return dict(transaction.to_item(),
+                shard=shard_of(transaction.transaction_id, app_config['CHANGE_LOG_SHARDS']),
+                sequence=f"{recorded_at}#{transaction.transaction_id}",
+                recorded_at=recorded_at,
+                event_name='INSERT',
+                expires_at=expires_at)
+
+
+def sequence_seconds(sequence):
+    """Epoch seconds of the recorded_at a sequence starts with"""
+    return epoch_seconds(sequence.split('#', 1)[0])
+
+
+def transact_items(transaction):
+    """Entries a posting adds to its TransactWriteItems call to keep read models current"""
+    if stream_enabled():
+        return [{'Put': {
+            'TableName': current_app.config['DYNAMODB_TABLE_CHANGE_LOG'],
+            'Item': change_record(transaction, current_app.config)
+        }}]
+    return aggregates.transact_updates(transaction)
+
+
+def notify_consumer():
+    """Wake this process's consumer thread, when it runs one, after records were written"""
+    consumer = getattr(current_app, 'change_stream', None)
+    if consumer is not None and current_app.config['CHANGE_STREAM_IN_PROCESS']:
+        consumer.notify()
+
+
+def after_commit(transaction):
+    """Post-commit work of a posting: inline rule evaluation, or a nudge to the consumer"""
+    if stream_enabled():
+        notify_consumer()
+        return
+    current_app.fraud_engine.observe(transaction)
+    compliance.record_transaction(transaction)
+    aggregates.AccountSummary.invalidate(transaction.from_account_id, transaction.to_account_id)
+
+
+class ChangeStreamConsumer:
+    """Tails the change log in batches and applies each record to the read models.
+
+    poll() handles one batch; run() polls until stopped and is what both the
+    'flask stream consume' worker and the optional in-process thread execute.
+    """
+
+    def __init__(self, app, name='read-models'):
+        self.app = app
+        self.name = name
+        self.table_name = app.config['DYNAMODB_TABLE_CHANGE_LOG']
+        self.shards = app.config['CHANGE_LOG_SHARDS']
+        self.batch_size = app.config['CHANGE_STREAM_BATCH_SIZE']
+        self.poll_seconds = app.config['CHANGE_STREAM_POLL_SECONDS']
+        self.settle_seconds = app.config['CHANGE_STREAM_SETTLE_SECONDS']
+        self.lookback_seconds = app.config['CHANGE_STREAM_LOOKBACK_SECONDS']
+        self.sweep_seconds = app.config['CHANGE_STREAM_SWEEP_SECONDS']
+        self.max_attempts = app.config['CHANGE_STREAM_MAX_ATTEMPTS']
+        self.marker_ttl = app.config['CHANGE_LOG_RETENTION_DAYS'] * 2 * 86400
+        self.counters = {'batches': 0, 'records': 0, 'duplicates': 0, 'failures': 0, 'late': 0,
+                         'dead_lettered': 0}
+        # Sequences this consumer applied within the lookback window, per shard;
+        # after a restart the sweep re-applies the window once (as duplicates)
+        self.applied = {}
+        self.last_sweep = 0.0
+        # Age of the newest record applied, as of when it was applied
+        # (what DynamoDB Streams reports as IteratorAge)
+        self.lag_seconds = 0.0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.pid = None
+
+    def _shard_keys(self):
+        return [f"SHARD#{shard}" for shard in range(self.shards)]
+
+    def _checkpoint_key(self, shard):
+        return {'shard': f"{CHECKPOINT_PREFIX}{self.name}", 'sequence': shard}
+
+    def checkpoint(self, shard):
+        table = current_app.dynamo.table(self.table_name)
+        item = table.get_item(Key=self._checkpoint_key(shard), ConsistentRead=True).get('Item')
+        return item['position'] if item else START_POSITION
+
+    def _save_checkpoint(self, shard, position):
+        """Move the shard's checkpoint forward; a concurrent consumer can never move it back"""
+        table = current_app.dynamo.table(self.table_name)
+        try:
+            table.update_item(
+                Key=self._checkpoint_key(shard),
+                UpdateExpression='SET #position = :position, updated_at = :now',
+                ConditionExpression='attribute_not_exists(#position) OR #position < :position',
+                ExpressionAttributeNames={'#position': 'position'},
+                ExpressionAttributeValues={':position': position, ':now': datetime.utcnow().isoformat()}
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def _pending(self, shard, position, horizon, limit):
+        table = current_app.dynamo.table(self.table_name)
+        response = table.query(
+            KeyConditionExpression=Key('shard').eq(shard) & Key('sequence').between(position, horizon),
+            Limit=limit + 1,
+            ConsistentRead=True
+        )
+        return [item for item in response.get('Items', []) if item['sequence'] != position][:limit]
+
+    def _late(self, shard, position):
+        """Records at or behind the checkpoint, within the lookback window, that this consumer hasn't applied"""
+        if position == START_POSITION:
+            return []
+        start = (datetime.utcfromtimestamp(sequence_seconds(position))
+                 - timedelta(seconds=self.lookback_seconds)).isoformat()
+        applied = self.applied.setdefault(shard, set())
+        applied.difference_update([sequence for sequence in applied if sequence < start])
+
+        table = current_app.dynamo.table(self.table_name)
+        kwargs = {
+            'KeyConditionExpression': Key('shard').eq(shard) & Key('sequence').between(start, position),
+            'ProjectionExpression': '#sequence',
+            'ExpressionAttributeNames': {'#sequence': 'sequence'},
+        }
+        missed = []
+        while True:
+            response = table.query(**kwargs)
+            missed.extend(item['sequence'] for item in response.get('Items', [])
+                          if item['sequence'] not in applied)
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return [table.get_item(Key={'shard': shard, 'sequence': sequence}, ConsistentRead=True)['Item']
+                for sequence in missed]
+
+    def _applied(self, record):
+        self.applied.setdefault(record['shard'], set()).add(record['sequence'])
+
+    def _failed(self, record, error):
+        """Count a failed attempt on the record; returns True once it has been dead-lettered"""
+        table = current_app.dynamo.table(self.table_name)
+        try:
+            attempts = table.update_item(
+                Key={'shard': record['shard'], 'sequence': record['sequence']},
+                UpdateExpression='ADD attempts :one SET last_error = :error',
+                ExpressionAttributeValues={':one': 1, ':error': str(error)[:1000]},
+                ReturnValues='ALL_NEW'
+            )['Attributes']['attempts']
+        except Exception as e:
+            logger.error(f"Change stream {self.name} could not count the failure of {record['sequence']}: {e}")
+            return False
+        if attempts < self.max_attempts:
+            return False
+
+        # Kept without expires_at, so the TTL never removes it
+        dead_letter = {key: value for key, value in record.items() if key not in ('expires_at', 'attempts')}
+        table.put_item(Item=dict(dead_letter,
+                                 shard=f"{DEAD_LETTER_PREFIX}{self.name}",
+                                 sequence=f"{record['shard']}#{record['sequence']}",
+                                 source_shard=record['shard'],
+                                 source_sequence=record['sequence'],
+                                 attempts=attempts,
+                                 last_error=str(error)[:1000],
+                                 dead_lettered_at=datetime.utcnow().isoformat()))
+        logger.error(f"Change stream {self.name} dead-lettered {record['sequence']} after {attempts} attempts")
+        self._count('dead_lettered')
+        return True
+
+    def dead_letters(self):
+        """Records moved aside after failing CHANGE_STREAM_MAX_ATTEMPTS times"""
+        from .migrations import query_all
+        table = current_app.dynamo.table(self.table_name)
+        return list(query_all(table, KeyConditionExpression=Key('shard').eq(f"{DEAD_LETTER_PREFIX}{self.name}")))
+
+    def requeue_dead_letters(self):
+        """Put every dead-lettered record back at the head of its shard; returns how many"""
+        table = current_app.dynamo.table(self.table_name)
+        count = 0
+        for item in self.dead_letters():
+            recorded_at = datetime.utcnow().isoformat()
+            record = {key: value for key, value in item.items()
+                      if key not in ('source_shard', 'source_sequence', 'attempts', 'last_error', 'dead_lettered_at')}
+            record.update(shard=item['source_shard'],
+                          sequence=f"{recorded_at}#{item['transaction_id']}",
+                          recorded_at=recorded_at,
+                          expires_at=int(epoch_seconds(recorded_at))
+                          + current_app.config['CHANGE_LOG_RETENTION_DAYS'] * 86400)
+            table.put_item(Item=record)
+            table.delete_item(Key={'shard': item['shard'], 'sequence': item['sequence']})
+            count += 1
+        return count
+
+    def handle(self, record):
+        """Apply one change record; returns False when it had already been applied"""
+        from .models import Transaction
+        transaction = Transaction.from_item(record)
+        applied = aggregates.apply_once(transaction, int(time.time()) + self.marker_ttl)
+        # Fraud windows and compliance state skip a transaction they have seen,
+        # so they are safe to repeat after a failure part-way through
+        for alert in current_app.fraud_engine.evaluate(transaction):
+            alert.save()
+        for account_id, _ in aggregates.transaction_legs(transaction):
+            compliance.apply_to_account(account_id, transaction)
+        aggregates.AccountSummary.invalidate(transaction.from_account_id, transaction.to_account_id)
+        return applied
+
+    def poll(self):
+        """Apply the next batch of settled records across all shards; returns how many were handled.
+
+        Records are applied in sequence order across shards. When a shard has
+        more pending than fit in the batch, nothing later than its last
+        fetched record is applied this round, so shards cannot overtake
+        each other.
+        """
+        horizon = (datetime.utcnow() - timedelta(seconds=self.settle_seconds)).isoformat()
+        sweep = time.monotonic() - self.last_sweep >= self.sweep_seconds
+        late = []
+        records = []
+        for shard in self._shard_keys():
+            position = self.checkpoint(shard)
+            if sweep:
+                late.extend(self._late(shard, position))
+            pending = self._pending(shard, position, horizon, self.batch_size)
+            if len(pending) == self.batch_size:
+                horizon = min(horizon, pending[-1]['sequence'])
+            records.extend(pending)
+        if sweep:
+            self.last_sweep = time.monotonic()
+        records = sorted((record for record in records if record['sequence'] <= horizon),
+                         key=lambda record: record['sequence'])[:self.batch_size]
+
+        # Late records sit behind their checkpoint already, so they are applied
+        # first and a failure only leaves them for the next sweep
+        swept = 0
+        for record in late:
+            try:
+                if not self.handle(record):
+                    self._count('duplicates')
+                self._applied(record)
+                self._count('late')
+                swept += 1
+            except Exception as e:
+                self._count('failures')
+                logger.error(f"Change stream {self.name} failed on late record {record['sequence']}: {e}")
+                if self._failed(record, e):
+                    self._applied(record)
+
+        positions = {}
+        handled = 0
+        try:
+            for record in records:
+                try:
+                    if not self.handle(record):
+                        self._count('duplicates')
+                except Exception as e:
+                    self._count('failures')
+                    logger.error(f"Change stream {self.name} failed on {record['sequence']}: {e}")
+                    if not self._failed(record, e):
+                        # Later records wait for the retry; records already
+                        # applied are checkpointed below
+                        break
+                self._applied(record)
+                positions[record['shard']] = record['sequence']
+                handled += 1
+                self.lag_seconds = max(0.0, time.time() - sequence_seconds(record['sequence']))
+        finally:
+            for shard, position in positions.items():
+                self._save_checkpoint(shard, position)
+
+        self._count('records', handled + swept)
+        if records or late:
+            self._count('batches')
+        return handled + swept
+
+    def lag(self):
+        """Per-shard checkpoint, count of pending records (up to a batch) and age of the oldest one"""
+        now = time.time()
+        shards = {}
+        for shard in self._shard_keys():
+            position = self.checkpoint(shard)
+            pending = self._pending(shard, position, '9', self.batch_size)
+            shards[shard] = {
+                'checkpoint': position,
+                'pending': len(pending),
+                'oldest_pending_seconds': round(now - sequence_seconds(pending[0]['sequence']), 3) if pending else 0.0
+            }
+        return shards
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['lag_seconds'] = round(self.lag_seconds, 3)
+        return stats
+
+    def run(self, once=False):
+        """Poll until stopped (or until the log is drained, with once=True)"""
+        with self.app.app_context():
+            while not self.stopping.is_set():
+                try:
+                    handled = self.poll()
+                except Exception as e:
+                    logger.error(f"Change stream {self.name} poll failed: {e}")
+                    handled = 0
+                if once and not handled:
+                    return
+                if not handled:
+                    self.lag_seconds = 0.0
+                    self.wakeup.wait(self.poll_seconds)
+                    self.wakeup.clear()
+
+    def notify(self):
+        """Wake the in-process consumer after a posting, starting it if needed"""
+        self._ensure_started()
+        self.wakeup.set()
+
+    def _ensure_started(self):
+        # Started lazily and per process, like the notification workers, so a
+        # preloading gunicorn master never hands a dead thread to its workers
+        if self.pid == os.getpid() and self.thread is not None:
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread is not None:
+                return
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name=f'change-stream-{self.name}', daemon=True)
+            self.thread.start()
+            atexit.register(self.shutdown)
+
+    def shutdown(self, timeout=5):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None and self.pid == os.getpid():
+            self.thread.join(timeout)
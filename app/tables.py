@@ -0,0 +1,126 @@
+"""DynamoDB table definitions and idempotent provisioning.
+
+Workers no longer create tables while booting. 'flask bootstrap' runs once
+per deployment: it describes each table, creates only the missing ones,
+waits for them to become active and enables TTL where a table expects it.
+The in-process moto stand-in has no tables of its own, so create_app still
+provisions them there (or anywhere with DYNAMODB_BOOTSTRAP_ON_START).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _keys(hash_key, range_key=None):
+    schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+    if range_key:
+        schema.append({'AttributeName': range_key, 'KeyType': 'RANGE'})
+    return schema
+
+
+def _attributes(*names):
+    return [{'AttributeName': name, 'AttributeType': 'S'} for name in names]
+
+
+def table_definitions(app_config):
+    """create_table arguments for every table, plus the TTL attribute of those that expire items"""
+    return [
+        {
+            'TableName': app_config['DYNAMODB_TABLE_USERS'],
+            'KeySchema': _keys('user_id'),
+            'AttributeDefinitions': _attributes('user_id', 'email'),
+            'GlobalSecondaryIndexes': [{
+                'IndexName': app_config['DYNAMODB_INDEX_USERS_EMAIL'],
+                'KeySchema': _keys('email'),
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_ACCOUNTS'],
+            'KeySchema': _keys('account_id'),
+            'AttributeDefinitions': _attributes('account_id', 'user_id'),
+            'GlobalSecondaryIndexes': [{
+                'IndexName': app_config['DYNAMODB_INDEX_ACCOUNTS_USER'],
+                'KeySchema': _keys('user_id'),
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_TRANSACTIONS'],
+            'KeySchema': _keys('transaction_id'),
+            'AttributeDefinitions': _attributes('transaction_id'),
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_LEDGER'],
+            'KeySchema': _keys('account_id', 'entry_key'),
+            'AttributeDefinitions': _attributes('account_id', 'entry_key'),
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_ACCOUNT_STATS'],
+            'KeySchema': _keys('account_id', 'stat_key'),
+            'AttributeDefinitions': _attributes('account_id', 'stat_key'),
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_ALERTS'],
+            'KeySchema': _keys('account_id', 'alert_key'),
+            'AttributeDefinitions': _attributes('account_id', 'alert_key'),
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_CHANGE_LOG'],
+            'KeySchema': _keys('shard', 'sequence'),
+            'AttributeDefinitions': _attributes('shard', 'sequence'),
+            'ttl_attribute': 'expires_at',
+        },
+        {
+            'TableName': app_config['DYNAMODB_TABLE_RATE_LIMITS'],
+            'KeySchema': _keys('bucket'),
+            'AttributeDefinitions': _attributes('bucket'),
+            'ttl_attribute': 'expires_at',
+        },
+    ]
+
+
+def table_status(client, table_name):
+    """The table's status (ACTIVE, CREATING, ...), or None when it does not exist"""
+    try:
+        return client.describe_table(TableName=table_name)['Table']['TableStatus']
+    except client.exceptions.ResourceNotFoundException:
+        return None
+
+
+def _ensure_ttl(client, table_name, attribute):
+    description = client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+    if description.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        return False
+    client.update_time_to_live(TableName=table_name,
+                               TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute})
+    return True
+
+
+def bootstrap_tables(dynamo, app_config, wait=True):
+    """Create whichever tables are missing; safe to run repeatedly and from several hosts at once.
+
+    Returns {table name: 'created' | status of the existing table}.
+    """
+    client = dynamo.client
+    results = {}
+    for definition in table_definitions(app_config):
+        definition = dict(definition)
+        ttl_attribute = definition.pop('ttl_attribute', None)
+        table_name = definition['TableName']
+        status = table_status(client, table_name)
+        if status is None:
+            try:
+                client.create_table(BillingMode='PAY_PER_REQUEST', **definition)
+                status = 'created'
+                logger.info(f"Created table {table_name}")
+            except client.exceptions.ResourceInUseException:
+                # Another host created it between our describe and create
+                status = 'CREATING'
+            if wait:
+                client.get_waiter('table_exists').wait(TableName=table_name)
+        if ttl_attribute and (wait or status == 'ACTIVE'):
+            if _ensure_ttl(client, table_name, ttl_attribute):
+                logger.info(f"Enabled TTL on {table_name}.{ttl_attribute}")
+        results[table_name] = status
+    return results
@@ -0,0 +1,16 @@
+"""ASGI entry point.
+
+Serves the Flask app from an ASGI server such as uvicorn or hypercorn:
+
+    uvicorn asgi:application --workers 4
+
+The server's event loop owns the connections, so idle keep-alive and slow
+clients don't hold a thread. Flask is a WSGI app, so each request runs on a
+thread from a pool of ASGI_THREADS per process; up to that many requests
+per process are inside the app at once.
+"""
+from a2wsgi import WSGIMiddleware
+from app import create_app
+
+app = create_app()
+application = WSGIMiddleware(app, workers=app.config['ASGI_THREADS'])
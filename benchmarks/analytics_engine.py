@@ -0,0 +1,80 @@
+"""Throughput of the columnar analytics engine versus per-object Python loops.
+
+Rows are synthetic DynamoDB items (Decimal cent amounts, ISO timestamps) generated
+up front, as if already fetched, so only the in-process CPU cost is measured.
+
+    python -m benchmarks.analytics_engine --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from benchmarks.common import Timer
+
+ACCOUNT = 'bench-account'
+LARGE_CENTS = 1000000
+
+
+def synthetic_items(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    for i in range(count):
+        transaction_type = rng.choice(('deposit', 'withdraw', 'transfer'))
+        yield {
+            'transaction_id': f'tx-{i}',
+            'from_account_id': ACCOUNT if transaction_type != 'deposit' else None,
+            'to_account_id': ACCOUNT if transaction_type == 'deposit' else 'other',
+            'amount_cents': Decimal(rng.randint(100, 2000000)),
+            'transaction_type': transaction_type,
+            'description': 'Benchmark',
+            'created_at': (start + timedelta(seconds=i * 30)).isoformat(),
+        }
+
+
+def python_loops(items):
+    """What the routes did before: objects, repeated comprehensions, per-row parsing"""
+    from app.models import Transaction
+    transactions = [Transaction.from_item(item) for item in items]
+    now = max(datetime.fromisoformat(t.created_at) for t in transactions)
+    result = {
+        'deposits': sum(t.amount_cents for t in transactions if t.transaction_type == 'deposit'),
+        'withdrawals': sum(t.amount_cents for t in transactions if t.transaction_type == 'withdraw'),
+        'transfers': sum(t.amount_cents for t in transactions if t.transaction_type == 'transfer'),
+        'large': len([t for t in transactions if t.amount_cents > LARGE_CENTS]),
+        'recent': len([t for t in transactions if (now - datetime.fromisoformat(t.created_at)).days <= 7]),
+    }
+    return result
+
+
+def columnar(items):
+    from app import analytics_engine
+    batch = analytics_engine.TransactionBatch.from_items(items, ACCOUNT)
+    result = analytics_engine.summarize(batch, LARGE_CENTS)
+    result['recent'] = len(analytics_engine.since(batch, int(batch.epoch.max()) - 8 * 86400))
+    result['max_week'] = analytics_engine.max_window_count(batch, 7 * 86400)
+    return result
+
+
+def run(sizes):
+    print(f"{'rows':>9}  {'python loops':>16}  {'columnar':>16}  speedup")
+    for size in sizes:
+        items = list(synthetic_items(size))
+        with Timer() as loops:
+            python_loops(items)
+        with Timer() as vectorized:
+            columnar(items)
+        del items
+        print(f"{size:>9}  {size / loops.elapsed:>11.0f} r/s  {size / vectorized.elapsed:>11.0f} r/s  "
+              f"{loops.elapsed / vectorized.elapsed:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+    run(args.sizes)
+
+
+if __name__ == '__main__':
+    main()
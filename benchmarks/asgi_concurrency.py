@@ -0,0 +1,95 @@
+"""Concurrent requests through the ASGI adapter in asgi.py.
+
+Fires --requests requests at once, each doing --lookups DynamoDB GetItems
+with --latency added per call, and reports wall time against what the same
+requests take one after another. With the app on a thread pool the
+concurrent run takes about as long as the slowest single request; an
+adapter that runs every request on one thread takes the serial time.
+asgiref's WsgiToAsgi, which asgi.py used before, is measured too when it
+is installed:
+
+    python -m benchmarks.asgi_concurrency --requests 10 --latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from benchmarks.common import Timer
+
+BENCH_PATH = '/_bench/lookups'
+
+
+def build_app(lookups):
+    os.environ.setdefault('FLASK_ENV', 'development')
+    os.environ.setdefault('USE_REAL_AWS', 'false')
+    import asgi
+    app = asgi.app
+
+    def lookups_view():
+        table = app.dynamo.table(app.config['DYNAMODB_TABLE_ACCOUNTS'])
+        for i in range(lookups):
+            table.get_item(Key={'account_id': f'asgi-bench-{i}'})
+        return 'ok'
+
+    # Registered before the first request, as Flask requires
+    app.add_url_rule(BENCH_PATH, 'asgi_bench_lookups', lookups_view)
+    return asgi
+
+
+async def call(application, path=BENCH_PATH):
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+             'query_string': b'', 'headers': [], 'server': ('bench', 80), 'client': ('127.0.0.1', 1)}
+    await application(scope, receive, send)
+    return next(message['status'] for message in sent if message['type'] == 'http.response.start')
+
+
+async def measure(application, requests):
+    with Timer() as serial:
+        for _ in range(requests):
+            await call(application)
+    with Timer() as concurrent:
+        statuses = await asyncio.gather(*(call(application) for _ in range(requests)))
+    if any(status != 200 for status in statuses):
+        raise RuntimeError(f'unexpected statuses: {sorted(set(statuses))}')
+    return serial.elapsed, concurrent.elapsed
+
+
+def adapters(asgi):
+    yield f"a2wsgi WSGIMiddleware ({asgi.app.config['ASGI_THREADS']} threads)", asgi.application
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError:
+        return
+    yield 'asgiref WsgiToAsgi', WsgiToAsgi(asgi.app)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=10, help='requests sent at once')
+    parser.add_argument('--lookups', type=int, default=3, help='DynamoDB GetItems per request')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='seconds added to every DynamoDB call to simulate the network')
+    args = parser.parse_args()
+
+    asgi = build_app(args.lookups)
+    asgi.app.dynamo.register_event_handler('before-call.dynamodb', lambda **kwargs: time.sleep(args.latency))
+    asyncio.run(call(asgi.application))
+
+    print(f"{'adapter':<34} {'serial s':>9} {'concurrent s':>13} {'speedup':>8}")
+    for name, application in adapters(asgi):
+        serial, concurrent = asyncio.run(measure(application, args.requests))
+        print(f'{name:<34} {serial:>9.2f} {concurrent:>13.2f} {serial / concurrent:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
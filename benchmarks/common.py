@@ -0,0 +1,54 @@
+"""Shared helpers for the benchmark scripts.
+
+Every script boots the real application against moto's in-process DynamoDB,
+so results are comparable between commits without touching AWS.
+"""
+import functools
+import os
+import threading
+import time
+
+
+def make_app():
+    """Create the Flask app backed by moto"""
+    os.environ['FLASK_ENV'] = 'development'
+    os.environ['USE_REAL_AWS'] = 'false'
+    # Every simulated client logs in from the same address
+    os.environ.setdefault('LOGIN_RATE_LIMIT_ENABLED', 'false')
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def serialize_dynamodb_stand_in():
+    """Make moto apply one DynamoDB request at a time.
+
+    Real DynamoDB applies each single-item write atomically; moto's in-process
+    backend does not, so without this concurrent runs would measure moto's own
+    races rather than the application's.
+    """
+    from moto.dynamodb.responses import DynamoHandler
+    if getattr(DynamoHandler.call_action, 'serialized', False):
+        return
+    lock = threading.Lock()
+    call_action = DynamoHandler.call_action
+
+    @functools.wraps(call_action)
+    def locked_call_action(self):
+        with lock:
+            return call_action(self)
+
+    locked_call_action.serialized = True
+    DynamoHandler.call_action = locked_call_action
+
+
+class Timer:
+    """Context manager measuring wall time in seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
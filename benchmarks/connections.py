@@ -0,0 +1,97 @@
+"""Request throughput with default and tuned DynamoDB connection handling.
+
+Several threads log in and load /dashboard repeatedly. The baseline run
+reproduces the previous setup: botocore defaults (10 pooled connections,
+legacy retries) and a new Table resource on every call. The tuned run uses
+the configured pool, adaptive retries, keep-alive and cached Table handles.
+
+moto answers in-process, so against it only the per-call object overhead
+shows up. Point --endpoint-url at DynamoDB Local to include real HTTP
+connection reuse:
+
+    python -m benchmarks.connections --threads 16 --requests 50
+    python -m benchmarks.connections --endpoint-url http://127.0.0.1:8001
+"""
+import argparse
+import os
+import threading
+
+from benchmarks.common import make_app, serialize_dynamodb_stand_in, Timer
+
+
+def build_app(endpoint_url):
+    if endpoint_url:
+        os.environ.update(FLASK_ENV='production', USE_REAL_AWS='true', DYNAMODB_ENDPOINT_URL=endpoint_url,
+                          AWS_ACCESS_KEY_ID='local', AWS_SECRET_ACCESS_KEY='local')
+        from app import create_app
+        app = create_app()
+        app.config['TESTING'] = True
+        return app
+    serialize_dynamodb_stand_in()
+    return make_app()
+
+
+def baseline_handles(tuned):
+    """The previous setup: botocore defaults and a new Table resource per call"""
+    from botocore.config import Config as BotoConfig
+    from app.dynamo import DynamoDB
+    dynamo = DynamoDB(tuned.session_kwargs, BotoConfig(), tuned.endpoint_url)
+    dynamo.table = lambda name: dynamo.resource.Table(name)
+    return dynamo
+
+
+def run(threads, requests, endpoint_url):
+    app = build_app(endpoint_url)
+    from app.models import User, Account
+    tuned = app.dynamo
+    results = {}
+    for label, dynamo in (('baseline', baseline_handles(tuned)), ('tuned', tuned)):
+        app.dynamo = dynamo
+
+        emails = []
+        with app.app_context():
+            for i in range(threads):
+                email = f'conn-{label}-{i}@bench.local'
+                user = User.create(email, 'password', f'Bench {i}')
+                Account.create(user.user_id)
+                emails.append(email)
+
+        errors = []
+
+        def worker(email):
+            client = app.test_client()
+            client.post('/login', data={'email': email, 'password': 'password'})
+            barrier.wait()
+            for _ in range(requests):
+                response = client.get('/dashboard')
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        barrier = threading.Barrier(threads + 1)
+        workers = [threading.Thread(target=worker, args=(email,)) for email in emails]
+        for thread in workers:
+            thread.start()
+        barrier.wait()
+        with Timer() as timer:
+            for thread in workers:
+                thread.join()
+
+        total = threads * requests
+        results[label] = total / timer.elapsed
+        print(f"{label:<9} {total} requests in {timer.elapsed:.2f}s "
+              f"({results[label]:.0f} req/sec, {len(errors)} errors)")
+
+    print(f"speedup:  {results['tuned'] / results['baseline']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='dashboard loads per thread')
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint instead of moto')
+    args = parser.parse_args()
+    run(args.threads, args.requests, args.endpoint_url)
+
+
+if __name__ == '__main__':
+    main()
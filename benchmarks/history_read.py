@@ -0,0 +1,83 @@
+"""Reading a long transaction history through the resource and the fast path.
+
+Seeds one account's ledger, then loads its whole history as Transaction
+objects twice: through the Table resource (TypeDeserializer to Decimal, then
+float) and through Transaction.iter_range (low-level client, projection,
+direct deserializer). Because moto's own request handling dominates the
+end-to-end time, the unmarshaling step is also timed on its own over the
+same raw pages.
+
+    python -m benchmarks.history_read --rows 20000
+"""
+import argparse
+
+from benchmarks.common import make_app, Timer
+from benchmarks.ingest import synthetic_rows
+
+
+def run(rows, repeat):
+    app = make_app()
+    from boto3.dynamodb.conditions import Key
+    from boto3.dynamodb.types import TypeDeserializer
+    from app.ingest import BulkIngestor
+    from app.migrations import query_all
+    from app.models import Account, Transaction
+
+    with app.app_context():
+        account_ids = [Account.create(f'history-user-{i}').account_id for i in range(2)]
+        BulkIngestor(workers=4).ingest(synthetic_rows(rows, account_ids))
+        account_id = account_ids[0]
+        ledger = app.dynamo.table(app.config['DYNAMODB_TABLE_LEDGER'])
+
+        with Timer() as timer:
+            resource_path = [Transaction.from_item(item) for item in
+                             query_all(ledger, KeyConditionExpression=Key('account_id').eq(account_id))]
+        print(f"resource:  {len(resource_path)} transactions in {timer.elapsed:.2f}s")
+
+        with Timer() as timer:
+            fast_path = list(Transaction.iter_range(account_id))
+        print(f"fast path: {len(fast_path)} transactions in {timer.elapsed:.2f}s")
+
+        def fields(transactions):
+            return [tuple(getattr(t, name) for name in Transaction.__slots__) for t in transactions]
+
+        if fields(resource_path) != fields(fast_path):
+            raise SystemExit('FAILED: the two paths built different transactions')
+
+        # Unmarshaling alone, over identical raw pages
+        client = app.dynamo.raw_client
+        query = {'TableName': app.config['DYNAMODB_TABLE_LEDGER'],
+                 'KeyConditionExpression': 'account_id = :a',
+                 'ExpressionAttributeValues': {':a': {'S': account_id}}}
+        raw_items = []
+        while True:
+            response = client.query(**query)
+            raw_items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        deserializer = TypeDeserializer()
+        with Timer() as generic:
+            for _ in range(repeat):
+                [Transaction.from_item({k: deserializer.deserialize(v) for k, v in item.items()})
+                 for item in raw_items]
+        with Timer() as direct:
+            for _ in range(repeat):
+                [Transaction.from_raw_item(item) for item in raw_items]
+        per_item = 1e6 / (len(raw_items) * repeat)
+        print(f"unmarshal: TypeDeserializer {generic.elapsed * per_item:.1f} us/item, "
+              f"direct {direct.elapsed * per_item:.1f} us/item "
+              f"({generic.elapsed / direct.elapsed:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5, help='passes over the raw pages when timing unmarshaling')
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Bulk ingestion throughput against moto.
+
+Compares the batched, parallel ingestion path with posting rows one at a
+time, and checks that balances match the aggregated deltas. Both sides do
+the same read-model work: the per-row path puts each item, adds to each
+balance and summary, and runs the post-commit fraud and compliance hooks
+for every row.
+
+    python -m benchmarks.ingest --rows 20000 --accounts 200 --workers 4
+"""
+import argparse
+import random
+
+from benchmarks.common import make_app, Timer
+
+
+def synthetic_rows(count, account_ids, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        transaction_type = rng.choice(['deposit', 'deposit', 'withdraw', 'transfer'])
+        from_id, to_id = rng.sample(account_ids, 2)
+        yield {
+            'transaction_id': f'bench-{seed}-{i}',
+            'transaction_type': transaction_type,
+            'amount': f'{rng.randint(100, 500000) / 100:.2f}',
+            'from_account_id': from_id,
+            'to_account_id': to_id,
+            'description': 'Benchmark row',
+        }
+
+
+def post_one_by_one(app, rows):
+    """The path bulk ingestion replaces: each row written and applied on its own"""
+    from app import aggregates, stream
+    from app.ingest import row_to_transaction
+    transactions = app.dynamodb.Table(app.config['DYNAMODB_TABLE_TRANSACTIONS'])
+    ledger = app.dynamodb.Table(app.config['DYNAMODB_TABLE_LEDGER'])
+    client = app.dynamo.client
+    for row in rows:
+        transaction = row_to_transaction(row)
+        transactions.put_item(Item=transaction.to_item())
+        for item in transaction.ledger_items():
+            ledger.put_item(Item=item)
+        for account_id, leg in aggregates.transaction_legs(transaction):
+            delta = -transaction.amount_cents if leg in ('withdraw', 'transfer_out') else transaction.amount_cents
+            client.update_item(TableName=app.config['DYNAMODB_TABLE_ACCOUNTS'], Key={'account_id': account_id},
+                               UpdateExpression='ADD balance_cents :delta',
+                               ExpressionAttributeValues={':delta': delta})
+        aggregates.apply_deltas(client, aggregates.stat_deltas(transaction,
+                                                               app.config['LARGE_TRANSACTION_THRESHOLD_CENTS']))
+        stream.after_commit(transaction)
+
+
+def run(rows, accounts, workers, baseline_rows):
+    app = make_app()
+    from app.ingest import BulkIngestor, row_to_transaction
+    from app.models import Account
+
+    with app.app_context():
+        account_ids = [Account.create(f'bench-user-{i}').account_id for i in range(accounts)]
+
+        stats = BulkIngestor(workers=workers).ingest(synthetic_rows(rows, account_ids))
+        print(f"bulk:     {stats['rows']} rows in {stats['seconds']:.2f}s "
+              f"({stats['rows_per_second']:.0f} rows/sec, {stats['retries']} batch retries)")
+
+        expected = {account_id: 0 for account_id in account_ids}
+        for row in synthetic_rows(rows, account_ids):
+            transaction = row_to_transaction(row)
+            if transaction.from_account_id:
+                expected[transaction.from_account_id] -= transaction.amount_cents
+            if transaction.to_account_id:
+                expected[transaction.to_account_id] += transaction.amount_cents
+        mismatched = [a for a in account_ids
+                      if Account.get_by_account_id(a).balance_cents != expected[a]]
+        print(f"balances: {accounts - len(mismatched)}/{accounts} match the ingested deltas")
+
+        if baseline_rows:
+            with Timer() as timer:
+                post_one_by_one(app, synthetic_rows(baseline_rows, account_ids, seed=1))
+            print(f"per-row:  {baseline_rows} rows in {timer.elapsed:.2f}s "
+                  f"({baseline_rows / timer.elapsed:.0f} rows/sec, every item and read model updated per row)")
+
+    if mismatched:
+        raise SystemExit('FAILED: balances do not match')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--baseline-rows', type=int, default=2000,
+                        help='rows to write one at a time for comparison (0 to skip)')
+    args = parser.parse_args()
+    run(args.rows, args.accounts, args.workers, args.baseline_rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Concurrent load test of the main web flows against moto.
+
+Seeds users, accounts and a transaction history, then has each client
+thread log in as its own user and repeat the dashboard, deposit, transfer,
+analytics, reports and compliance flow. Reports p50/p95/p99 latency,
+requests/sec and DynamoDB calls per request for every route (read from the
+Server-Timing header), and saves the results as JSON so two commits can be
+compared:
+
+    python -m benchmarks.load --users 50 --history 200 --clients 8 --iterations 20
+    python -m benchmarks.load --compare benchmarks/results/load-<commit>.json
+
+moto answers in-process, so --latency adds a fixed delay to every DynamoDB
+call to stand in for the network round trip.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app, serialize_dynamodb_stand_in, Timer
+
+ROUTES = ('login', 'dashboard', 'deposit', 'transfer', 'analytics', 'reports', 'compliance')
+PASSWORD = 'load-test-password'
+OPENING_BALANCE = '1000000.00'
+SERVER_TIMING_DYNAMODB = re.compile(r'dynamodb;dur=([\d.]+);desc="(\d+) calls"')
+
+
+def history_rows(account_ids, per_account, seed=0):
+    """An opening deposit per account, then transactions spread over the last 90 days"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    for account_id in account_ids:
+        yield {'transaction_id': f'load-open-{account_id}', 'transaction_type': 'deposit',
+               'amount': OPENING_BALANCE, 'to_account_id': account_id,
+               'created_at': (now - timedelta(days=91)).isoformat()}
+    for i in range(per_account * len(account_ids)):
+        transaction_type = rng.choice(['deposit', 'withdraw', 'transfer'])
+        from_id, to_id = rng.sample(account_ids, 2) if len(account_ids) > 1 else (account_ids[0],) * 2
+        yield {
+            'transaction_id': f'load-{seed}-{i}',
+            'transaction_type': transaction_type,
+            'amount': f'{rng.randint(100, 50000) / 100:.2f}',
+            'from_account_id': from_id,
+            'to_account_id': to_id,
+            'created_at': (now - timedelta(seconds=rng.randint(60, 90 * 86400))).isoformat(),
+        }
+
+
+def seed(app, users, per_account):
+    from app.compliance import rebuild_all
+    from app.ingest import BulkIngestor
+    from app.models import Account, User
+    with app.app_context():
+        emails, account_ids = [], []
+        for i in range(users):
+            email = f'load-{i}@bench.local'
+            user = User.create(email, PASSWORD, f'Load {i}')
+            account_ids.append(Account.create(user.user_id).account_id)
+            emails.append(email)
+        BulkIngestor().ingest(history_rows(account_ids, per_account))
+        rebuild_all()
+    return emails
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.dynamodb = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, response):
+        match = SERVER_TIMING_DYNAMODB.search(response.headers.get('Server-Timing', ''))
+        with self.lock:
+            self.samples[route].append(seconds)
+            if match:
+                self.dynamodb[route].append((int(match.group(2)), float(match.group(1)) / 1000))
+            if response.status_code >= 400:
+                self.errors[route] += 1
+
+    def summary(self, elapsed):
+        routes = {}
+        for route in ROUTES:
+            ordered = sorted(self.samples[route])
+            calls = self.dynamodb[route]
+            routes[route] = {
+                'requests': len(ordered),
+                'errors': self.errors[route],
+                'requests_per_second': round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+                'p50_ms': round(percentile(ordered, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(ordered, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(ordered, 0.99) * 1000, 2),
+                'dynamodb_calls_per_request': round(sum(c for c, _ in calls) / len(calls), 2) if calls else None,
+                'dynamodb_ms_per_request': round(sum(s for _, s in calls) / len(calls) * 1000, 2) if calls else None,
+            }
+        return routes
+
+
+def client_loop(app, recorder, email, recipient, iterations, barrier):
+    client = app.test_client()
+    flow = (
+        ('login', lambda: client.post('/login', data={'email': email, 'password': PASSWORD})),
+        ('dashboard', lambda: client.get('/dashboard')),
+        ('deposit', lambda: client.post('/deposit', data={'amount': '25.00'})),
+        ('transfer', lambda: client.post('/transfer', data={'to_account_id': recipient, 'amount': '10.00'})),
+        ('analytics', lambda: client.get('/analytics')),
+        ('reports', lambda: client.get('/reports')),
+        ('compliance', lambda: client.get('/compliance')),
+    )
+    barrier.wait()
+    for _ in range(iterations):
+        for route, call in flow:
+            with Timer() as timer:
+                response = call()
+            recorder.record(route, timer.elapsed, response)
+        client.get('/logout')
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run(users, history, clients, iterations, latency=0.0):
+    # Per-request DynamoDB calls come from the Server-Timing header
+    os.environ['METRICS_ENABLED'] = 'true'
+    os.environ['SERVER_TIMING'] = 'true'
+    serialize_dynamodb_stand_in()
+    app = make_app()
+
+    with Timer() as seeding:
+        emails = seed(app, max(users, clients + 1), history)
+    print(f"seeded {len(emails)} users with {history} transactions each in {seeding.elapsed:.1f}s")
+    if latency:
+        app.dynamo.register_event_handler('before-call.dynamodb', lambda **kwargs: time.sleep(latency))
+
+    recorder = Recorder()
+    barrier = threading.Barrier(clients + 1)
+    workers = [threading.Thread(target=client_loop,
+                                args=(app, recorder, emails[i], emails[(i + 1) % len(emails)], iterations, barrier))
+               for i in range(clients)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    with Timer() as timer:
+        for thread in workers:
+            thread.join()
+
+    routes = recorder.summary(timer.elapsed)
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'commit': current_commit(),
+        'recorded_at': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'parameters': {'users': len(emails), 'history': history, 'clients': clients, 'iterations': iterations,
+                       'latency': latency},
+        'seconds': round(timer.elapsed, 3),
+        'requests': total,
+        'requests_per_second': round(total / timer.elapsed, 2),
+        'routes': routes,
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{'route':<11} {'req':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'ddb calls':>9}" + (f" {'p95 vs base':>12}" if baseline else ''))
+    for route, stats in results['routes'].items():
+        calls = stats['dynamodb_calls_per_request']
+        line = (f"{route:<11} {stats['requests']:>6} {stats['errors']:>4} {stats['requests_per_second']:>8.1f} "
+                f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+                f"{calls if calls is not None else '-':>9}")
+        base = (baseline or {}).get('routes', {}).get(route)
+        if base and base['p95_ms']:
+            line += f" {stats['p95_ms'] / base['p95_ms']:>11.2f}x"
+        print(line)
+    print(f"total: {results['requests']} requests in {results['seconds']:.2f}s "
+          f"({results['requests_per_second']:.1f} req/sec)")
+    if baseline:
+        print(f"throughput vs {baseline['commit']}: "
+              f"{results['requests_per_second'] / baseline['requests_per_second']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50, help='seeded users, one account each')
+    parser.add_argument('--history', type=int, default=200, help='seeded transactions per account')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent client threads')
+    parser.add_argument('--iterations', type=int, default=20, help='flows per client')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every DynamoDB call to simulate the network')
+    parser.add_argument('--output', help='results file (default benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    results = run(args.users, args.history, args.clients, args.iterations, args.latency)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(os.path.dirname(__file__), 'results', f"load-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Memory held by a transaction history in each representation.
+
+Builds the same synthetic history as a list of dict-backed objects (the
+previous Transaction layout), a list of __slots__ Transactions and a
+TransactionBatch, and reports the bytes each keeps alive per row. The row
+strings are allocated before measuring and shared by every representation,
+so the figures are the per-row overhead on top of them.
+
+    python -m benchmarks.memory --rows 100000
+"""
+import argparse
+import gc
+import tracemalloc
+
+from benchmarks.analytics_engine import ACCOUNT, synthetic_items
+
+
+class DictTransaction:
+    """Transaction as it was before __slots__"""
+
+    def __init__(self, transaction_id, from_account_id, to_account_id, amount_cents, transaction_type,
+                 description, created_at):
+        self.transaction_id = transaction_id
+        self.from_account_id = from_account_id
+        self.to_account_id = to_account_id
+        self.amount_cents = amount_cents
+        self.transaction_type = transaction_type
+        self.description = description
+        self.created_at = created_at
+
+
+def measure(build):
+    """Bytes still allocated by build()'s result, excluding the input items"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def run(rows):
+    from app.analytics_engine import TransactionBatch
+    from app.models import Transaction
+
+    # The raw items stand in for query pages; they are allocated before
+    # tracing starts so only each representation is counted
+    items = list(synthetic_items(rows))
+    fields = Transaction.__slots__
+
+    def objects(cls):
+        return [cls(*(item[name] if name != 'amount_cents' else int(item[name]) for name in fields))
+                for item in items]
+
+    # Fresh strings per row, as a query result would produce them
+    for item in items:
+        for name in ('transaction_id', 'description', 'created_at', 'from_account_id', 'to_account_id'):
+            if item[name] is not None:
+                item[name] = ''.join(item[name])
+
+    representations = [
+        ('dict objects', lambda: objects(DictTransaction)),
+        ('slots objects', lambda: objects(Transaction)),
+        ('batch columns', lambda: TransactionBatch.from_items(items, ACCOUNT)),
+    ]
+    print(f"{'representation':<16} {'MiB':>8} {'bytes/row':>10}")
+    baseline = None
+    for label, build in representations:
+        result, size = measure(build)
+        baseline = baseline or size
+        print(f"{label:<16} {size / 2**20:>8.1f} {size / rows:>10.0f}   ({baseline / size:.1f}x smaller)"
+              if size != baseline else f"{label:<16} {size / 2**20:>8.1f} {size / rows:>10.0f}")
+        del result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+    run(args.rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Worker cold-start time, measured in fresh interpreter processes.
+
+Each run starts a new Python process and times importing the app,
+create_app() and the first request, and records which heavy optional
+packages got imported along the way. It also times what every worker boot
+used to add on top: one create_table attempt per table against tables that
+already exist.
+
+Against moto (the default) create_app also starts the stand-in and creates
+its tables, a development-only cost. Point --endpoint-url at DynamoDB Local
+to measure a production-style boot where 'flask bootstrap' ran beforehand:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --endpoint-url http://127.0.0.1:8001
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PHASES = ('import', 'create_app', 'first_request', 'eager_create_table')
+WATCHED_MODULES = ('moto', 'twilio', 'numpy', 'pyarrow')
+
+
+def environment(endpoint_url):
+    env = dict(os.environ)
+    if endpoint_url:
+        env.update(FLASK_ENV='production', USE_REAL_AWS='true', DYNAMODB_ENDPOINT_URL=endpoint_url,
+                   AWS_ACCESS_KEY_ID='local', AWS_SECRET_ACCESS_KEY='local')
+    else:
+        env.update(FLASK_ENV='development', USE_REAL_AWS='false')
+    return env
+
+
+def child():
+    """One cold start; prints its phase timings as JSON"""
+    timings = {}
+    started = time.perf_counter()
+    from app import create_app
+    timings['import'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app = create_app()
+    timings['create_app'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    app.test_client().get('/login')
+    timings['first_request'] = time.perf_counter() - started
+    loaded = {name: name in sys.modules for name in WATCHED_MODULES}
+
+    # What the previous create_app did on every boot: try to create each table
+    from app.tables import table_definitions
+    started = time.perf_counter()
+    for definition in table_definitions(app.config):
+        definition.pop('ttl_attribute', None)
+        try:
+            app.dynamo.client.create_table(BillingMode='PAY_PER_REQUEST', **definition)
+        except Exception:
+            pass
+    timings['eager_create_table'] = time.perf_counter() - started
+    print(json.dumps({'timings': timings, 'loaded': loaded}))
+
+
+def run(runs, endpoint_url):
+    env = environment(endpoint_url)
+    if endpoint_url:
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'bootstrap'], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+
+    samples = {phase: [] for phase in PHASES}
+    loaded = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.startup', '--child'], env=env, check=True,
+                                capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        for phase in PHASES:
+            samples[phase].append(result['timings'][phase])
+        loaded = result['loaded']
+
+    for phase in PHASES:
+        print(f"{phase:<19} median {statistics.median(samples[phase]) * 1000:8.1f} ms   "
+              f"min {min(samples[phase]) * 1000:8.1f} ms")
+    boot = sum(statistics.median(samples[phase]) for phase in ('import', 'create_app'))
+    print(f"worker boot:        {boot * 1000:.1f} ms "
+          f"(previously also + {statistics.median(samples['eager_create_table']) * 1000:.1f} ms of create_table)")
+    print('imported at boot:   ' + ', '.join(f"{name}={'yes' if flag else 'no'}" for name, flag in loaded.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--endpoint-url', help='DynamoDB Local endpoint instead of moto')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+    else:
+        run(args.runs, args.endpoint_url)
+
+
+if __name__ == '__main__':
+    main()
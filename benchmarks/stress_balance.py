@@ -0,0 +1,75 @@
+"""Concurrent balance update stress run.
+
+Several threads hammer one account with deposits and withdrawals through
+Account.update_balance. With atomic conditional updates the final balance
+must equal the sum of the successful operations and never go negative.
+
+    python -m benchmarks.stress_balance --threads 8 --operations 200
+"""
+import argparse
+import random
+import threading
+
+from benchmarks.common import make_app, serialize_dynamodb_stand_in, Timer
+
+
+def run(threads, operations, seed=0):
+    serialize_dynamodb_stand_in()
+    app = make_app()
+    from app.models import Account, InsufficientFundsError
+    from app.money import format_cents
+
+    with app.app_context():
+        account_id = Account.create('stress-user').account_id
+
+    applied = []
+    rejected = [0]
+    lock = threading.Lock()
+
+    def worker(worker_seed):
+        rng = random.Random(worker_seed)
+        with app.app_context():
+            account = Account.get_by_account_id(account_id)
+            for _ in range(operations):
+                amount_cents = rng.choice([100, 500, 1000, 2500])
+                delta = amount_cents if rng.random() < 0.5 else -amount_cents
+                try:
+                    account.update_balance(delta)
+                except InsufficientFundsError:
+                    with lock:
+                        rejected[0] += 1
+                    continue
+                with lock:
+                    applied.append(delta)
+
+    pool = [threading.Thread(target=worker, args=(seed + i,)) for i in range(threads)]
+    with Timer() as timer:
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+
+    with app.app_context():
+        final = Account.get_by_account_id(account_id).balance_cents
+
+    expected = sum(applied)
+    total = threads * operations
+    print(f"operations: {total}, applied: {len(applied)}, rejected (insufficient funds): {rejected[0]}")
+    print(f"expected balance: {format_cents(expected)}, stored balance: {format_cents(final)}")
+    print(f"throughput: {total / timer.elapsed:.0f} updates/sec")
+    if final != expected or final < 0:
+        raise SystemExit('FAILED: lost or invalid balance updates detected')
+    print('OK: no lost updates')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200, help='updates per thread')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    run(args.threads, args.operations, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from decimal import Decimal
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,6 +11,47 @@ class Config:
     DYNAMODB_TABLE_USERS = 'BankingUsers'
     DYNAMODB_TABLE_ACCOUNTS = 'BankingAccounts'
     DYNAMODB_TABLE_TRANSACTIONS = 'BankingTransactions'
+    # Per-account copy of every transaction leg, sorted by created_at#transaction_id
+    DYNAMODB_TABLE_LEDGER = 'BankingLedger'
+    # Running per-account totals plus DAY#/MONTH# buckets, updated with each transaction
+    DYNAMODB_TABLE_ACCOUNT_STATS = 'BankingAccountStats'
+    # Fraud alerts per account, sorted by created_at#rule#transaction_id
+    DYNAMODB_TABLE_ALERTS = 'BankingAlerts'
+    # Append-only log of posted transactions, sharded by shard/sequence, that
+    # the change stream consumer tails
+    DYNAMODB_TABLE_CHANGE_LOG = 'BankingChangeLog'
+    # Login attempt counters shared by every host, expired by TTL
+    DYNAMODB_TABLE_RATE_LIMITS = 'BankingRateLimits'
+    DYNAMODB_INDEX_USERS_EMAIL = 'email-index'
+    DYNAMODB_INDEX_ACCOUNTS_USER = 'user_id-index'
+    # Cross-request model cache, per process. Users rarely change; balances can
+    # be changed by other workers, so accounts are only cached per request
+    # unless ACCOUNT_CACHE_TTL is raised
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+    ACCOUNT_CACHE_TTL = int(os.getenv('ACCOUNT_CACHE_TTL', '0'))
+    MODEL_CACHE_MAX_ENTRIES = int(os.getenv('MODEL_CACHE_MAX_ENTRIES', '10000'))
+    # Account summaries are invalidated in-process when read models change;
+    # other processes see updates after at most this many seconds
+    SUMMARY_CACHE_TTL = int(os.getenv('SUMMARY_CACHE_TTL', '0'))
+    TRANSACTIONS_PAGE_SIZE = int(os.getenv('TRANSACTIONS_PAGE_SIZE', '50'))
+    # Configured in currency units, held as integer cents like every other amount
+    LARGE_TRANSACTION_THRESHOLD_CENTS = int(Decimal(os.getenv('LARGE_TRANSACTION_THRESHOLD', '10000')) * 100)
+    # Largest single amount accepted, in currency units; capped at 2**53 cents,
+    # beyond which the analytics arrays no longer hold amounts exactly
+    MAX_AMOUNT_CENTS = min(int(Decimal(os.getenv('MAX_AMOUNT', '1000000000')) * 100), 2 ** 53)
+    # botocore client tuning: one pooled, keep-alive connection set per
+    # process, shared by all request threads
+    DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv('DYNAMODB_MAX_POOL_CONNECTIONS', '50'))
+    DYNAMODB_CONNECT_TIMEOUT = float(os.getenv('DYNAMODB_CONNECT_TIMEOUT', '2'))
+    DYNAMODB_READ_TIMEOUT = float(os.getenv('DYNAMODB_READ_TIMEOUT', '5'))
+    DYNAMODB_MAX_ATTEMPTS = int(os.getenv('DYNAMODB_MAX_ATTEMPTS', '5'))
+    DYNAMODB_RETRY_MODE = os.getenv('DYNAMODB_RETRY_MODE', 'adaptive')
+    DYNAMODB_TCP_KEEPALIVE = os.getenv('DYNAMODB_TCP_KEEPALIVE', 'true').lower() == 'true'
+    # Ask DynamoDB for consumed capacity on every call: TOTAL, INDEXES or NONE
+    DYNAMODB_RETURN_CONSUMED_CAPACITY = os.getenv('DYNAMODB_RETURN_CONSUMED_CAPACITY', 'TOTAL')
+    # Create missing tables while the app boots instead of with 'flask bootstrap'
+    # (always done with the in-process moto stand-in)
+    DYNAMODB_BOOTSTRAP_ON_START = os.getenv('DYNAMODB_BOOTSTRAP_ON_START', 'false').lower() == 'true'
     # Use local DynamoDB only if explicitly set in environment and not localhost (for docker)
     endpoint = os.getenv('DYNAMODB_ENDPOINT_URL')
     DYNAMODB_ENDPOINT_URL = endpoint if endpoint and endpoint != 'http://localhost:8000' else None
@@ -21,6 +64,111 @@ class Config:
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
     TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
+    # Deliver notifications from background workers instead of inside the request
+    NOTIFICATION_ASYNC = os.getenv('NOTIFICATION_ASYNC', 'true').lower() == 'true'
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', '2'))
+    NOTIFICATION_QUEUE_SIZE = int(os.getenv('NOTIFICATION_QUEUE_SIZE', '1000'))
+    NOTIFICATION_MAX_RETRIES = int(os.getenv('NOTIFICATION_MAX_RETRIES', '3'))
+    NOTIFICATION_RETRY_BACKOFF = float(os.getenv('NOTIFICATION_RETRY_BACKOFF', '0.5'))
+    NOTIFICATION_DEAD_LETTER_SIZE = int(os.getenv('NOTIFICATION_DEAD_LETTER_SIZE', '1000'))
+
+    # Bulk ingestion API (disabled unless a token is configured)
+    INGEST_API_TOKEN = os.getenv('INGEST_API_TOKEN')
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '4'))
+
+    # Streaming fraud rules, evaluated as each transaction is posted. Window
+    # state is stored per account in the AccountStats table; each process
+    # caches what it last wrote for FRAUD_STATE_TTL seconds
+    FRAUD_STATE_TTL = int(os.getenv('FRAUD_STATE_TTL', '300'))
+    FRAUD_STATE_MAX_ACCOUNTS = int(os.getenv('FRAUD_STATE_MAX_ACCOUNTS', '10000'))
+    FRAUD_HISTORY_LIMIT = int(os.getenv('FRAUD_HISTORY_LIMIT', '200'))
+    FRAUD_WINDOW_CAPACITY = int(os.getenv('FRAUD_WINDOW_CAPACITY', '64'))
+    FRAUD_VELOCITY_SECONDS = int(os.getenv('FRAUD_VELOCITY_SECONDS', '600'))
+    FRAUD_VELOCITY_COUNT = int(os.getenv('FRAUD_VELOCITY_COUNT', '10'))
+    FRAUD_STRUCTURING_SECONDS = int(os.getenv('FRAUD_STRUCTURING_SECONDS', '86400'))
+    FRAUD_STRUCTURING_MARGIN = float(os.getenv('FRAUD_STRUCTURING_MARGIN', '0.1'))
+    FRAUD_STRUCTURING_COUNT = int(os.getenv('FRAUD_STRUCTURING_COUNT', '3'))
+    FRAUD_NEW_RECIPIENT_SECONDS = int(os.getenv('FRAUD_NEW_RECIPIENT_SECONDS', '3600'))
+    FRAUD_NEW_RECIPIENT_COUNT = int(os.getenv('FRAUD_NEW_RECIPIENT_COUNT', '3'))
+    FRAUD_ZSCORE = float(os.getenv('FRAUD_ZSCORE', '4'))
+    FRAUD_ZSCORE_MIN_SAMPLES = int(os.getenv('FRAUD_ZSCORE_MIN_SAMPLES', '10'))
+
+    # Compliance scoring over the per-account state kept by app/compliance.py
+    COMPLIANCE_WINDOW_DAYS = int(os.getenv('COMPLIANCE_WINDOW_DAYS', '7'))
+    COMPLIANCE_FREQUENCY_LIMIT = int(os.getenv('COMPLIANCE_FREQUENCY_LIMIT', '50'))
+    COMPLIANCE_FREQUENCY_PENALTY = int(os.getenv('COMPLIANCE_FREQUENCY_PENALTY', '10'))
+    COMPLIANCE_FREQUENCY_FLOOR = int(os.getenv('COMPLIANCE_FREQUENCY_FLOOR', '70'))
+    COMPLIANCE_LARGE_TX_SCORE = int(os.getenv('COMPLIANCE_LARGE_TX_SCORE', '85'))
+    COMPLIANCE_NEGATIVE_BALANCE_SCORE = int(os.getenv('COMPLIANCE_NEGATIVE_BALANCE_SCORE', '50'))
+
+    # Bank-wide jobs scan tables in parallel segments; each worker thread
+    # scans one segment at a time
+    SCAN_SEGMENTS = int(os.getenv('SCAN_SEGMENTS', '8'))
+    SCAN_WORKERS = int(os.getenv('SCAN_WORKERS', '8'))
+
+    # Where summaries, fraud rules and compliance state are updated: 'inline'
+    # after each posting inside the request, or 'stream' by the change stream
+    # consumer (flask --app run stream consume) from the change log
+    READ_MODEL_UPDATES = os.getenv('READ_MODEL_UPDATES', 'inline')
+    CHANGE_LOG_SHARDS = int(os.getenv('CHANGE_LOG_SHARDS', '4'))
+    CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '7'))
+    CHANGE_STREAM_BATCH_SIZE = int(os.getenv('CHANGE_STREAM_BATCH_SIZE', '100'))
+    CHANGE_STREAM_POLL_SECONDS = float(os.getenv('CHANGE_STREAM_POLL_SECONDS', '1'))
+    # Records younger than this are left for the next poll, so postings that
+    # commit close together are usually applied in order
+    CHANGE_STREAM_SETTLE_SECONDS = float(os.getenv('CHANGE_STREAM_SETTLE_SECONDS', '1'))
+    # How often, and how far behind each checkpoint, the consumer re-reads the
+    # log for records that committed late; the lookback should cover a write's
+    # full retry budget (DYNAMODB_MAX_ATTEMPTS x DYNAMODB_READ_TIMEOUT plus backoff)
+    CHANGE_STREAM_SWEEP_SECONDS = float(os.getenv('CHANGE_STREAM_SWEEP_SECONDS', '10'))
+    CHANGE_STREAM_LOOKBACK_SECONDS = int(os.getenv('CHANGE_STREAM_LOOKBACK_SECONDS', '300'))
+    # Failed attempts after which a record is moved to the dead-letter partition
+    CHANGE_STREAM_MAX_ATTEMPTS = int(os.getenv('CHANGE_STREAM_MAX_ATTEMPTS', '5'))
+    # Also run a consumer thread in each web process (needed with the
+    # in-process moto stand-in, where no other process can see the tables)
+    CHANGE_STREAM_IN_PROCESS = os.getenv('CHANGE_STREAM_IN_PROCESS', 'false').lower() == 'true'
+
+    # Per-request timing, DynamoDB call and capacity accounting, served in
+    # Prometheus format at /metrics. Off unless asked for, since /metrics is
+    # public until METRICS_TOKEN is set (bearer token required when it is)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Also send each request's breakdown as a Server-Timing response header
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'false').lower() == 'true'
+
+    # bcrypt cost for new hashes; older, cheaper hashes are upgraded at login
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    # Helper processes that run bcrypt off the request threads (0 = inline),
+    # and how many operations may wait for them before logins are refused
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '32'))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+    # SQLite file shared by the workers on a host (login rate-limit buckets,
+    # session principals)
+    LOCAL_STORE_PATH = os.getenv('LOCAL_STORE_PATH', os.path.join(tempfile.gettempdir(), 'banking-local.sqlite3'))
+    # Seconds a signed-in user's cached profile and account_id (kept in the
+    # local store) are trusted before being re-read from DynamoDB
+    SESSION_PRINCIPAL_TTL = int(os.getenv('SESSION_PRINCIPAL_TTL', '900'))
+    # Proxies (load balancer, ingress) in front of the app that append to
+    # X-Forwarded-For; the client IP is taken from the entry this many hops
+    # back. Leave at 0 when clients connect directly, or the header can be forged
+    TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', '0'))
+    # Limits in front of POST /login: burst size and refill per minute. The
+    # per-IP bucket lives in each host's local store; the per-email limit is
+    # counted in DynamoDB, so it holds across hosts
+    LOGIN_RATE_LIMIT_ENABLED = os.getenv('LOGIN_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    LOGIN_RATE_LIMIT_IP_BURST = int(os.getenv('LOGIN_RATE_LIMIT_IP_BURST', '30'))
+    LOGIN_RATE_LIMIT_IP_PER_MINUTE = float(os.getenv('LOGIN_RATE_LIMIT_IP_PER_MINUTE', '30'))
+    LOGIN_RATE_LIMIT_EMAIL_BURST = int(os.getenv('LOGIN_RATE_LIMIT_EMAIL_BURST', '10'))
+    LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE = float(os.getenv('LOGIN_RATE_LIMIT_EMAIL_PER_MINUTE', '5'))
+
+    # Threads per process for running a request's independent lookups
+    # concurrently (0 runs them one after another)
+    PARALLEL_LOOKUP_WORKERS = int(os.getenv('PARALLEL_LOOKUP_WORKERS', '16'))
+
+    # Threads per process running requests under asgi.py; this many requests
+    # per process can be in the app at once
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', '10'))
 
     # AWS settings
     USE_REAL_AWS = os.getenv('USE_REAL_AWS', 'false').lower() == 'true'
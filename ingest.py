@@ -0,0 +1,46 @@
+"""Bulk-load transactions from a core-banking extract.
+
+    python ingest.py nightly_extract.csv
+    python ingest.py transactions.jsonl --workers 8
+
+Columns/keys: transaction_type, amount, from_account_id, to_account_id and
+optionally transaction_id, description, created_at.
+"""
+import argparse
+import os
+import sys
+from app import create_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-load transactions from a CSV or JSON extract.')
+    parser.add_argument('path', help="input file, or '-' for stdin")
+    parser.add_argument('--format', choices=['csv', 'json', 'jsonl'],
+                        help='input format (default: from the file extension)')
+    parser.add_argument('--workers', type=int, default=4, help='parallel batch writers')
+    args = parser.parse_args()
+
+    fmt = args.format
+    if not fmt:
+        extension = os.path.splitext(args.path)[1].lower().lstrip('.')
+        fmt = {'csv': 'csv', 'json': 'json', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}.get(extension)
+    if not fmt:
+        parser.error('cannot infer the input format, pass --format')
+
+    app = create_app()
+    with app.app_context():
+        from app.ingest import ingest_stream
+        stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        with stream:
+            stats = ingest_stream(stream, fmt, workers=args.workers)
+
+    print(f"Rows read: {stats['rows']}, written: {stats['written']}, rejected: {stats['rejected']}")
+    print(f"Accounts updated: {stats['accounts_updated']}, overdrawn: {stats['overdrawn_accounts']}, "
+          f"batch retries: {stats['retries']}")
+    for error in stats['errors']:
+        print(f"Rejected {error}")
+    print(f"Elapsed: {stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/sec)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Fixtures for running the app against moto's in-process DynamoDB.
+
+create_app() starts moto's mock_dynamodb in development and creates the
+tables once per process, so tables and items outlive a single test: every
+test works on its own freshly created users and accounts.
+"""
+import functools
+import os
+import tempfile
+import threading
+import uuid
+
+os.environ['FLASK_ENV'] = 'development'
+os.environ['USE_REAL_AWS'] = 'false'
+os.environ['PASSWORD_HASH_WORKERS'] = '0'
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['LOGIN_RATE_LIMIT_ENABLED'] = 'false'
+os.environ['LOCAL_STORE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='banking-tests-'), 'local.sqlite3')
+
+import pytest
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture(scope='session')
+def serialized_dynamodb():
+    """Make moto apply one DynamoDB request at a time, as real DynamoDB applies each write atomically"""
+    from moto.dynamodb.responses import DynamoHandler
+    lock = threading.Lock()
+    call_action = DynamoHandler.call_action
+
+    @functools.wraps(call_action)
+    def locked_call_action(self):
+        with lock:
+            return call_action(self)
+
+    DynamoHandler.call_action = locked_call_action
+    yield
+    DynamoHandler.call_action = call_action
+
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def make_account(app_context):
+    """Create a user with one account, funded with balance_cents"""
+    from app.models import Account, User
+
+    def make_account(balance_cents=0):
+        user = User.create(f'{uuid.uuid4().hex}@tests.local', 'test-password', 'Test User')
+        account = Account.create(user.user_id)
+        if balance_cents:
+            account.update_balance(balance_cents)
+        return account
+
+    return make_account
@@ -0,0 +1,58 @@
+import threading
+
+import pytest
+
+from app.models import Account, AccountNotFoundError, InsufficientFundsError
+
+
+def stored_balance(account_id):
+    Account.invalidate(account_id)
+    return Account.get_by_account_id(account_id).balance_cents
+
+
+def test_update_balance_adds_and_returns_new_balance(make_account):
+    account = make_account(1000)
+    assert account.update_balance(250) == 1250
+    assert account.update_balance(-1250) == 0
+    assert stored_balance(account.account_id) == 0
+
+
+def test_debit_beyond_balance_raises_and_leaves_balance(make_account):
+    account = make_account(1000)
+    with pytest.raises(InsufficientFundsError):
+        account.update_balance(-1001)
+    assert stored_balance(account.account_id) == 1000
+
+
+def test_update_balance_of_missing_account_raises(app_context):
+    account = Account('missing-account', 'missing-user', 0, '2024-01-01T00:00:00')
+    with pytest.raises(AccountNotFoundError):
+        account.update_balance(100)
+
+
+def test_concurrent_updates_are_not_lost(app, make_account, serialized_dynamodb):
+    account = make_account(500)
+    threads, operations = 8, 10
+    overdrawn = []
+
+    def worker():
+        with app.app_context():
+            copy = Account.get_by_account_id(account.account_id)
+            for _ in range(operations):
+                copy.update_balance(100)
+                try:
+                    copy.update_balance(-150)
+                except InsufficientFundsError:
+                    overdrawn.append(1)
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    # Every credit and every accepted debit is reflected exactly once
+    debits = threads * operations - len(overdrawn)
+    expected = 500 + threads * operations * 100 - debits * 150
+    assert expected >= 0
+    assert stored_balance(account.account_id) == expected
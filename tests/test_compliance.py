@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from flask import current_app
+
+from app.compliance import COMPLIANCE_KEY, ComplianceState, apply_to_account
+from app.models import Transaction
+
+
+def test_posting_to_an_account_without_state_builds_it_from_the_ledger(make_account):
+    account = make_account()
+    first = Transaction.create(None, account.account_id, 2000000, 'deposit', 'Deposit')
+    table = current_app.dynamo.table(current_app.config['DYNAMODB_TABLE_ACCOUNT_STATS'])
+    table.delete_item(Key={'account_id': account.account_id, 'stat_key': COMPLIANCE_KEY})
+
+    second = Transaction.create(None, account.account_id, 500, 'deposit', 'Deposit')
+
+    state = ComplianceState.get(account.account_id)
+    assert state.window_count(datetime.utcnow().date().toordinal(), 1) == 2
+    assert state.large_tx_count == 1
+    assert state.recent == [first.transaction_id, second.transaction_id]
+    assert apply_to_account(account.account_id, second) is False
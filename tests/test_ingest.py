@@ -0,0 +1,100 @@
+import io
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app.ingest import BulkIngestor, parse_created_at, read_rows, row_to_transaction
+from app.compliance import ComplianceState
+from app.fraud import Alert
+from app.models import Account, Transaction
+
+
+def test_parse_created_at_normalises_to_naive_utc():
+    assert parse_created_at('2024-03-01T10:00:00+02:00') == '2024-03-01T08:00:00'
+    assert parse_created_at('2024-03-01') == '2024-03-01T00:00:00'
+    with pytest.raises(ValueError, match='invalid created_at'):
+        parse_created_at('yesterday')
+
+
+@pytest.mark.parametrize('row, error', [
+    ({'transaction_type': 'refund', 'amount': '1.00', 'to_account_id': 'a'}, 'invalid transaction_type'),
+    ({'transaction_type': 'deposit', 'amount': '0', 'to_account_id': 'a'}, 'invalid amount'),
+    ({'transaction_type': 'withdraw', 'amount': '1.00'}, 'from_account_id is required'),
+    ({'transaction_type': 'transfer', 'amount': '1.00', 'from_account_id': 'a'}, 'to_account_id is required'),
+    ({'transaction_type': 'deposit', 'amount': '1.00', 'to_account_id': 'a', 'created_at': '2024-13-01'},
+     'invalid created_at'),
+])
+def test_row_to_transaction_rejects_invalid_rows(row, error):
+    with pytest.raises(ValueError, match=error):
+        row_to_transaction(row)
+
+
+@pytest.mark.parametrize('field', ['transaction_id', 'description', 'to_account_id'])
+def test_row_to_transaction_rejects_non_string_fields(field):
+    row = {'transaction_type': 'deposit', 'amount': '1.00', 'to_account_id': 'a', field: 123}
+    with pytest.raises(ValueError, match=f'{field} must be a string'):
+        row_to_transaction(row)
+
+
+def test_ingest_rejects_malformed_json_rows_and_continues(make_account):
+    account = make_account()
+    rows = [
+        {'transaction_type': 5, 'amount': '1.00', 'to_account_id': account.account_id},
+        {'transaction_type': 'deposit', 'amount': '1e999999', 'to_account_id': account.account_id},
+        {'transaction_type': 'deposit', 'amount': '1.00', 'to_account_id': account.account_id, 'description': 123},
+        {'transaction_type': 'deposit', 'amount': '3.00', 'to_account_id': account.account_id},
+    ]
+    stats = BulkIngestor(workers=1).ingest(rows)
+
+    assert (stats['rows'], stats['written'], stats['rejected']) == (4, 1, 3)
+    assert [error.split(':')[0] for error in stats['errors']] == ['row 1', 'row 2', 'row 3']
+    Account.invalidate(account.account_id)
+    assert Account.get_by_account_id(account.account_id).balance_cents == 300
+    assert [t.description for t in Transaction.get_page(account.account_id)[0]] == ['Deposit']
+
+
+def test_ingest_rejects_bad_rows_and_duplicate_ids(make_account):
+    account = make_account()
+    duplicate = str(uuid.uuid4())
+    csv = (
+        'transaction_id,transaction_type,amount,from_account_id,to_account_id,created_at\n'
+        f'{duplicate},deposit,10.00,,{account.account_id},2024-01-01T09:00:00Z\n'
+        f'{duplicate},deposit,10.00,,{account.account_id},2024-01-01T09:00:00Z\n'
+        f',deposit,2.50,,{account.account_id},not-a-date\n'
+        f',withdraw,4.00,{account.account_id},,2024-01-02T09:00:00\n'
+    )
+    stats = BulkIngestor(workers=2).ingest(read_rows(io.BytesIO(csv.encode()), 'csv'))
+
+    assert (stats['rows'], stats['written'], stats['rejected']) == (4, 2, 2)
+    assert stats['errors'] == [f"row 2: duplicate transaction_id {duplicate!r}",
+                               "row 3: invalid created_at 'not-a-date'"]
+    Account.invalidate(account.account_id)
+    assert Account.get_by_account_id(account.account_id).balance_cents == 600
+
+
+def test_ingest_counts_accounts_left_overdrawn(make_account):
+    account = make_account(100)
+    stats = BulkIngestor(workers=1).ingest([
+        {'transaction_type': 'withdraw', 'amount': '5.00', 'from_account_id': account.account_id},
+    ])
+    assert stats['overdrawn_accounts'] == 1
+    Account.invalidate(account.account_id)
+    assert Account.get_by_account_id(account.account_id).balance_cents == -400
+
+
+def test_ingest_folds_the_run_into_existing_compliance_and_fraud_state(make_account):
+    account = make_account(1000)
+    ComplianceState.get(account.account_id)
+    BulkIngestor(workers=1).ingest([
+        {'transaction_type': 'deposit', 'amount': '20000.00', 'to_account_id': account.account_id},
+        {'transaction_type': 'withdraw', 'amount': '20015.00', 'from_account_id': account.account_id},
+        {'transaction_type': 'deposit', 'amount': '1.00', 'to_account_id': account.account_id},
+    ])
+
+    state = ComplianceState.get(account.account_id)
+    assert state.large_tx_count == 2
+    # Lowest point passed through during the run, not just the final balance
+    assert state.min_balance_cents == -500
+    assert state.window_count(datetime.utcnow().date().toordinal(), 1) == 3
+    assert {alert.rule for alert in Alert.recent(account.account_id)} == {'large_amount'}
@@ -0,0 +1,4 @@
+def test_metrics_are_off_unless_enabled(app):
+    assert app.config['METRICS_ENABLED'] is False
+    assert app.metrics is None
+    assert app.test_client().get('/metrics').status_code == 404
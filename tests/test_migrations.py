@@ -0,0 +1,73 @@
+import uuid
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Key
+from flask import current_app
+
+from app.migrations import legacy_cents, migrate_ledger, migrate_money_to_cents
+
+
+def table(config_key):
+    return current_app.dynamo.table(current_app.config[config_key])
+
+
+def ledger_entries(account_id):
+    return table('DYNAMODB_TABLE_LEDGER').query(KeyConditionExpression=Key('account_id').eq(account_id))['Items']
+
+
+def legacy_transaction(from_account_id, to_account_id, amount, transaction_type='transfer'):
+    """A transactions-table item as written before amounts moved to cents"""
+    item = {'transaction_id': str(uuid.uuid4()), 'transaction_type': transaction_type, 'amount': Decimal(amount),
+            'description': 'Legacy', 'created_at': '2023-05-01T12:00:00'}
+    if from_account_id:
+        item['from_account_id'] = from_account_id
+    if to_account_id:
+        item['to_account_id'] = to_account_id
+    table('DYNAMODB_TABLE_TRANSACTIONS').put_item(Item=item)
+    return item
+
+
+def test_legacy_cents_rounds_half_up():
+    assert legacy_cents(Decimal('12.34')) == 1234
+    assert legacy_cents(Decimal('0.005')) == 1
+    assert legacy_cents('10') == 1000
+
+
+def test_migrate_ledger_backfills_legacy_amounts_in_cents(app_context):
+    sender, recipient = str(uuid.uuid4()), str(uuid.uuid4())
+    item = legacy_transaction(sender, recipient, '12.345')
+
+    stats = migrate_ledger()
+    assert stats['entries'] >= 2
+    for account_id in (sender, recipient):
+        entries = ledger_entries(account_id)
+        assert [entry['transaction_id'] for entry in entries] == [item['transaction_id']]
+        assert entries[0]['amount_cents'] == 1235
+        assert 'amount' not in entries[0]
+
+    # Re-running overwrites the same entries
+    migrate_ledger()
+    assert len(ledger_entries(sender)) == 1
+
+
+def test_migrate_money_to_cents_converts_balances_and_transactions(make_account):
+    account = make_account()
+    accounts = table('DYNAMODB_TABLE_ACCOUNTS')
+    accounts.update_item(Key={'account_id': account.account_id},
+                         UpdateExpression='SET #balance = :balance REMOVE balance_cents',
+                         ExpressionAttributeNames={'#balance': 'balance'},
+                         ExpressionAttributeValues={':balance': Decimal('25.50')})
+    item = legacy_transaction(None, account.account_id, '25.50', 'deposit')
+
+    migrate_money_to_cents()
+    migrated = accounts.get_item(Key={'account_id': account.account_id})['Item']
+    assert migrated['balance_cents'] == 2550
+    assert 'balance' not in migrated
+    transaction = table('DYNAMODB_TABLE_TRANSACTIONS').get_item(
+        Key={'transaction_id': item['transaction_id']})['Item']
+    assert transaction['amount_cents'] == 2550
+    assert 'amount' not in transaction
+
+    # Already in cents: a second run leaves the balance alone
+    migrate_money_to_cents()
+    assert accounts.get_item(Key={'account_id': account.account_id})['Item']['balance_cents'] == 2550
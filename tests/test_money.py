@@ -0,0 +1,48 @@
+import uuid
+
+import pytest
+
+from app.models import Account, User
+from app.money import MAX_SAFE_CENTS, InvalidAmountError, parse_cents
+
+
+def test_parse_cents_is_exact():
+    assert parse_cents('12.5') == 1250
+    assert parse_cents(' 0.01 ') == 1
+    assert parse_cents(12.5) == 1250
+
+
+@pytest.mark.parametrize('value', ['abc', '', 'NaN', 'Infinity', '1e999999', None])
+def test_parse_cents_rejects_values_that_are_not_amounts(value):
+    with pytest.raises(InvalidAmountError, match='invalid amount'):
+        parse_cents(value)
+
+
+def test_parse_cents_rejects_fractions_of_a_cent():
+    with pytest.raises(InvalidAmountError, match='fractions of a cent'):
+        parse_cents('1.005')
+
+
+def test_parse_cents_enforces_the_maximum():
+    assert parse_cents('10.00', max_cents=1000) == 1000
+    with pytest.raises(InvalidAmountError, match='exceeds the maximum of 10.00'):
+        parse_cents('10.01', max_cents=1000)
+    # The configured maximum can never go past what the analytics arrays hold
+    assert parse_cents('90071992547409.92', max_cents=10 ** 20) == MAX_SAFE_CENTS
+    for value in ('90071992547409.93', '1e30', '1e50'):
+        with pytest.raises(InvalidAmountError, match='exceeds the maximum'):
+            parse_cents(value, max_cents=10 ** 20)
+
+
+@pytest.mark.parametrize('amount', ['1e50', '1e999999', '1e30'])
+def test_deposit_of_an_oversized_amount_is_refused(app, amount):
+    email = f'{uuid.uuid4().hex}@tests.local'
+    client = app.test_client()
+    client.post('/register', data={'email': email, 'password': 'test-password', 'name': 'Test User'})
+    client.post('/login', data={'email': email, 'password': 'test-password'})
+
+    response = client.post('/deposit', data={'amount': amount})
+    assert response.status_code == 200
+    assert b'Please enter a positive amount' in response.data
+    with app.app_context():
+        assert Account.get(User.get_by_email(email).user_id).balance_cents == 0
@@ -0,0 +1,81 @@
+import threading
+
+from app.notifications import NotificationQueue
+
+
+class FakeService:
+    """Records deliveries; messages to addresses in `failing` are never accepted"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_sms(self, to_phone, message):
+        with self.lock:
+            self.sent.append(to_phone)
+        return to_phone not in self.failing
+
+    def send_email(self, to_email, subject, body):
+        with self.lock:
+            self.sent.append(to_email)
+        return to_email not in self.failing
+
+    def send_email_batch(self, messages):
+        with self.lock:
+            self.sent.extend(message['to'] for message in messages)
+        return [message for message in messages if message['to'] in self.failing]
+
+
+def make_queue(service, **config):
+    return NotificationQueue(service, dict({'NOTIFICATION_WORKERS': 2, 'NOTIFICATION_RETRY_BACKOFF': 0.01,
+                                            'NOTIFICATION_MAX_RETRIES': 2}, **config))
+
+
+def test_shutdown_delivers_everything_queued():
+    service = FakeService()
+    notifications = make_queue(service)
+    for i in range(12):
+        notifications.enqueue('email', f'user{i}@tests.local', 'body', 'subject')
+    notifications.enqueue('sms', '+15550100', 'body')
+
+    notifications.shutdown(timeout=5)
+    stats = notifications.stats()
+    assert (stats['enqueued'], stats['sent'], stats['dead_lettered']) == (13, 13, 0)
+    assert notifications.queue.unfinished_tasks == 0
+    assert notifications.threads == []
+
+
+def test_messages_that_keep_failing_are_dead_lettered():
+    service = FakeService(failing={'bad@tests.local', '+15550199'})
+    notifications = make_queue(service)
+    notifications.enqueue('email', 'bad@tests.local', 'body', 'subject')
+    notifications.enqueue('sms', '+15550199', 'body')
+    notifications.enqueue('email', 'good@tests.local', 'body', 'subject')
+
+    notifications.shutdown(timeout=5)
+    stats = notifications.stats()
+    assert (stats['sent'], stats['dead_lettered'], stats['retry_pending']) == (1, 2, 0)
+    assert sorted(message['to'] for message in notifications.dead_letters) == ['+15550199', 'bad@tests.local']
+    assert all(message['attempts'] == 3 for message in notifications.dead_letters)
+    assert notifications.queue.unfinished_tasks == 0
+
+
+def test_shutdown_dead_letters_retries_it_cannot_wait_for():
+    service = FakeService(failing={'slow@tests.local'})
+    notifications = make_queue(service, NOTIFICATION_RETRY_BACKOFF=3600, NOTIFICATION_MAX_RETRIES=5)
+    notifications.enqueue('email', 'slow@tests.local', 'body', 'subject')
+
+    notifications.shutdown(timeout=0.5)
+    stats = notifications.stats()
+    assert (stats['retried'], stats['dead_lettered'], stats['retry_pending']) == (1, 1, 0)
+    assert notifications.dead_letters[0]['error'] == 'shutdown before retry'
+
+
+def test_enqueue_on_a_full_queue_dead_letters_instead_of_blocking():
+    notifications = make_queue(FakeService(), NOTIFICATION_QUEUE_SIZE=1)
+    # Workers not started, so nothing drains the queue
+    notifications._ensure_started = lambda: None
+    assert notifications.enqueue('sms', '+15550100', 'first')
+    assert not notifications.enqueue('sms', '+15550101', 'second')
+    assert notifications.stats()['dead_lettered'] == 1
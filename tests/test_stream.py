@@ -0,0 +1,118 @@
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.aggregates import AccountSummary
+from app.models import Transaction
+from app.stream import ChangeStreamConsumer, change_record
+from app.tables import bootstrap_tables
+
+
+@pytest.fixture
+def consumer(app, monkeypatch):
+    """A consumer on a change log table of its own, with one shard and no settle delay"""
+    for key, value in (('READ_MODEL_UPDATES', 'stream'),
+                       ('DYNAMODB_TABLE_CHANGE_LOG', f'ChangeLog-{uuid.uuid4().hex[:12]}'),
+                       ('CHANGE_LOG_SHARDS', 1),
+                       ('CHANGE_STREAM_IN_PROCESS', False),
+                       ('CHANGE_STREAM_SETTLE_SECONDS', 0),
+                       ('CHANGE_STREAM_SWEEP_SECONDS', 0),
+                       ('CHANGE_STREAM_MAX_ATTEMPTS', 3)):
+        monkeypatch.setitem(app.config, key, value)
+    bootstrap_tables(app.dynamo, app.config)
+    with app.app_context():
+        yield ChangeStreamConsumer(app)
+
+
+def deposit(account_id, amount_cents):
+    return Transaction.create(None, account_id, amount_cents, 'deposit', 'Deposit')
+
+
+def deposits_applied(account_id):
+    AccountSummary.invalidate(account_id)
+    return AccountSummary.get(account_id, 0).deposit_count
+
+
+def drain(consumer):
+    handled = 0
+    while True:
+        count = consumer.poll()
+        if not count:
+            return handled
+        handled += count
+
+
+def test_poll_applies_records_and_advances_checkpoint(consumer, make_account):
+    account = make_account()
+    transaction = deposit(account.account_id, 500)
+    assert deposits_applied(account.account_id) == 0
+
+    assert drain(consumer) == 1
+    assert deposits_applied(account.account_id) == 1
+    assert consumer.checkpoint('SHARD#0').endswith(f'#{transaction.transaction_id}')
+    assert consumer.poll() == 0
+
+
+def test_replay_from_the_start_applies_nothing_twice(consumer, make_account, app):
+    account = make_account()
+    deposit(account.account_id, 500)
+    deposit(account.account_id, 700)
+    assert drain(consumer) == 2
+
+    replay = ChangeStreamConsumer(app, name='replay')
+    assert drain(replay) == 2
+    assert replay.stats()['duplicates'] == 2
+    assert deposits_applied(account.account_id) == 2
+
+
+def test_record_landing_behind_the_checkpoint_is_swept_up(consumer, make_account, app):
+    account = make_account()
+    deposit(account.account_id, 500)
+    assert drain(consumer) == 1
+
+    # A commit that was slow to land: its sequence sorts before the checkpoint
+    late = Transaction(str(uuid.uuid4()), None, account.account_id, 300, 'deposit', 'Late',
+                       datetime.utcnow().isoformat())
+    record = change_record(late, app.config)
+    recorded_at = (datetime.utcnow() - timedelta(seconds=20)).isoformat()
+    record.update(sequence=f'{recorded_at}#{late.transaction_id}', recorded_at=recorded_at)
+    app.dynamo.table(app.config['DYNAMODB_TABLE_CHANGE_LOG']).put_item(Item=record)
+
+    assert consumer.poll() == 1
+    assert consumer.stats()['late'] == 1
+    assert deposits_applied(account.account_id) == 2
+    assert consumer.poll() == 0
+
+
+def test_poison_record_is_dead_lettered_and_can_be_requeued(consumer, make_account, monkeypatch):
+    account = make_account()
+    poison = deposit(account.account_id, 700)
+    handle = consumer.handle
+
+    def failing_handle(record):
+        if record['transaction_id'] == poison.transaction_id:
+            raise RuntimeError('handler failed')
+        return handle(record)
+
+    monkeypatch.setattr(consumer, 'handle', failing_handle)
+    # Held at the head of the shard until the last attempt moves it aside
+    assert consumer.poll() == 0
+    assert consumer.poll() == 0
+    assert consumer.poll() == 1
+    assert consumer.stats()['dead_lettered'] == 1
+    [dead_letter] = consumer.dead_letters()
+    assert dead_letter['transaction_id'] == poison.transaction_id
+    assert dead_letter['attempts'] == 3
+    assert 'handler failed' in dead_letter['last_error']
+
+    # Records behind it are no longer held up
+    deposit(account.account_id, 100)
+    assert drain(consumer) == 1
+    assert deposits_applied(account.account_id) == 1
+
+    monkeypatch.setattr(consumer, 'handle', handle)
+    assert consumer.requeue_dead_letters() == 1
+    assert consumer.dead_letters() == []
+    assert drain(consumer) == 1
+    assert deposits_applied(account.account_id) == 2
@@ -0,0 +1,34 @@
+import uuid
+
+import pytest
+
+from app.models import Account, InsufficientFundsError
+from app.services import DuplicateTransferError, transfer_funds
+
+
+def stored_balance(account_id):
+    Account.invalidate(account_id)
+    return Account.get_by_account_id(account_id).balance_cents
+
+
+def test_transfer_moves_funds_and_reports_balances(make_account):
+    sender, recipient = make_account(1000), make_account()
+    transfer_funds(sender, recipient, 400, idempotency_token=str(uuid.uuid4()))
+    assert (sender.balance_cents, recipient.balance_cents) == (600, 400)
+    assert (stored_balance(sender.account_id), stored_balance(recipient.account_id)) == (600, 400)
+
+
+def test_retried_transfer_is_rejected_and_moves_funds_once(make_account):
+    sender, recipient = make_account(1000), make_account()
+    token = str(uuid.uuid4())
+    transfer_funds(sender, recipient, 300, idempotency_token=token)
+    with pytest.raises(DuplicateTransferError):
+        transfer_funds(sender, recipient, 300, idempotency_token=token)
+    assert (stored_balance(sender.account_id), stored_balance(recipient.account_id)) == (700, 300)
+
+
+def test_transfer_beyond_balance_moves_nothing(make_account):
+    sender, recipient = make_account(100), make_account()
+    with pytest.raises(InsufficientFundsError):
+        transfer_funds(sender, recipient, 101)
+    assert (stored_balance(sender.account_id), stored_balance(recipient.account_id)) == (100, 0)